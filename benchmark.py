@@ -0,0 +1,269 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+"""Benchmarks of the lexers and the walker on deterministic synthetic corpora
+
+    python benchmark.py [--output result.json] [--baseline baseline.json] [--tolerance 0.2] [--scale 1]
+
+The results are reported as lines/sec and files/sec in JSON,
+and the exit code is 1 if any rate regresses from the baseline beyond the tolerance.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import config
+from code_count import count, count_file, count_text
+from dynamic_object import DynamicObject
+from result import get_data
+from walk import walk, WalkHandler
+
+# Syntax to generate each language
+SYNTAX_LIST = [
+    DynamicObject(name='python', ext='.py', lexer_list=config.PYTHON_LEXER_LIST,
+                  line_comment='#', block_comment=('"' * 3, '"' * 3), quote='"', indent='    '),
+    DynamicObject(name='java', ext='.java', lexer_list=config.C_LIKE_LEXER_LIST,
+                  line_comment='//', block_comment=('/*', '*/'), quote='"', indent='    '),
+    DynamicObject(name='lua', ext='.lua', lexer_list=config.LUA_LEXER_LIST,
+                  line_comment='--', block_comment=('--[[', ']]'), quote='"', indent='  '),
+    DynamicObject(name='markdown', ext='.md', lexer_list=config.TEXT_LEXER_LIST),
+]
+
+CORPUS_LIST = ['long', 'nested', 'comments', 'strings']
+
+_WORDS = ['alpha', 'beta', 'gamma', 'delta', 'count', 'value', 'index', 'item', 'name', 'data']
+
+
+def _code_line(rnd, syntax, depth=0):
+    words = [rnd.choice(_WORDS) for _ in range(rnd.randint(1, 4))]
+    return '%s%s = %s(%s, %s%s%s)' % (syntax.indent * depth, words[0], rnd.choice(_WORDS), ', '.join(words),
+                                      syntax.quote, rnd.choice(_WORDS), syntax.quote)
+
+
+def _comment_lines(rnd, syntax, depth=0):
+    indent = syntax.indent * depth
+    if rnd.random() < 0.5:
+        return ['%s%s %s' % (indent, syntax.line_comment, ' '.join(rnd.sample(_WORDS, 3)))]
+
+    start, end = syntax.block_comment
+    lines = ['%s%s %s' % (indent, start, rnd.choice(_WORDS))]
+    lines.extend(('%s%s' % (indent, ' '.join(rnd.sample(_WORDS, 4))) if rnd.random() < 0.8 else ''
+                  for _ in range(rnd.randint(1, 6))))
+    lines.append('%s%s' % (indent, end))
+    return lines
+
+
+def _text_lines(rnd, corpus, lines):
+    """Generate the lines of a plain text file"""
+
+    text_lines = list()
+    while len(text_lines) < lines:
+        if corpus == 'strings':
+            text_lines.append(' '.join((rnd.choice(_WORDS) for _ in range(2000))))
+        else:
+            text_lines.extend((' '.join(rnd.sample(_WORDS, 6)) for _ in range(rnd.randint(1, 5))))
+        text_lines.append('')
+    return text_lines[:lines]
+
+
+def generate_text(syntax, corpus, lines, seed=0):
+    """Generate a deterministic text of a corpus type in a language,
+    with at least the given lines, as a construct is never cut off
+    """
+
+    rnd = random.Random('%s/%s/%d' % (syntax.name, corpus, seed))
+    if not syntax.line_comment:
+        return '\n'.join(_text_lines(rnd, corpus, lines)) + '\n'
+
+    text_lines = list()
+    while len(text_lines) < lines:
+        if corpus == 'nested':
+            # Deep bracket nesting over multiple lines
+            depth = rnd.randint(5, 30)
+            text_lines.extend(('%s%s(' % (syntax.indent * i, rnd.choice(_WORDS)) for i in range(depth)))
+            text_lines.append(_code_line(rnd, syntax, depth))
+            text_lines.extend(('%s)' % (syntax.indent * i) for i in reversed(range(depth))))
+        elif corpus == 'comments':
+            text_lines.extend(_comment_lines(rnd, syntax))
+            if rnd.random() < 0.2:
+                text_lines.append(_code_line(rnd, syntax))
+        elif corpus == 'strings':
+            # Huge string literals with escapes
+            body = ''.join((rnd.choice(_WORDS) + (' \\%s ' % syntax.quote if rnd.random() < 0.1 else ' ')
+                            for _ in range(rnd.randint(500, 5000))))
+            text_lines.append('s = %s%s%s' % (syntax.quote, body, syntax.quote))
+        else:
+            roll = rnd.random()
+            if roll < 0.6:
+                text_lines.append(_code_line(rnd, syntax, rnd.randint(0, 3)))
+            elif roll < 0.8:
+                text_lines.extend(_comment_lines(rnd, syntax, rnd.randint(0, 3)))
+            else:
+                text_lines.append('')
+
+    return '\n'.join(text_lines) + '\n'
+
+
+def generate_corpus(root, scale=1):
+    """Generate a tree of corpora under the root:
+        <language>/<corpus>.<ext>: the long files of each corpus type
+        small/<language>/<n>/<m>.<ext>: many small files
+    return the number of files
+    """
+
+    files = 0
+    for syntax in SYNTAX_LIST:
+        os.makedirs(os.path.join(root, syntax.name))
+        for corpus in CORPUS_LIST:
+            lines = max(int((20000 if corpus != 'strings' else 200) * scale), 1)
+            _write(os.path.join(root, syntax.name, corpus + syntax.ext), generate_text(syntax, corpus, lines))
+            files += 1
+
+        for n in range(max(int(10 * scale), 1)):
+            small_dir = os.path.join(root, 'small', syntax.name, str(n))
+            os.makedirs(small_dir)
+            for m in range(50):
+                _write(os.path.join(small_dir, str(m) + syntax.ext), generate_text(syntax, 'long', 20, n * 50 + m))
+                files += 1
+
+    return files
+
+
+def _write(path, text):
+    with open(path, 'w') as file_out:
+        file_out.write(text)
+
+
+def _timeit(func, repeat):
+    """Run a function repeatedly, return the best seconds and the last result"""
+
+    best, result = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best, result
+
+
+def _record(seconds, lines=None, files=None):
+    record = {'seconds': seconds}
+    if lines is not None:
+        record['lines'] = lines
+        record['lines_per_sec'] = lines / seconds if seconds else 0.0
+    if files is not None:
+        record['files'] = files
+        record['files_per_sec'] = files / seconds if seconds else 0.0
+    return record
+
+
+def run_benchmarks(root, repeat=3, workers=None):
+    """Time count_text, count_file, walk and count over a generated corpus tree"""
+
+    results = dict()
+
+    # count_text by language and corpus type
+    for syntax in SYNTAX_LIST:
+        for corpus in CORPUS_LIST:
+            path = os.path.join(root, syntax.name, corpus + syntax.ext)
+            with open(path, 'r') as file_in:
+                text = file_in.read()
+            seconds, _ = _timeit(lambda: count_text(text, syntax.lexer_list), repeat)
+            results['count_text/%s/%s' % (syntax.name, corpus)] = _record(seconds, lines=text.count('\n'))
+
+    # count_file over the small files, including the file I/O
+    class _FileHandler(WalkHandler):
+        def handle_file(self, path, context):
+            context.files += 1
+            count_file(path, context.data)
+
+    small_root = os.path.join(root, 'small')
+    seconds, context = _timeit(lambda: _walk(small_root, _FileHandler()), repeat)
+    results['count_file/small'] = _record(seconds, files=context.files)
+
+    # walk only
+    class _WalkHandler(WalkHandler):
+        def handle_file(self, path, context):
+            context.files += 1
+
+    seconds, context = _timeit(lambda: _walk(root, _WalkHandler()), repeat)
+    results['walk/tree'] = _record(seconds, files=context.files)
+
+    # count the whole tree
+    seconds, data = _timeit(lambda: count(root, workers), repeat)
+    lines = get_data(get_data(data, config.TAG_ALL), config.LEX_TOTAL, 0)
+    results['count/tree'] = _record(seconds, lines=lines, files=context.files)
+
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'engine': config.ENGINE,
+        'results': results,
+    }
+
+
+def _walk(path, handler):
+    context = DynamicObject(files=0, data=DynamicObject())
+    walk(path, handler, context)
+    return context
+
+
+def compare(baseline, current, tolerance=0.2):
+    """Compare the rates with a baseline
+    return the regressions as (name, metric, baseline rate, current rate)
+    """
+
+    regressions = list()
+    for name, base_record in baseline['results'].items():
+        record = current['results'].get(name)
+        if not record:
+            continue
+        for metric in ('lines_per_sec', 'files_per_sec'):
+            if metric in base_record and metric in record and record[metric] < base_record[metric] * (1 - tolerance):
+                regressions.append((name, metric, base_record[metric], record[metric]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the lexers and the walker')
+    parser.add_argument('--output', help='write the results as JSON to the file')
+    parser.add_argument('--baseline', help='compare the results with a baseline JSON file')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed slowdown ratio, default 0.2')
+    parser.add_argument('--scale', type=float, default=1, help='corpus size scale, default 1')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per benchmark, the best is taken')
+    parser.add_argument('--workers', type=int, help='worker processes for count()')
+    args = parser.parse_args(argv)
+
+    root = tempfile.mkdtemp(prefix='code_count_bench_')
+    try:
+        generate_corpus(root, args.scale)
+        current = run_benchmarks(root, args.repeat, args.workers)
+    finally:
+        shutil.rmtree(root)
+
+    output = json.dumps(current, indent=2, sort_keys=True)
+    if args.output:
+        _write(args.output, output + '\n')
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline, 'r') as file_in:
+            baseline = json.load(file_in)
+        regressions = compare(baseline, current, args.tolerance)
+        for name, metric, base_rate, rate in regressions:
+            sys.stderr.write('[Regression] %s %s: %.1f -> %.1f\n' % (name, metric, base_rate, rate))
+        return 1 if regressions else 0
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,129 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+import hashlib
+import json
+import os
+import sqlite3
+
+import config
+from lexer import get_lexer_table
+from reader import default_encodings
+
+
+def rules_version():
+    """Digest of the rules which the cached counts depend on: the file handlers, their lexer tables,
+    and the sniffing and decoding of files
+    The ignore rules are left out, as the ignored files are never looked up.
+    """
+
+    handlers = [(f_handler.tag, f_handler.path, get_lexer_table(f_handler.lexer_list).version)
+                for f_handler in config.FILE_HANDLER_LIST]
+    rules = (handlers, default_encodings(), config.SNIFF_SIZE)
+    return hashlib.md5(repr(rules).encode('utf-8')).hexdigest()
+
+
+def file_hash(path):
+    """Digest of the file content"""
+
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as file_in:
+        for block in iter(lambda: file_in.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ResultCache(object):
+    """Persistent cache of the line counts of each file
+
+    An entry is valid while the size and mtime_ns of the file are unchanged,
+    or, with 'use_hash', while its content hash is unchanged.
+    All entries are dropped when the rules which the counts depend on change, see rules_version().
+    """
+
+    def __init__(self, path=None, use_hash=None):
+        self.path = path if path else config.CACHE_PATH
+        self.use_hash = config.CACHE_HASH if use_hash is None else use_hash
+        self.seen = set()
+
+        cache_dir = os.path.dirname(os.path.abspath(self.path))
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+        self.connection = sqlite3.connect(self.path)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS file (path TEXT PRIMARY KEY, size INTEGER, '
+                                'mtime_ns INTEGER, hash TEXT, tag TEXT, counts TEXT)')
+
+        # Invalidate all entries if the rules changed
+        version = rules_version()
+        row = self.connection.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        if not row or row[0] != version:
+            self.connection.execute('DELETE FROM file')
+            self.connection.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)", (version,))
+        self.connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def get(self, path):
+        """Look up a file
+        return the cached entry of (file tag, line counts) or None, and the stamp to put a new entry
+        """
+
+        key = os.path.abspath(path)
+        self.seen.add(key)
+
+        stat = os.stat(path)
+        stamp = [stat.st_size, stat.st_mtime_ns, None]
+
+        row = self.connection.execute('SELECT size, mtime_ns, hash, tag, counts FROM file WHERE path = ?',
+                                      (key,)).fetchone()
+        if not row or row[0] != stamp[0]:
+            return None, stamp
+
+        size, mtime_ns, content_hash, file_tag, counts = row
+        if mtime_ns != stamp[1]:
+            if not self.use_hash or not content_hash:
+                return None, stamp
+
+            # Revalidate the entry by the content hash
+            stamp[2] = file_hash(path)
+            if stamp[2] != content_hash:
+                return None, stamp
+            self.connection.execute('UPDATE file SET mtime_ns = ? WHERE path = ?', (stamp[1], key))
+
+        return (file_tag, [tuple(item) for item in json.loads(counts)]), stamp
+
+    def put(self, path, stamp, file_tag, line_counts):
+        """Save the entry of a file with the stamp returned by get()"""
+
+        size, mtime_ns, content_hash = stamp
+        if self.use_hash and not content_hash:
+            content_hash = file_hash(path)
+
+        self.connection.execute('INSERT OR REPLACE INTO file VALUES (?, ?, ?, ?, ?, ?)',
+                                (os.path.abspath(path), size, mtime_ns, content_hash, file_tag,
+                                 json.dumps(line_counts)))
+
+    def evict(self, root):
+        """Remove the entries under a root which were not looked up since the cache was opened,
+        i.e. the deleted or ignored files after a full walk of the root
+        """
+
+        root = os.path.abspath(root)
+        prefix = os.path.join(root, '')
+        rows = self.connection.execute('SELECT path FROM file WHERE path = ? OR substr(path, 1, ?) = ?',
+                                       (root, len(prefix), prefix)).fetchall()
+        stale = [(path,) for path, in rows if path not in self.seen]
+        self.connection.executemany('DELETE FROM file WHERE path = ?', stale)
+        self.connection.commit()
+
+        return len(stale)
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
@@ -0,0 +1,118 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+"""Command line of count()
+
+    python -m cli [path] [--workers 4] [--engine scan] [--cache [PATH]] [--include GLOB] [--exclude GLOB] ...
+
+The modules beside config are imported after parsing the arguments, and after applying them to config,
+so '--help' starts fast, and the log options take effect before the loggers are created.
+"""
+
+import argparse
+import fnmatch
+import logging
+import sys
+
+import config
+
+FORMAT_TEXT = 'text'
+FORMAT_JSON = 'json'
+
+
+def _glob_rule(glob):
+    """Convert a glob of paths to a rule of config.IGNORED_FILES, '*' matches across '/' too"""
+    return fnmatch.translate(glob.replace('\\', '/'))
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Count the code, comment and space lines of files')
+    parser.add_argument('path', nargs='?', default='.', help='file or directory to count, default .')
+    parser.add_argument('--workers', type=int, help='worker processes, default config.WORKERS')
+    parser.add_argument('--prefetch', type=int, help='threads reading files ahead in the serial mode')
+    parser.add_argument('--engine', choices=[config.ENGINE_SCAN, config.ENGINE_SLICE], help='text counting engine')
+    parser.add_argument('--cache', nargs='?', const=config.CACHE_PATH,
+                        help='result cache file, default config.CACHE_PATH if given without a path')
+    parser.add_argument('--cache-hash', action='store_true', help='revalidate cache entries by the content hash')
+    parser.add_argument('--include', action='append', metavar='GLOB',
+                        help='count only the file paths matching a glob, repeatable')
+    parser.add_argument('--exclude', action='append', metavar='GLOB',
+                        help='skip the file paths matching a glob instead of config.IGNORED_FILES, repeatable')
+    parser.add_argument('--exclude-dir', action='append', metavar='NAME',
+                        help='skip the folders of a name instead of config.IGNORED_FOLDERS, repeatable')
+    parser.add_argument('--format', choices=[FORMAT_TEXT, FORMAT_JSON], default=FORMAT_TEXT,
+                        help='format of the totals written to stdout, default text')
+    parser.add_argument('--files', metavar='PATH',
+                        help='export the record of each file, as CSV, JSONL or columnar by the extension')
+    parser.add_argument('--tree', metavar='PATH', help='write the data of each directory as JSON')
+    parser.add_argument('--depth', type=int, help='directory levels kept by --tree, default config.DIR_TREE_DEPTH')
+    parser.add_argument('--log-mode', choices=[config.LOG_MODE_PROGRESS, config.LOG_MODE_FILE, config.LOG_MODE_TRACE],
+                        help='progress logs the throughput in files/s and lines/s, default config.LOG_MODE')
+    parser.add_argument('--quiet', action='store_true', help='log warnings and errors only')
+    return parser
+
+
+def configure(args):
+    """Apply the arguments to config"""
+
+    if args.engine:
+        config.ENGINE = args.engine
+    if args.prefetch is not None:
+        config.PREFETCH_THREADS = args.prefetch
+    if args.cache_hash:
+        config.CACHE_HASH = True
+    if args.exclude is not None:
+        config.IGNORED_FILES = set((_glob_rule(glob) for glob in args.exclude))
+    if args.include:
+        # Ignore the paths matching none of the globs
+        config.IGNORED_FILES = set(config.IGNORED_FILES) | {
+            '(?!%s)' % '|'.join((_glob_rule(glob) for glob in args.include))}
+    if args.exclude_dir is not None:
+        config.IGNORED_FOLDERS = set(args.exclude_dir)
+    if args.log_mode:
+        config.LOG_MODE = args.log_mode
+    if args.quiet:
+        config.LOG_LEVEL = logging.WARNING
+
+
+def run(args):
+    from code_count import count
+    from dir_tree import DirTree
+    from export import data_dict, open_exporter, write_tree
+    from result import dump_data
+
+    cache = None
+    if args.cache:
+        from cache import ResultCache
+        cache = ResultCache(args.cache)
+
+    dir_tree = DirTree(args.depth) if args.tree else None
+    exporter = open_exporter(args.files) if args.files else None
+    try:
+        data = count(args.path, args.workers, cache, dir_tree=dir_tree, exporter=exporter)
+    finally:
+        if exporter:
+            exporter.close()
+        if cache:
+            cache.close()
+
+    if dir_tree:
+        with open(args.tree, 'w', encoding='utf-8') as file_out:
+            write_tree(dir_tree, file_out)
+
+    if args.format == FORMAT_JSON:
+        import json
+        sys.stdout.write(json.dumps(data_dict(data), indent=2) + '\n')
+    else:
+        sys.stdout.write(dump_data(data).lstrip('\n') + '\n')
+    return 0
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    configure(args)
+    return run(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
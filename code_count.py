@@ -1,248 +1,566 @@
+import logging
+import multiprocessing
 import os
-import re
-from functools import reduce
+from collections import namedtuple
+from time import perf_counter
 
 import config
+from dedup import ResultMemo
+from dispatch import get_dispatch
 from dynamic_object import DynamicObject
+from instrument import PHASE_COUNT, PHASE_READ, PHASE_WALK
+from lexer import get_lexer_table
 from log import get_logger
-from walk import walk, WalkHandler
+from prefetch import Prefetcher
+from progress import Progress
+from reader import check_size, count_line_buffer, count_lines, count_stream, CountError, decode, file_deadline, \
+    read_bytes, sniff, timeout_error
+from result import add_entry, add_file_data, dump_data, new_totals, to_data, to_result
+from scanner import count_text
+from walk import iter_walk, walk, WalkHandler
 
 logger = get_logger()
 
-"""
-Output structure:
+# Memo of the line counts of identical texts in this process
+_memo = None
 
-# path counter
+# Result of counting a file: the file tag is None if the file is skipped or failed,
+#   the digest is set if the text is hashed, and the error is the record of a failure
+FileEntry = namedtuple('FileEntry', ['file_tag', 'line_counts', 'digest', 'error'])
 
-    # file counter
 
-        # python
-        # java
-        # markdown
+def _get_memo():
+    """Get the memo of this process, or None if deduplication is disabled"""
 
-    # dir counter
+    global _memo
+    if not config.DEDUP:
+        return None
+    if _memo is None or _memo.hash_all != config.DEDUP_REPORT:
+        _memo = ResultMemo(hash_all=config.DEDUP_REPORT)
+    return _memo
 
-        # main
-        # test
 
-# content counter
+def count_path(path, profiler=None, data=None, pool=None):
+    """Count a file by its normalized path, or its bytes read ahead, the line counts of identical texts are memoized
+    return the matched file handler, the text context and the text digest if hashed, or None if the file is skipped
+    A streamed file is lexed by chunks across the processes of a pool if given, see count_stream().
+    """
+
+    # Find the file handler, before any I/O of ignored or unsupported files
+    f_handler = get_dispatch().handler(path)
+    if f_handler is None:
+        return None
+
+    # Read the bytes of the file once, unless it is large enough to stream, and skip binary files
+    lexer_list = profiler.table(f_handler.tag, f_handler.lexer_list) if profiler else f_handler.lexer_list
+    table = get_lexer_table(lexer_list)
+    size = os.path.getsize(path) if data is None else len(data)
+    check_size(path, size)
+    stream = data is None and config.STREAM_SIZE and size >= config.STREAM_SIZE
+    data = data if data is not None or stream else read_bytes(path, profiler=profiler)
+    encodings = sniff(read_bytes(path, config.SNIFF_SIZE) if stream else data[:config.SNIFF_SIZE])
+    if encodings is None:
+        logger.debug('Skip the binary file: %s', path)
+        return None
+
+    # count line numbers, by the bytes of lines if the lexer table only classifies lines,
+    #   or by the memory mapped file if it is large enough
+    start = perf_counter() if profiler else None
+    text_context, digest = None, None
+    problems = list()
+    if table.line_tags:
+        hash_content = config.DEDUP and config.DEDUP_REPORT
+        result = count_lines(path, table, hash_content) if stream else count_line_buffer(data, table, hash_content)
+        text_context, digest = result if result else (None, None)
+    elif stream:
+        try:
+            text_context = count_stream(path, lexer_list, file_deadline(), problems, pool)
+        except TimeoutError:
+            raise timeout_error(path)
+
+    if text_context is None:
+        data = data if data is not None else read_bytes(path, profiler=profiler)
+        read_start = perf_counter() if profiler else None
+        text = decode(path, data, encodings)
+        data = None
+        if profiler:
+            profiler.add_phase(PHASE_READ, perf_counter() - read_start)
+        start = perf_counter() if profiler else None
+
+        memo = _get_memo()
+        memo_key = memo.key(f_handler.tag, text) if memo else None
+        text_context = memo.get(memo_key) if memo_key else None
+        if text_context is None:
+            try:
+                text_context = count_text(text, lexer_list, deadline=file_deadline(), problems=problems)
+            except TimeoutError:
+                raise timeout_error(path)
+            if memo_key and not problems:
+                memo.put(memo_key, text_context)
+        digest = memo_key[-1] if memo_key else None
+    if profiler:
+        profiler.add_phase(PHASE_COUNT, perf_counter() - start)
+    if config.LOG_MODE != config.LOG_MODE_PROGRESS:
+        logger.info('%s -> %s', path, text_context.get(config.LEX_TOTAL, 0))
+
+    check_result(path, f_handler, text_context, problems)
+    return f_handler, text_context, digest
+
+
+class CountExit(SystemExit):
+    """Exit on a file in the exit error mode, with the error record of the file"""
+
+    def __init__(self, record):
+        SystemExit.__init__(self)
+        self.record = record
+
+
+class _WorkerExit(Exception):
+    """CountExit in a worker process, which carries the error record to exit in the parent process"""
+
+
+def check_result(path, f_handler, text_context, problems=()):
+    """Check the count result of a file, and the problems found by counting it as (error kind, message)
+    In the collect error mode, raise CountError of the first problem, or of the lexer flags left.
+    In the exit error mode, raise CountExit if any lexer flag is left.
+    """
+
+    left_tags = text_context.tags() - config.LEX_LIST
+    tag_message = 'Lexer tags left: %s' % ', '.join(sorted(left_tags))
+    if config.ERROR_MODE == config.ERROR_MODE_EXIT:
+        if left_tags:
+            count_result = dump_data(to_data(text_context), '\t')
+            logger.error('[Error] path={%s}, tag={%s}, data={%s}' % (path, f_handler.tag, count_result))
+            raise CountExit({'path': path, 'kind': config.ERROR_TAG, 'message': tag_message})
+        return
 
-    # line counter
+    problems = list(problems)
+    if left_tags:
+        problems.insert(0, (config.ERROR_TAG, tag_message))
+    if problems:
+        raise CountError(path, problems[0][0], '; '.join((message for _, message in problems)))
 
-        # code
-        # comment
-        # space line
-        # total
 
-"""
+def count_entry(path, cache=None, profiler=None, data=None, lookup=None, pool=None):
+    """Count a file by its normalized path, or its bytes read ahead, looking up the result cache first,
+    unless the result of the lookup is given
+    return the FileEntry of the file
+    """
 
+    stamp = None
+    if cache:
+        cached, stamp = lookup if lookup else cache.get(path)
+        if cached:
+            return FileEntry(cached[0], cached[1], None, None)
 
-def _key(tag):
     try:
-        return '_%s' % '_'.join((str(ord(c)) for c in tag))
-    except BaseException as e:
-        logger.exception(e)
+        result = count_path(path, profiler, data, pool)
+    except CountError as e:
+        logger.warning('[Error] %s', e)
+        return FileEntry(None, [], None, e.record)
+
+    if result:
+        f_handler, text_context, digest = result
+        entry = FileEntry(f_handler.tag, text_context.items(), digest, None)
+    else:
+        entry = FileEntry(None, [], None, None)
+
+    if cache:
+        cache.put(path, stamp, entry.file_tag, entry.line_counts)
+
+    return entry
+
+
+def count_file(file_path, data, cache=None):
+    """Count a file"""
+
+    path = file_path.replace('\\', '/')
+    entry = count_entry(path, cache)
+    if entry.file_tag:
+        add_file_data(data, path, entry.file_tag, entry.line_counts)
 
 
-def _tag(key):
+def _is_split(path):
+    """Check if a file is streamed and large enough to be lexed by chunks across the worker processes,
+    see config.SPLIT_SIZE
+    """
+
+    f_handler = get_dispatch().handler(path) if config.SPLIT_SIZE and config.STREAM_SIZE else None
+    if f_handler is None or get_lexer_table(f_handler.lexer_list).line_tags:
+        return False
     try:
-        return ''.join((chr(int(k)) for k in key[1:].split('_')))
-    except BaseException as e:
-        logger.exception(e)
+        size = os.path.getsize(path)
+    except OSError:
+        return False
+    return size >= config.SPLIT_SIZE and size >= config.STREAM_SIZE
+
 
+def _settings():
+    """Get the settings of config, to reapply them in the worker processes, see _init_worker()"""
 
-def add_data(data, tag, increment, remove_zero=False):
-    key = _key(tag)
-    data[key] = increment if data[key] is None else data[key] + increment
-    if remove_zero and data[key] == 0:
-        data[key] = None
+    return {name: value for name, value in vars(config).items() if name.isupper()}
 
 
-def remove_data(data, tag):
-    key = _key(tag)
-    data[key] = None
+def _init_worker(settings):
+    """Apply the settings of the parent process to config in a worker process,
+    as a spawned worker imports config afresh without the overrides, e.g. of cli
+    """
 
+    vars(config).update(settings)
+    logger.setLevel(config.LOG_LEVEL)
 
-def get_data(data, tag, default_value=None):
-    value = data[_key(tag)]
-    return value if value else default_value
 
+def _count_files(path_list):
+    """Count a batch of files in a worker process
+    return the FileEntry of each file, or None for a file to lex by chunks, see _is_split()
+    """
 
-def update_data(data, tag, default_value=None):
-    key = _key(tag)
-    if key in data:
-        return data[key]
-    else:
-        data[key] = default_value
-        return default_value
+    entries = list()
+    for path in path_list:
+        try:
+            entries.append(None if _is_split(path) else count_entry(path))
+        except CountExit as e:
+            # Exit in the parent process instead, see _count_entries()
+            raise _WorkerExit(e.record)
 
+    return entries
 
-def dump_data(data, indent=''):
-    return '\n%s' % ('\n'.join(
-        ('%s%s: %s' % (indent, _tag(k), dump_data(v, indent + '\t') if isinstance(v, DynamicObject) else v) for k, v in
-         data.to_dict().items())))
 
+def _total_lines(line_counts):
+    return next((line_count for tag, line_count in line_counts if tag == config.LEX_TOTAL), 0)
 
-def match(text, lexer_list, context):
-    """Cut out first matched string by multiple lexers
-    return the match result and the remain text
+
+def _size_batches(indexes, sizes):
+    """Split the indexes of files into batches from the largest files,
+    of at most config.PARALLEL_BATCH_SIZE files, and config.PARALLEL_BATCH_BYTES unless a file is larger
     """
 
-    for lexer in lexer_list:
-        flags = lexer.flags if lexer.flags else 0
-        lexer_match = re.match(lexer.rule, text, flags)
-        if lexer_match:
-            # Get the counter tag
-            tag = lexer.tag
-            if lexer.condition:
-                condition_flag, condition_tag = lexer.condition
-                if get_data(context, condition_flag):
-                    tag = condition_tag
-
-            # Get the match result
-            match_result = lexer_match.group()
-            match_count = match_result.count('\n')
-
-            # Recognize space lines among a multi-line comment
-            if tag == config.LEX_COMMENT:
-                space_all = re.findall(r'(?<=\n)\s*?\n', match_result)
-                space_count = len(space_all) if space_all else 0
-                add_data(context, config.LEX_SPACE, space_count)
-                match_count -= space_count
-
-            # Check line ending
-            ending_match = re.match(r'\s*?\n', text[len(match_result):], re.S)
-            if ending_match:
-                ending_str = ending_match.group()
-                match_result += ending_str
-                match_count += ending_str.count('\n')
-
-                # Recognize a code line ending with a comment as a code line,
-                #   and clear the unfinished code line flag
-                if get_data(context, config.FLAG_CODE):
-                    add_data(context, config.LEX_CODE, 1)
-                    remove_data(context, config.FLAG_CODE)
-                    match_count -= 1
-
-            # Mark the unfinished code line
-            elif tag == config.LEX_CODE:
-                add_data(context, config.FLAG_CODE, 1)
-
-            # Update the counter value
-            add_data(context, tag, match_count)
-            logger.debug('[%s]: %s' % (tag, match_result))
-
-            # Update the stack status
-            if lexer.stack:
-                update_flag, update_count = lexer.stack
-                add_data(context, update_flag, update_count, True)
-
-            return match_result
-
-    return None
-
-
-def count_text(text, lexer_list):
-    """Count a string of text"""
-
-    # Append a '\n' at the end
-    text += '\n'
-
-    # Match lexer list
-    remain = text
-    match_result = True
-    context = DynamicObject()
-    while match_result and remain:
-        match_result = match(remain, lexer_list, context)
-        if match_result:
-            remain = remain[len(match_result):]
-
-    # Check remain text
-    if remain:
-        logger.debug('Remain: <<<%s>>>' % remain)
-
-    # Check text line count
-    local_line_count = reduce(lambda a, b: a + b, context.to_dict().values(), 0)
-    text_line_count = text.count('\n')
-    if local_line_count != text_line_count:
-        logger.debug('Text Line Count: %d, Matched Line Count: %d' % (text_line_count, local_line_count))
-
-    if not get_data(context, config.LEX_TOTAL):
-        add_data(context, config.LEX_TOTAL, text_line_count, False)
-
-    return context
-
-
-def count_file(file_path, data):
-    """Count a file"""
+    batches, batch, batch_bytes = list(), list(), 0
+    for index in sorted(indexes, key=lambda i: -sizes[i]):
+        if batch and (len(batch) >= config.PARALLEL_BATCH_SIZE or
+                      batch_bytes + sizes[index] > config.PARALLEL_BATCH_BYTES):
+            batches.append(batch)
+            batch, batch_bytes = list(), 0
+        batch.append(index)
+        batch_bytes += sizes[index]
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def _count_entries(path_list, workers, consume, cache=None, progress=None, sizes=None):
+    """Count files by a process pool, and pass the FileEntry of each file to consume(index, entry) in the list order,
+    as soon as the entries before are counted, so that only the entries counted ahead of the list order are held
+
+    The files are sent to workers in batches of the list order, or from the largest files if the sizes are given.
+    The files of config.SPLIT_SIZE are lexed after the others, each by chunks across all workers,
+    so the entries after such a file are held until the end.
+    """
 
-    # Filter the file path
-    path = file_path.replace('\\', '/')
-    for i_rule in config.IGNORED_FILES:
-        if re.match(i_rule, path):
-            return
-
-    # Read file content
-    file_in = open(path, 'r')
-    text = file_in.read()
-    file_in.close()
-
-    # Count the file text
-    for f_handler in config.FILE_HANDLER_LIST:
-        # Skip irrelevant files
-        if not re.match(f_handler.path, path.lower()):
-            continue
-
-        # count line numbers
-        text_context = count_text(text, f_handler.lexer_list)
-        logger.info('%s -> %s' % (path, get_data(text_context, config.LEX_TOTAL, 0)))
-
-        # Check count result
-        keys = set(map(_tag, text_context.to_dict().keys()))
-        if keys - config.LEX_LIST:
-            count_result = dump_data(text_context, '\t')
-            logger.error('[Error] path={%s}, tag={%s}, data={%s}' % (path, f_handler.tag, count_result))
-            exit()
+    # Look up the cache in this process, and only send the missed files to workers
+    entries = dict()
+    stamps = dict()
+    pending = list()
+    for index, path in enumerate(path_list):
+        cached = None
+        if cache:
+            cached, stamps[index] = cache.get(path)
+        if cached:
+            entries[index] = FileEntry(cached[0], cached[1], None, None)
+        else:
+            pending.append(index)
+
+    consumed = 0
+
+    def add(index, entry):
+        nonlocal consumed
+        entries[index] = entry
+        if cache and not entry.error:
+            cache.put(path_list[index], stamps.pop(index), entry.file_tag, entry.line_counts)
+        if progress:
+            progress.update(path_list[index], _total_lines(entry.line_counts))
+        while consumed in entries:
+            consume(consumed, entries.pop(consumed))
+            consumed += 1
+
+    split = list()
+    batches = _size_batches(pending, sizes) if sizes else \
+        [pending[i:i + config.PARALLEL_BATCH_SIZE] for i in range(0, len(pending), config.PARALLEL_BATCH_SIZE)]
+    with multiprocessing.Pool(workers, _init_worker, (_settings(),)) as pool:
+        path_batches = ([path_list[index] for index in batch] for batch in batches)
+        try:
+            for batch, batch_entries in zip(batches, pool.imap(_count_files, path_batches)):
+                for index, entry in zip(batch, batch_entries):
+                    if entry:
+                        add(index, entry)
+                    else:
+                        split.append(index)
+        except _WorkerExit as e:
+            raise CountExit(e.args[0])
+
+        for index in split:
+            add(index, count_entry(path_list[index], pool=pool))
+
+    # Pass the cached entries after the last counted one
+    while consumed < len(path_list):
+        consume(consumed, entries.pop(consumed))
+        consumed += 1
+
+
+def _count_parallel(path_list, totals, workers, cache=None, progress=None, digests=None, dir_tree=None,
+                    dir_events=None, exporter=None):
+    """Count files by a process pool, and merge the entries in the walk order while counting,
+    also passing them to an exporter
+
+    The walk is replayed to a DirTree by 'dir_events', as the file indexes and the (method, directory path)
+    of entering and leaving the directories.
+    """
 
-        """ Add up text data to file data, all data,
-            and optionally the test data.
-        """
-        tag_list = [f_handler.tag, config.TAG_ALL]
-        if re.match(r'.*?/test/', path):
-            tag_list.append(config.TAG_TEST)
+    events = iter(dir_events) if dir_tree else None
 
-        data_list = [update_data(data, tag, DynamicObject()) for tag in tag_list]
-        for key, line_count in text_context.to_dict().items():
-            [add_data(_data, _tag(key), line_count) for _data in data_list]
+    def consume(index, entry):
+        # Replay the directory events before the file, up to its index
+        for event in events if events else ():
+            if not isinstance(event, tuple):
+                break
+            event[0](event[1])
+        add_entry(totals, path_list[index], entry, digests, dir_tree)
+        if exporter:
+            exporter.add(path_list[index], entry)
+
+    _count_entries(path_list, workers, consume, cache, progress)
+    for event in events if events else ():
+        event[0](event[1])
+
+
+class IgnoredFolderHandler(WalkHandler):
+    """Walk handler skipping the folders in config.IGNORED_FOLDERS, the context needs a 'short_circuit' flag"""
+
+    def handle_dir_pre(self, dir_path, context):
+        context.short_circuit = os.path.basename(dir_path) in config.IGNORED_FOLDERS
+
+    def check_short_circuit(self, _, context):
+        short_circuit = context.short_circuit
+        context.short_circuit = False
+        return short_circuit
+
+
+def count_files(path_list, workers=None, cache=None):
+    """Count a list of normalized file paths, as count() counts the files found by a walk"""
+
+    workers = workers if workers else config.WORKERS
+    dispatch = get_dispatch()
+    path_list = [path for path in path_list if dispatch.handler(path)]
+    digests = set() if config.DEDUP and config.DEDUP_REPORT else None
+    memo = _get_memo()
+    if memo:
+        memo.clear()
+
+    totals = new_totals()
+    if workers > 1 and path_list:
+        _count_parallel(path_list, totals, workers, cache, None, digests)
+    else:
+        for path in path_list:
+            add_entry(totals, path, count_entry(path, cache), digests)
+
+    return to_result(totals)
 
-        # Skip other file handlers
-        return
 
+def _prefetch_size(path):
+    """Get the size of a file to read ahead, or None if it is streamed, exceeds the limit or fails to stat"""
 
-def count(path):
-    """Count a path"""
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return None
+    if config.STREAM_SIZE and size >= config.STREAM_SIZE:
+        return None
+    return None if config.FILE_SIZE_LIMIT and size > config.FILE_SIZE_LIMIT else size
+
+
+def count(path, workers=None, cache=None, profiler=None, dir_tree=None, exporter=None):
+    """Count a path
+
+    Files are counted by a pool of worker processes if 'workers' is greater than 1,
+    which results in the same data as the serial mode.
+    Unchanged files are not counted again if a ResultCache is given,
+    and the entries of files no longer found under the path are evicted from it.
+    A Profiler records the time of each phase, lexer rule and file, in the serial mode only.
+    The throughput is logged periodically in the progress log mode.
+    With config.DEDUP_REPORT, the files whose texts were seen before in the walk order are added up to
+    the TAG_DUPLICATE data too, except the files found in the result cache, which are not read.
+    Binary files are skipped, and the files which fail to decode, exceed the limits of config.FILE_TIMEOUT and
+    config.FILE_SIZE_LIMIT, or count inconsistently in the collect error mode, are recorded in a list under TAG_ERROR.
+    A DirTree is filled with the data of each directory in the same walk,
+    and an exporter is given the entry of each file in the walk order while counting, see export.py.
+    In the parallel mode, the entries are merged as the workers return them, holding only the entries counted
+    ahead of the walk order, see _count_entries().
+    With config.PREFETCH_THREADS, the serial mode walks and reads the files ahead in threads while lexing,
+    see Prefetcher, except with a Profiler.
+    """
 
-    class _Handler(WalkHandler):
+    workers = workers if workers else config.WORKERS
+    parallel = workers > 1 and not profiler
+    pipelined = not parallel and not profiler and config.PREFETCH_THREADS > 0
+    progress = Progress() if config.LOG_MODE == config.LOG_MODE_PROGRESS else None
+    dispatch = get_dispatch()
+    digests = set() if config.DEDUP and config.DEDUP_REPORT else None
+    memo = _get_memo()
+    if memo:
+        memo.clear()
+
+    def count_one(path, data=None, lookup=None):
+        start = perf_counter() if profiler else None
+        entry = count_entry(path, cache, profiler, data, lookup)
+        if profiler:
+            profiler.add_file(path, perf_counter() - start)
+        add_entry(walk_context.totals, path, entry, digests, dir_tree)
+        if exporter:
+            exporter.add(path, entry)
+        if progress:
+            progress.update(path, _total_lines(entry.line_counts))
+
+    class _Handler(IgnoredFolderHandler):
         def handle_file(self, file_path, context):
-            count_file(file_path, context.data)
+            path = file_path.replace('\\', '/')
+            if dispatch.handler(path) is None:
+                return
+            if parallel:
+                context.path_list.append(path)
+                if dir_tree:
+                    context.dir_events.append(len(context.path_list) - 1)
+            elif pipelined:
+                # Stat the file in the producer thread, and read it ahead unless it is streamed or too large
+                size = _prefetch_size(path)
+                context.put([path, None], None if size is None else path, size if size else 0)
+            else:
+                count_one(path)
 
         def handle_dir_pre(self, dir_path, context):
-            context.short_circuit = os.path.basename(dir_path) in config.IGNORED_FOLDERS
-
-        def check_short_circuit(self, _, context):
-            short_circuit = context.short_circuit
-            context.short_circuit = False
-            return short_circuit
+            IgnoredFolderHandler.handle_dir_pre(self, dir_path, context)
+            if dir_tree and not context.short_circuit:
+                self._dir_event(dir_tree.enter, dir_path, context)
+
+        def handle_dir_post(self, dir_path, context):
+            if dir_tree:
+                self._dir_event(dir_tree.leave, dir_path, context)
+
+        @staticmethod
+        def _dir_event(method, dir_path, context):
+            # Replay the directory events after counting the files in the parallel mode,
+            #   or in the walk order in the pipelined mode
+            if parallel:
+                context.dir_events.append((method, dir_path))
+            elif pipelined:
+                context.put((method, dir_path))
+            else:
+                method(dir_path)
 
     walk_context = DynamicObject()
-    walk_context.data = DynamicObject()
+    walk_context.totals = new_totals()
+    walk_context.path_list = list()
+    walk_context.dir_events = list()
     walk_context.short_circuit = False
 
-    all_data = DynamicObject()
-    update_data(all_data, config.LEX_TOTAL, 0)
-    update_data(walk_context.data, config.TAG_ALL, all_data)
+    start = perf_counter() if profiler else None
+    file_seconds = profiler.file_seconds if profiler else None
+    if pipelined:
+        def produce(put):
+            walk_context.put = put
+            walk(path, _Handler(), context=walk_context)
+
+        def prepare(item):
+            # Look up the cache before reading ahead, in this thread which owns the cache connection
+            if cache:
+                item[1] = cache.get(item[0])
+            return not (item[1] and item[1][0])
+
+        for item, data in Prefetcher(produce, prepare):
+            if isinstance(item, tuple):
+                item[0](item[1])
+            else:
+                count_one(item[0], data, item[1])
+    else:
+        walk(path, _Handler(), context=walk_context)
+    if profiler:
+        # Take the time out of counting files as the walk time
+        file_seconds = profiler.file_seconds - file_seconds
+        profiler.add_phase(PHASE_WALK, perf_counter() - start - file_seconds)
+    if parallel and walk_context.path_list:
+        _count_parallel(walk_context.path_list, walk_context.totals, workers, cache, progress, digests, dir_tree,
+                        walk_context.dir_events, exporter)
+    if cache:
+        cache.evict(path)
+    if progress:
+        progress.finish()
+
+    data = to_result(walk_context.totals)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(dump_data(data))
+
+    return data
+
+
+def _file_size(path, entry):
+    try:
+        return entry.stat().st_size if entry else os.path.getsize(path)
+    except OSError:
+        return 0
+
 
-    walk(path, _Handler(), context=walk_context)
-    logger.debug(dump_data(walk_context.data))
+def count_batch(roots, workers=None, cache=None):
+    """Count many paths at once
+    return the data of each path as count() returns, and the data of all paths added up
 
-    return walk_context.data
+    The files of all paths are counted by one pool of worker processes if 'workers' is greater than 1,
+    scheduled from the largest files so that no huge file is left to the end, see _size_batches().
+    The lexer tables and the memo of identical texts in each process are shared by all paths.
+    The TAG_DUPLICATE data of a path only adds up the files seen before in the same path,
+    and the TAG_DUPLICATE data of all paths adds up the files seen before in any path, e.g. in another checkout.
+    """
+
+    workers = workers if workers else config.WORKERS
+    progress = Progress() if config.LOG_MODE == config.LOG_MODE_PROGRESS else None
+    dispatch = get_dispatch()
+    memo = _get_memo()
+    if memo:
+        memo.clear()
+
+    # Walk all paths first, and keep the range of files of each path
+    path_list, sizes, ranges = list(), list(), list()
+    for root in roots:
+        start = len(path_list)
+        for file_path, entry in iter_walk(root, IgnoredFolderHandler(), DynamicObject(short_circuit=False)):
+            path = file_path.replace('\\', '/')
+            if dispatch.handler(path):
+                path_list.append(path)
+                sizes.append(_file_size(path, entry))
+        ranges.append((start, len(path_list)))
+
+    if workers > 1 and path_list:
+        entries = [None] * len(path_list)
+        _count_entries(path_list, workers, entries.__setitem__, cache, progress, sizes)
+    else:
+        entries = list()
+        for path in path_list:
+            entries.append(count_entry(path, cache))
+            if progress:
+                progress.update(path, _total_lines(entries[-1].line_counts))
+
+    results = list()
+    # The files seen before are tracked in each path, and across all paths for the data of all paths
+    all_totals = new_totals()
+    all_digests = set() if config.DEDUP and config.DEDUP_REPORT else None
+    for root, (start, end) in zip(roots, ranges):
+        totals = new_totals()
+        digests = set() if all_digests is not None else None
+        for index in range(start, end):
+            add_entry(totals, path_list[index], entries[index], digests)
+            add_entry(all_totals, path_list[index], entries[index], all_digests)
+        results.append(to_result(totals))
+        if cache:
+            cache.evict(root)
+    if progress:
+        progress.finish()
+
+    return results, to_result(all_totals)
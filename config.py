@@ -8,12 +8,108 @@ LOG_LEVEL = logging.INFO
 
 LOG_FORMAT = '%(message)s'
 
+# Log modes:
+#   progress: log the throughput at most once per PROGRESS_INTERVAL seconds
+#   file: log the total lines of each counted file
+#   trace: log each counted file, and each matched token at the DEBUG level
+LOG_MODE_PROGRESS = 'progress'
+LOG_MODE_FILE = 'file'
+LOG_MODE_TRACE = 'trace'
+LOG_MODE = LOG_MODE_PROGRESS
+PROGRESS_INTERVAL = 1.0
+
 OUTPUT = path.join(path.dirname(__file__), 'out')
 
 IGNORED_FOLDERS = {'.git', '.gitee', '.idea', '.vscode', '.svn', 'bin', 'out', 'target', 'trace'}
 
 IGNORED_FILES = {r'.*\.DS_Store'}
 
+# Text counting engines:
+#   scan: walk the text by position with compiled lexers
+#   slice: the reference engine which cuts the remain text after each token
+ENGINE_SCAN = 'scan'
+ENGINE_SLICE = 'slice'
+ENGINE = ENGINE_SCAN
+
+# Number of worker processes to count files, and the files per batch sent to a worker,
+#   and the bytes per batch when the batches are balanced by the file sizes
+WORKERS = 1
+PARALLEL_BATCH_SIZE = 64
+PARALLEL_BATCH_BYTES = 1 << 22
+
+# Pipelined counting in one process, by this number of threads reading files ahead, set to 0 to read in turn,
+#   with at most the bytes and the files read or queued ahead
+PREFETCH_THREADS = 0
+PREFETCH_BYTES = 1 << 26
+PREFETCH_FILES = 1024
+
+# Files from this size are counted by memory mapping, keeping at most the tail size in memory,
+#   the files which are not plain UTF-8 are transcoded to a temporary file to map first,
+#   and the files which lexer rules of non-ASCII characters can't count as bytes are recorded as errors of ERROR_SIZE,
+#   set to 0 to always read whole files
+STREAM_SIZE = 1 << 24
+STREAM_TAIL_SIZE = 1 << 16
+
+# Files from this size which are streamed are lexed by chunks of about SPLIT_CHUNK_SIZE bytes
+#   across the worker processes in the parallel mode, set to 0 to lex each file in one worker
+SPLIT_SIZE = 1 << 26
+SPLIT_CHUNK_SIZE = 1 << 22
+
+# Persistent result cache, and whether to revalidate entries by the content hash when mtime changes
+CACHE_PATH = path.join(OUTPUT, 'cache.sqlite3')
+CACHE_HASH = False
+
+# Memoize the line counts of identical file texts within a run, by a bounded LRU of DEDUP_SIZE entries,
+#   and optionally add up the duplicate files to the TAG_DUPLICATE data
+DEDUP = True
+DEDUP_SIZE = 4096
+DEDUP_REPORT = False
+
+# Bytes sniffed at the head of a file, which is skipped as a binary file if there is a NUL byte but no BOM
+SNIFF_SIZE = 8192
+
+# Encodings tried in order to decode a file without a BOM, 'locale' is the preferred encoding of the locale,
+#   a file which fails to decode is recorded as an error of ERROR_DECODE
+ENCODING_LOCALE = 'locale'
+ENCODINGS = [ENCODING_LOCALE, 'utf-8', 'cp1252']
+ERROR_DECODE = 'decode'
+
+# Handling of the files whose counts are inconsistent: lexer tags left, text left unmatched,
+#   or line counts disagreeing with the lines of the text
+#   collect: record an error of the file, see ERROR_DECODE, and continue counting the other files
+#   exit: exit on the lexer tags left, and only log the others
+ERROR_MODE_COLLECT = 'collect'
+ERROR_MODE_EXIT = 'exit'
+ERROR_MODE = ERROR_MODE_COLLECT
+ERROR_TAG = 'tag'
+ERROR_REMAIN = 'remain'
+ERROR_LINES = 'lines'
+
+# Limits of a file, recorded as errors of ERROR_TIMEOUT and ERROR_SIZE, 0 for no limit by default:
+#   the seconds to lex a file, checked between tokens, and the bytes of a file,
+#   a file over a limit is left out of the totals, so the timeout should allow for the largest valid files
+FILE_TIMEOUT = 0
+FILE_SIZE_LIMIT = 0
+ERROR_TIMEOUT = 'timeout'
+ERROR_SIZE = 'size'
+
+# Records of files held by the columnar exporter before writing them as a block
+EXPORT_BLOCK_ROWS = 1 << 16
+
+# Directory levels under the root kept by a DirTree, the deeper directories are added up to their ancestor,
+#   set to 0 for no limit
+DIR_TREE_DEPTH = 0
+
+# Rule guard: the characters of an adversarial text, which is also counted at 4 times of the size,
+#   and a rule is slow if its match time grows as size^GUARD_EXPONENT, from GUARD_MIN_SECONDS at the larger size
+GUARD_SIZE = 2000
+GUARD_EXPONENT = 1.5
+GUARD_MIN_SECONDS = 0.01
+
+# Watch mode: the seconds between checks of changes, and the local socket to serve the counts
+WATCH_INTERVAL = 1.0
+WATCH_SOCKET = path.join(OUTPUT, 'watch.sock')
+
 PYTHON_LEXER_LIST = []
 C_LIKE_LEXER_LIST = []
 LUA_LEXER_LIST = []
@@ -30,6 +126,8 @@ FILE_HANDLER_LIST = [
 
 TAG_ALL = 'All'
 TAG_TEST = 'Test'
+TAG_DUPLICATE = 'Duplicate'
+TAG_ERROR = 'Error'
 
 LEX_SPACE = 'Space'
 LEX_COMMENT = 'Comment'
@@ -47,22 +145,23 @@ PYTHON_LEXER_LIST.extend([
     DynamicObject(tag=LEX_SPACE, rule=r'\s*\n', flags=re.S),
 
     # Brackets in: () / [] / {}
-    DynamicObject(tag=LEX_CODE, rule=r'\s*[\(\[\{][^\(\)\[\]\{\}]*?(?=["\'\(\)\[\]\{\}])', flags=re.S,
+    DynamicObject(tag=LEX_CODE, rule=r'\s*[\(\[\{][^"\'\(\)\[\]\{\}]*(?=["\'\(\)\[\]\{\}]|\Z)', flags=re.S,
                   stack=(FLAG_BRACKETS, 1)),
     # Brackets out: () / [] / {}
     DynamicObject(tag=LEX_CODE, rule=r'\s*[\)\]\}]', flags=re.S, stack=(FLAG_BRACKETS, -1)),
 
     # Multi-line comment which starts with '''
-    DynamicObject(tag=LEX_COMMENT, rule=r'\s*(?P<_1>("|\'){3}).*?(?P=_1)', flags=re.S,
+    DynamicObject(tag=LEX_COMMENT, rule=r'\s*(?P<_1>(?P<_2>"|\')(?P=_2){2}).*?(?:(?P=_1)|(?=\n?\Z))', flags=re.S,
                   condition=(FLAG_BRACKETS, LEX_CODE)),
     # Single-line comment
-    DynamicObject(tag=LEX_COMMENT, rule=r'\s*#.*?(?=\n)', flags=re.S),
+    DynamicObject(tag=LEX_COMMENT, rule=r'\s*#[^\n]*', flags=re.S),
 
     # String
-    DynamicObject(tag=LEX_CODE, rule=r'\s*(?P<_1>"|\')(|([^\\]|\\.)*?)(?P=_1)', flags=re.S),
+    DynamicObject(tag=LEX_CODE, rule=r'\s*(?:"[^"\\\n]*(?:(?:\\.|\n(?!\Z))[^"\\\n]*)*(?:"|(?=\n?\Z))|'
+                                     r'\'[^\'\\\n]*(?:(?:\\.|\n(?!\Z))[^\'\\\n]*)*(?:\'|(?=\n?\Z)))', flags=re.S),
 
     # Code line without strings, multi-line comments or brackets
-    DynamicObject(tag=LEX_CODE, rule=r'.*?(?=["\'\(\)\[\]\{\}\n])', flags=re.S),
+    DynamicObject(tag=LEX_CODE, rule=r'[^"\'\(\)\[\]\{\}\n]*', flags=re.S),
 ])
 
 C_LIKE_LEXER_LIST.extend([
@@ -70,20 +169,22 @@ C_LIKE_LEXER_LIST.extend([
     DynamicObject(tag=LEX_SPACE, rule=r'\s*\n', flags=re.S),
 
     # Brackets in: () / [] / {}
-    DynamicObject(tag=LEX_CODE, rule=r'\s*[\(\[\{][^\(\)\[\]\{\}]*?(?=["\'\(\)\[\]\{\}]|//|/\*)', flags=re.S),
+    DynamicObject(tag=LEX_CODE, rule=r'\s*[\(\[\{][^"\'\(\)\[\]\{\}/]*(?:/(?![/*])[^"\'\(\)\[\]\{\}/]*)*'
+                                     r'(?=["\'\(\)\[\]\{\}]|//|/\*|\Z)', flags=re.S),
     # Brackets out: () / [] / {}
     DynamicObject(tag=LEX_CODE, rule=r'\s*[\)\]\}]', flags=re.S),
 
     # Multi-line comment which starts with '''
-    DynamicObject(tag=LEX_COMMENT, rule=r'\s*/\*.*?\*/', flags=re.S),
+    DynamicObject(tag=LEX_COMMENT, rule=r'\s*/\*.*?(?:\*/|(?=\n?\Z))', flags=re.S),
     # Single-line comment
-    DynamicObject(tag=LEX_COMMENT, rule=r'\s*//.*?(?=\n)', flags=re.S),
+    DynamicObject(tag=LEX_COMMENT, rule=r'\s*//[^\n]*', flags=re.S),
 
     # String or character
-    DynamicObject(tag=LEX_CODE, rule=r'\s*(?P<_1>"|\')(|([^\\]|\\.)*?)(?P=_1)', flags=re.S),
+    DynamicObject(tag=LEX_CODE, rule=r'\s*(?:"[^"\\\n]*(?:(?:\\.|\n(?!\Z))[^"\\\n]*)*(?:"|(?=\n?\Z))|'
+                                     r'\'[^\'\\\n]*(?:(?:\\.|\n(?!\Z))[^\'\\\n]*)*(?:\'|(?=\n?\Z)))', flags=re.S),
 
     # Code line without strings, multi-line comments or brackets
-    DynamicObject(tag=LEX_CODE, rule=r'.*?(?=["\'\(\)\[\]\{\}\n]|//|/\*)', flags=re.S),
+    DynamicObject(tag=LEX_CODE, rule=r'[^"\'\(\)\[\]\{\}\n/]*(?:/(?![/*])[^"\'\(\)\[\]\{\}\n/]*)*', flags=re.S),
 ])
 
 LUA_LEXER_LIST.extend([
@@ -91,27 +192,28 @@ LUA_LEXER_LIST.extend([
     DynamicObject(tag=LEX_SPACE, rule=r'\s*\n', flags=re.S),
 
     # Multi-line comment which starts with '''
-    DynamicObject(tag=LEX_COMMENT, rule=r'\s*\-\-\[\[.*?\]\]', flags=re.S),
+    DynamicObject(tag=LEX_COMMENT, rule=r'\s*\-\-\[\[.*?(?:\]\]|(?=\n?\Z))', flags=re.S),
     # Single-line comment
-    DynamicObject(tag=LEX_COMMENT, rule=r'\s*\-\-.*?(?=\n)', flags=re.S),
+    DynamicObject(tag=LEX_COMMENT, rule=r'\s*\-\-[^\n]*', flags=re.S),
 
     # String or character
-    DynamicObject(tag=LEX_CODE, rule=r'\s*(?P<_1>"|\')(|([^\\]|\\.)*?)(?P=_1)', flags=re.S),
+    DynamicObject(tag=LEX_CODE, rule=r'\s*(?:"[^"\\\n]*(?:(?:\\.|\n(?!\Z))[^"\\\n]*)*(?:"|(?=\n?\Z))|'
+                                     r'\'[^\'\\\n]*(?:(?:\\.|\n(?!\Z))[^\'\\\n]*)*(?:\'|(?=\n?\Z)))', flags=re.S),
     # Multi-line string
-    DynamicObject(tag=LEX_CODE, rule=r'\s*\[\[(|([^\\]|\\.)*?)\]\]', flags=re.S),
+    DynamicObject(tag=LEX_CODE, rule=r'\s*\[\[.*?(?:\]\]|(?=\n?\Z))', flags=re.S),
 
     # Brackets in: () / [] / {}
-    DynamicObject(tag=LEX_CODE, rule=r'\s*[\(\[\{][^\(\)\[\]\{\}]*?(?=["\'\(\)\[\]\{\}])', flags=re.S),
+    DynamicObject(tag=LEX_CODE, rule=r'\s*[\(\[\{][^"\'\(\)\[\]\{\}]*(?=["\'\(\)\[\]\{\}]|\Z)', flags=re.S),
     # Brackets out: () / [] / {}
     DynamicObject(tag=LEX_CODE, rule=r'\s*[\)\]\}]', flags=re.S),
 
     # Code line without strings, multi-line comments or brackets
-    DynamicObject(tag=LEX_CODE, rule=r'.*?(?=["\'\(\)\[\]\{\}\n])', flags=re.S),
+    DynamicObject(tag=LEX_CODE, rule=r'[^"\'\(\)\[\]\{\}\n]*', flags=re.S),
 ])
 
 TEXT_LEXER_LIST.extend([
     # Space line
     DynamicObject(tag=LEX_SPACE, rule=r'\s*(?=\n)', flags=re.U),
     # Any other line
-    DynamicObject(tag=LEX_TEXT, rule=r'\s*[^\s]+[^\n]*(?=\n)', flags=re.U),
+    DynamicObject(tag=LEX_TEXT, rule=r'[^\S\n]*\S[^\n]*(?=\n)', flags=re.U),
 ])
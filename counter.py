@@ -0,0 +1,88 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+import config
+
+# Tags indexed by ID, the lexer tags and the lexer flags come first
+TAG_LIST = [config.LEX_CODE, config.LEX_COMMENT, config.LEX_SPACE, config.LEX_TEXT, config.LEX_TOTAL,
+            config.FLAG_BRACKETS, config.FLAG_CODE]
+_tag_ids = dict(((tag, index) for index, tag in enumerate(TAG_LIST)))
+
+CODE = _tag_ids[config.LEX_CODE]
+COMMENT = _tag_ids[config.LEX_COMMENT]
+SPACE = _tag_ids[config.LEX_SPACE]
+TOTAL = _tag_ids[config.LEX_TOTAL]
+FLAG_CODE = _tag_ids[config.FLAG_CODE]
+
+
+def tag_id(tag):
+    """Get the ID of a tag, an unknown tag is registered with a new ID"""
+
+    index = _tag_ids.get(tag)
+    if index is None:
+        index = _tag_ids[tag] = len(TAG_LIST)
+        TAG_LIST.append(tag)
+    return index
+
+
+def _unsupported(self, *_):
+    raise TypeError('Unsupported operation of %s' % type(self).__name__)
+
+
+class LineCounter(list):
+    """Line counts indexed by tag ID
+
+    A value is None until the tag is counted, as an absent attribute of a DynamicObject.
+    The length depends on the tags registered when the counter is created and counted,
+    so counters are compared by their counted tags, and the list operators which change the length are unsupported.
+    """
+
+    __slots__ = ()
+
+    def __init__(self, line_counts=None):
+        list.__init__(self, [None] * len(TAG_LIST))
+        if line_counts:
+            self.add_all(line_counts)
+
+    def __eq__(self, other):
+        if not isinstance(other, LineCounter):
+            return NotImplemented
+        return self.items() == other.items()
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    def __reduce__(self):
+        # Pickle by the tags, as another process may register the tags with other IDs
+        return LineCounter, (self.items(),)
+
+    __hash__ = None
+    __add__ = __radd__ = __iadd__ = __mul__ = __rmul__ = __imul__ = _unsupported
+    append = extend = insert = pop = remove = _unsupported
+
+    def get(self, tag, default_value=None):
+        """Get the line count of a tag, without registering an unknown tag"""
+
+        index = _tag_ids.get(tag)
+        value = self[index] if index is not None and index < len(self) else None
+        return value if value else default_value
+
+    def add(self, index, increment, remove_zero=False):
+        if index >= len(self):
+            list.extend(self, [None] * (index + 1 - len(self)))
+        value = self[index]
+        value = increment if value is None else value + increment
+        self[index] = None if remove_zero and value == 0 else value
+
+    def add_all(self, line_counts):
+        """Add up the (tag, line count) pairs"""
+        for tag, line_count in line_counts:
+            self.add(tag_id(tag), line_count)
+
+    def items(self):
+        """Get the (tag, line count) pairs of the counted tags"""
+        return [(TAG_LIST[index], value) for index, value in enumerate(self) if value is not None]
+
+    def tags(self):
+        return set((TAG_LIST[index] for index, value in enumerate(self) if value is not None))
@@ -0,0 +1,60 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+import hashlib
+from collections import OrderedDict
+
+import config
+
+
+def new_digest():
+    return hashlib.blake2b(digest_size=16)
+
+
+def text_digest(text):
+    """Digest of a file text"""
+
+    digest = new_digest()
+    digest.update(text.encode('utf-8', 'surrogatepass'))
+    return digest.hexdigest()
+
+
+class ResultMemo(object):
+    """Bounded LRU memo of the line counts of file texts, keyed by the file tag, the text size and the digest
+
+    Unless 'hash_all', a text is hashed only if another text of the same file tag and size was seen,
+    so the files of unique sizes are not hashed, and the first copy of a text is not memoized.
+    """
+
+    def __init__(self, size=None, hash_all=False):
+        self.size = config.DEDUP_SIZE if size is None else size
+        self.hash_all = hash_all
+        self.hits = 0
+        self._sizes = set()
+        self._results = OrderedDict()
+
+    def key(self, file_tag, text):
+        """Get the key of a text, or None if no other text of the same size was seen"""
+
+        size_key = (file_tag, len(text))
+        if not self.hash_all and size_key not in self._sizes:
+            self._sizes.add(size_key)
+            return None
+        return size_key + (text_digest(text),)
+
+    def get(self, key):
+        result = self._results.get(key)
+        if result is not None:
+            self._results.move_to_end(key)
+            self.hits += 1
+        return result
+
+    def put(self, key, result):
+        self._results[key] = result
+        if len(self._results) > self.size:
+            self._results.popitem(last=False)
+
+    def clear(self):
+        self.hits = 0
+        self._sizes.clear()
+        self._results.clear()
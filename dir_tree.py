@@ -0,0 +1,97 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+import config
+from result import add_file, merge_totals, new_totals, to_result
+
+class _DirNode(object):
+    __slots__ = ('children', 'totals')
+
+    def __init__(self):
+        self.children = None
+        self.totals = dict()
+
+
+class DirTree(object):
+    """Line counts rolled up by directory in one walk, filled by count()
+
+    A node is pushed before walking a directory, the files are added up to the node on top,
+    and the node is merged into its parent after walking the directory, so each node holds its whole subtree.
+    The directories deeper than 'max_depth' levels under the root are added up to their ancestor at that depth,
+    and the directories without any counted file are dropped.
+    The files seen before in the walk order are added up to the TAG_DUPLICATE data of the directories.
+    """
+
+    def __init__(self, max_depth=None):
+        self.max_depth = config.DIR_TREE_DEPTH if max_depth is None else max_depth
+        self.root = None
+        self.root_path = None
+
+        # (directory path, node) of the directories being walked within the depth
+        self._stack = list()
+
+    def enter(self, dir_path):
+        if not self._stack:
+            self.root, self.root_path = _DirNode(), dir_path.rstrip('/')
+            self._stack.append((dir_path, self.root))
+        elif not self.max_depth or len(self._stack) <= self.max_depth:
+            self._stack.append((dir_path, _DirNode()))
+
+    def add(self, path, entry, duplicate=False):
+        if self._stack:
+            add_file(self._stack[-1][1].totals, path, entry, duplicate)
+
+    def leave(self, dir_path):
+        if not self._stack or self._stack[-1][0] != dir_path:
+            return
+
+        _, node = self._stack.pop()
+        if self._stack and node.totals:
+            parent = self._stack[-1][1]
+            merge_totals(parent.totals, node.totals)
+            if parent.children is None:
+                parent.children = dict()
+            parent.children[dir_path[dir_path.rfind('/') + 1:]] = node
+
+    def _find(self, path):
+        path = path.replace('\\', '/').rstrip('/')
+        if path.startswith(self.root_path + '/'):
+            path = path[len(self.root_path) + 1:]
+        elif path == self.root_path:
+            path = ''
+
+        node = self.root
+        for name in path.split('/') if path else ():
+            node = node.children.get(name) if node.children else None
+            if node is None:
+                break
+        return node
+
+    def totals(self, path=''):
+        """Get the line counters of each data tag of a directory, by its path or the path relative to the root,
+        or None if it is not found, or deeper than the max depth
+        """
+
+        node = self._find(path) if self.root else None
+        return node.totals if node else None
+
+    def data(self, path=''):
+        """Get the data of a directory as returned by count(), or None if it is not found"""
+
+        totals = self.totals(path)
+        if totals is None:
+            return None
+        result = new_totals()
+        merge_totals(result, totals)
+        return to_result(result)
+
+    def iter_dirs(self):
+        """Yield the path relative to the root and the totals of each directory, parents first"""
+
+        stack = [('', self.root)] if self.root else []
+        while stack:
+            path, node = stack.pop()
+            yield path, node.totals
+            if node.children:
+                stack.extend(((path + '/' + name if path else name, node.children[name])
+                              for name in sorted(node.children, reverse=True)))
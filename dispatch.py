@@ -0,0 +1,73 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+import re
+
+import config
+
+# Handler paths which only match a plain suffix, e.g. '.*\.py$' or '.*\.(h|c)$'
+_SUFFIX_PATH = re.compile(r'\.\*\\\.(?:([\w#+-]+)|\(([\w#+-]+(?:\|[\w#+-]+)*)\))\$')
+
+_dispatch = None
+
+
+def _suffixes(handler_path):
+    """Get the extensions matched by a handler path, or None if it is not a plain suffix pattern"""
+
+    suffix_match = _SUFFIX_PATH.fullmatch(handler_path)
+    if not suffix_match:
+        return None
+    return [suffix_match.group(1)] if suffix_match.group(1) else suffix_match.group(2).split('|')
+
+
+class FileDispatch(object):
+    """File handlers indexed by the extension, and the ignore rules compiled into one pattern
+
+    Handlers which are not plain suffix patterns are matched by their regular expressions,
+    and the first handler in the list order wins, as matching the handlers one by one.
+    """
+
+    def __init__(self, handler_list, ignored_files):
+        self.handler_list = handler_list
+        self.handlers = list(handler_list)
+        self.ignored_files = set(ignored_files)
+
+        self.ignore = re.compile('|'.join(('(?:%s)' % rule for rule in sorted(ignored_files)))) \
+            if ignored_files else None
+
+        self.extensions = dict()
+        self.fallback = list()
+        for index, f_handler in enumerate(handler_list):
+            suffixes = _suffixes(f_handler.path)
+            if suffixes is None:
+                self.fallback.append((index, f_handler, re.compile(f_handler.path)))
+                continue
+            for suffix in suffixes:
+                self.extensions.setdefault(suffix, (index, f_handler))
+
+    def handler(self, path):
+        """Get the file handler of a normalized path, or None if the file is ignored or unsupported"""
+
+        if self.ignore and self.ignore.match(path):
+            return None
+
+        lower_path = path.lower()
+        dot = lower_path.rfind('.')
+        index, f_handler = self.extensions.get(lower_path[dot + 1:], (None, None)) if dot >= 0 else (None, None)
+        for fallback_index, fallback_handler, pattern in self.fallback:
+            if index is not None and fallback_index > index:
+                break
+            if pattern.match(lower_path):
+                return fallback_handler
+
+        return f_handler
+
+
+def get_dispatch():
+    """Get the dispatch of the file handlers in config, which is rebuilt when they change"""
+
+    global _dispatch
+    if _dispatch is None or _dispatch.handler_list is not config.FILE_HANDLER_LIST or \
+            _dispatch.handlers != config.FILE_HANDLER_LIST or _dispatch.ignored_files != config.IGNORED_FILES:
+        _dispatch = FileDispatch(config.FILE_HANDLER_LIST, config.IGNORED_FILES)
+    return _dispatch
@@ -42,5 +42,11 @@ class DynamicObject(object):
     def __deepcopy__(self, memo):
         return DynamicObject(**self._attr_dict)
 
+    def __getstate__(self):
+        return self._attr_dict
+
+    def __setstate__(self, state):
+        object.__setattr__(self, '_attr_dict', state)
+
     def to_dict(self):
         return deepcopy(self._attr_dict)
@@ -0,0 +1,269 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+"""Exporters of the per-file records of count(), and of the aggregated tree of a DirTree
+
+An exporter is passed to count(), and writes the record of each counted file in the walk order while counting:
+    jsonl: a JSON object per line
+    csv: a header, and a row per file
+    columnar: blocks of config.EXPORT_BLOCK_ROWS records, each stored by columns and compressed,
+        with the paths front-coded against the previous path, see iter_columnar() to read it
+Only one block of records is held in memory, no matter how many files are counted.
+The records of the files which failed to count have the kind of the error, and no line counts.
+"""
+
+import csv
+import json
+import struct
+import sys
+import zlib
+from array import array
+
+import config
+from dynamic_object import DynamicObject
+from result import data_tag
+
+FORMAT_JSONL = 'jsonl'
+FORMAT_CSV = 'csv'
+FORMAT_COLUMNAR = 'col'
+
+LEX_COLUMNS = [config.LEX_CODE, config.LEX_COMMENT, config.LEX_SPACE, config.LEX_TEXT, config.LEX_TOTAL]
+COLUMNS = ['path', 'tag'] + LEX_COLUMNS + ['error']
+
+# Columnar format: the magic, the header of a block as (records, compressed bytes), and the end mark
+_MAGIC = b'CODECOUNT-COL1\n'
+_BLOCK = struct.Struct('<II')
+_END = _BLOCK.pack(0, 0)
+_LENGTHS = struct.Struct('<HI')
+
+
+def _record(path, entry):
+    """Get the record of a file entry as a list of the COLUMNS, or None if the file was skipped"""
+
+    if entry.error:
+        return [path, None] + [None] * len(LEX_COLUMNS) + [entry.error['kind']]
+    if not entry.file_tag:
+        return None
+
+    line_counts = dict(entry.line_counts)
+    return [path, entry.file_tag] + [line_counts.get(lex_tag, 0) for lex_tag in LEX_COLUMNS] + [None]
+
+
+class Exporter(object):
+    """Writer of the record of each file to an output file, which is closed with the exporter if 'close_file'"""
+
+    def __init__(self, file_out, close_file=False):
+        self.file_out = file_out
+        self.close_file = close_file
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def add(self, path, entry):
+        record = _record(path, entry)
+        if record:
+            self.write(record)
+
+    def write(self, record):
+        raise NotImplementedError()
+
+    def close(self):
+        self.file_out.flush()
+        if self.close_file:
+            self.file_out.close()
+
+
+class JsonlExporter(Exporter):
+    """Write a JSON object per file"""
+
+    def write(self, record):
+        self.file_out.write(json.dumps(dict(zip(COLUMNS, record))) + '\n')
+
+
+class CsvExporter(Exporter):
+    """Write a row per file after a header, the empty cells are the line counts of failed files and the errors"""
+
+    def __init__(self, file_out, close_file=False):
+        Exporter.__init__(self, file_out, close_file)
+        self.writer = csv.writer(file_out, lineterminator='\n')
+        self.writer.writerow(COLUMNS)
+
+    def write(self, record):
+        self.writer.writerow(record)
+
+
+def _pack_array(type_code, values):
+    column = array(type_code, values)
+    if sys.byteorder != 'little':
+        column.byteswap()
+    return column.tobytes()
+
+
+def _unpack_array(type_code, data, offset, length):
+    column = array(type_code)
+    end = offset + length * column.itemsize
+    column.frombytes(data[offset:end])
+    if sys.byteorder != 'little':
+        column.byteswap()
+    return column, end
+
+
+class ColumnarExporter(Exporter):
+    """Write the records in compressed blocks of columns to a binary file
+
+    A block is the header of _BLOCK, followed by the zlib compressed columns:
+        the strings new in this block: a count, and the (length, UTF-8 bytes) of each,
+            which are numbered from 1 in the order of the file, 0 is None
+        the paths: the (length shared with the previous path, length of the rest) of each, and then the rests
+        the tag and error columns as string numbers of 'H', the line count columns of 'I', little-endian
+    """
+
+    def __init__(self, file_out, close_file=False, block_rows=None):
+        Exporter.__init__(self, file_out, close_file)
+        self.block_rows = block_rows if block_rows else config.EXPORT_BLOCK_ROWS
+        self.strings = {None: 0}
+        self.rows = list()
+        self.last_path = b''
+        self.file_out.write(_MAGIC)
+
+    def _string(self, value, new_strings):
+        number = self.strings.get(value)
+        if number is None:
+            number = self.strings[value] = len(self.strings)
+            new_strings.append(value)
+        return number
+
+    def write(self, record):
+        self.rows.append(record)
+        if len(self.rows) >= self.block_rows:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+
+        new_strings = list()
+        tags = [self._string(row[1], new_strings) for row in self.rows]
+        errors = [self._string(row[-1], new_strings) for row in self.rows]
+        chunks = [struct.pack('<I', len(new_strings))]
+        for value in new_strings:
+            value = value.encode('utf-8')
+            chunks.append(struct.pack('<H', len(value)) + value)
+
+        rests = list()
+        for row in self.rows:
+            path = row[0].encode('utf-8', 'surrogateescape')
+            shared = 0
+            limit = min(len(path), len(self.last_path), 0xffff)
+            while shared < limit and path[shared] == self.last_path[shared]:
+                shared += 1
+            chunks.append(_LENGTHS.pack(shared, len(path) - shared))
+            rests.append(path[shared:])
+            self.last_path = path
+        chunks.extend(rests)
+
+        chunks.append(_pack_array('H', tags))
+        chunks.append(_pack_array('H', errors))
+        for index in range(len(LEX_COLUMNS)):
+            chunks.append(_pack_array('I', (row[2 + index] or 0 for row in self.rows)))
+
+        payload = zlib.compress(b''.join(chunks))
+        self.file_out.write(_BLOCK.pack(len(self.rows), len(payload)) + payload)
+        self.rows = list()
+
+    def close(self):
+        self.flush()
+        self.file_out.write(_END)
+        Exporter.close(self)
+
+
+def iter_columnar(file_in):
+    """Read the records of a columnar export from a binary file, as dicts of the COLUMNS"""
+
+    if file_in.read(len(_MAGIC)) != _MAGIC:
+        raise ValueError('Not a columnar export')
+
+    strings = [None]
+    last_path = b''
+    while True:
+        rows, size = _BLOCK.unpack(file_in.read(_BLOCK.size))
+        if not rows:
+            return
+        data = zlib.decompress(file_in.read(size))
+
+        count, = struct.unpack_from('<I', data)
+        offset = 4
+        for _ in range(count):
+            length, = struct.unpack_from('<H', data, offset)
+            strings.append(data[offset + 2:offset + 2 + length].decode('utf-8'))
+            offset += 2 + length
+
+        lengths = [_LENGTHS.unpack_from(data, offset + index * _LENGTHS.size) for index in range(rows)]
+        offset += rows * _LENGTHS.size
+        paths = list()
+        for shared, rest in lengths:
+            last_path = last_path[:shared] + data[offset:offset + rest]
+            paths.append(last_path.decode('utf-8', 'surrogateescape'))
+            offset += rest
+
+        tags, offset = _unpack_array('H', data, offset, rows)
+        errors, offset = _unpack_array('H', data, offset, rows)
+        lex_columns = list()
+        for _ in LEX_COLUMNS:
+            column, offset = _unpack_array('I', data, offset, rows)
+            lex_columns.append(column)
+
+        for index, path in enumerate(paths):
+            error = strings[errors[index]]
+            line_counts = [None if error else column[index] for column in lex_columns]
+            yield dict(zip(COLUMNS, [path, strings[tags[index]]] + line_counts + [error]))
+
+
+def open_exporter(path, output_format=None):
+    """Open an exporter writing to a file, by the format or the extension of the path, CSV by default,
+    which should be closed after counting
+    """
+
+    output_format = output_format if output_format else next(
+        (name for name in (FORMAT_JSONL, FORMAT_COLUMNAR) if path.endswith('.' + name)), FORMAT_CSV)
+    if output_format == FORMAT_COLUMNAR:
+        return ColumnarExporter(open(path, 'wb'), close_file=True)
+    if output_format == FORMAT_JSONL:
+        return JsonlExporter(open(path, 'w', encoding='utf-8'), close_file=True)
+    return CsvExporter(open(path, 'w', encoding='utf-8', newline=''), close_file=True)
+
+
+def data_dict(data):
+    """Convert the data returned by count() to nested dicts by the tags, e.g. to write as JSON"""
+    return dict(((data_tag(key), data_dict(value) if isinstance(value, DynamicObject) else value)
+                 for key, value in data.to_dict().items()))
+
+
+def _tree_data(totals):
+    return dict(((tag, value if tag == config.TAG_ERROR else dict(value.items())) for tag, value in totals.items()))
+
+
+def write_tree(dir_tree, file_out):
+    """Write the data of each directory of a DirTree as nested JSON objects:
+    {"name": ..., "path": ..., "data": {data tag: {lex tag: line count}}, "children": [...]}
+    """
+
+    depth = -1
+    for path, totals in dir_tree.iter_dirs():
+        path_depth = path.count('/') + 1 if path else 0
+        # Close the objects of the previous directories which are not the parent
+        if depth >= path_depth:
+            file_out.write(']}' * (depth - path_depth + 1))
+        if path_depth:
+            file_out.write(',' if depth >= path_depth else '')
+
+        name = path[path.rfind('/') + 1:] if path else dir_tree.root_path
+        file_out.write('{"name": %s, "path": %s, "data": %s, "children": [' % (
+            json.dumps(name), json.dumps(path), json.dumps(_tree_data(totals))))
+        depth = path_depth
+
+    file_out.write(']}' * (depth + 1) if depth >= 0 else 'null')
+    file_out.write('\n')
@@ -0,0 +1,223 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+"""Count the files of a git repository
+
+The files are listed by git, so .gitignore is honoured instead of config.IGNORED_FOLDERS.
+A revision is counted from the object database, reading the blobs through one 'git cat-file --batch' process,
+and may be counted incrementally from the result of a previous revision, lexing the changed blobs only.
+"""
+
+import json
+import os
+import subprocess
+
+import config
+from code_count import check_result, count_files, count_text
+from dispatch import get_dispatch
+from log import get_logger
+from reader import check_size, CountError, decode, file_deadline, sniff, timeout_error
+from result import add_totals, new_totals, to_result
+
+logger = get_logger()
+
+# File modes of the tree entries which are not regular files
+_MODE_LINK = '120000'
+_MODE_SUBMODULE = '160000'
+
+
+def git(repo, *args):
+    """Run a git command in a repository, return the output bytes"""
+    return subprocess.run(('git', '-C', repo) + args, stdout=subprocess.PIPE, check=True).stdout
+
+
+def resolve(repo, rev):
+    """Get the commit ID of a revision"""
+    return git(repo, 'rev-parse', '--verify', '--end-of-options', rev + '^{commit}').decode('ascii').strip()
+
+
+def _join(repo, path):
+    return '%s/%s' % (repo.replace('\\', '/').rstrip('/'), path)
+
+
+def list_files(repo):
+    """List the files of the working tree, tracked or not ignored"""
+
+    output = git(repo, 'ls-files', '-z', '--cached', '--others', '--exclude-standard')
+    path_list = list()
+    for path in output.decode('utf-8', 'surrogateescape').split('\0'):
+        full_path = _join(repo, path)
+        if path and os.path.isfile(full_path) and not os.path.islink(full_path):
+            path_list.append(full_path)
+    return sorted(set(path_list))
+
+
+def list_blobs(repo, commit):
+    """List the blobs of a commit as (path, blob ID)"""
+
+    output = git(repo, 'ls-tree', '-r', '-z', '--full-tree', commit)
+    blobs = list()
+    for line in output.decode('utf-8', 'surrogateescape').split('\0'):
+        if not line:
+            continue
+        info, path = line.split('\t', 1)
+        mode, object_type, blob_id = info.split(' ')
+        if object_type == 'blob' and mode != _MODE_LINK:
+            blobs.append((path, blob_id))
+    return blobs
+
+
+def diff_blobs(repo, old_commit, new_commit):
+    """List the changed files between two commits as (path, new blob ID), the blob ID is None if deleted"""
+
+    output = git(repo, 'diff-tree', '-r', '-z', '--no-renames', old_commit, new_commit)
+    fields = output.decode('utf-8', 'surrogateescape').split('\0')
+    changes = list()
+    for info, path in zip(fields[0::2], fields[1::2]):
+        _, new_mode, _, blob_id, status = info[1:].split(' ')
+        if status == 'D' or new_mode in (_MODE_LINK, _MODE_SUBMODULE):
+            changes.append((path, None))
+        else:
+            changes.append((path, blob_id))
+    return changes
+
+
+class BlobReader(object):
+    """Read blobs through one 'git cat-file --batch' process"""
+
+    def __init__(self, repo):
+        self.process = subprocess.Popen(('git', '-C', repo, 'cat-file', '--batch'),
+                                        stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def read(self, blob_id):
+        self.process.stdin.write(blob_id.encode('ascii') + b'\n')
+        self.process.stdin.flush()
+
+        header = self.process.stdout.readline().split()
+        if len(header) != 3:
+            raise KeyError(blob_id)
+        data = self.process.stdout.read(int(header[2]))
+        self.process.stdout.read(1)
+        return data
+
+    def close(self):
+        self.process.stdin.close()
+        self.process.stdout.close()
+        self.process.wait()
+
+
+class Revision(object):
+    """Line counts of each file in a revision, as {path: (blob ID, file tag, line counts)},
+    and the error records of the files which failed to count, as {path: error record}
+    """
+
+    def __init__(self, repo, commit, entries, errors=None):
+        self.repo = repo
+        self.commit = commit
+        self.entries = entries
+        self.errors = errors if errors else dict()
+
+    def totals(self):
+        """Add up the line counts to the line counters of each data tag, and the error records to TAG_ERROR"""
+
+        totals = new_totals()
+        for path in sorted(self.entries):
+            _, file_tag, line_counts = self.entries[path]
+            add_totals(totals, _join(self.repo, path), file_tag, line_counts)
+        if self.errors:
+            totals[config.TAG_ERROR] = [self.errors[path] for path in sorted(self.errors)]
+        return totals
+
+    def data(self):
+        """Add up the line counts as the data returned by count()"""
+        return to_result(self.totals())
+
+    def dump(self, file_path):
+        with open(file_path, 'w') as file_out:
+            json.dump({'commit': self.commit, 'entries': self.entries, 'errors': self.errors}, file_out)
+
+    @staticmethod
+    def load(repo, file_path):
+        with open(file_path, 'r') as file_in:
+            content = json.load(file_in)
+        entries = dict(((path, (blob_id, file_tag, [tuple(item) for item in line_counts]))
+                        for path, (blob_id, file_tag, line_counts) in content['entries'].items()))
+        return Revision(repo, content['commit'], entries, content.get('errors'))
+
+
+def _count_blob(path, f_handler, data, encodings):
+    """Count the bytes of a blob, raise CountError if it fails to count"""
+
+    check_size(path, len(data))
+    text = decode(path, data, encodings)
+    problems = list()
+    try:
+        text_context = count_text(text, f_handler.lexer_list, deadline=file_deadline(), problems=problems)
+    except TimeoutError:
+        raise timeout_error(path)
+    check_result(path, f_handler, text_context, problems)
+    return text_context
+
+
+def count_revision(repo, rev='HEAD', previous=None, blob_counts=None):
+    """Count a revision of a repository from the object database
+
+    If the Revision of a previous commit is given, which was counted with the same config,
+    only the blobs changed between the two commits are read and lexed.
+    A blob is lexed once for each file tag, no matter how many paths it is found at,
+    and the line counts of blobs may be shared across revisions by a 'blob_counts' dict.
+    """
+
+    commit = resolve(repo, rev)
+    if previous:
+        entries = dict(previous.entries)
+        errors = dict(previous.errors)
+        changes = diff_blobs(repo, previous.commit, commit)
+    else:
+        entries = dict()
+        errors = dict()
+        changes = list_blobs(repo, commit)
+
+    # Line counts of the known blobs
+    blob_counts = blob_counts if blob_counts is not None else dict()
+    blob_counts.update((((file_tag, blob_id), line_counts) for blob_id, file_tag, line_counts in entries.values()))
+
+    dispatch = get_dispatch()
+    with BlobReader(repo) as reader:
+        for path, blob_id in changes:
+            entries.pop(path, None)
+            errors.pop(path, None)
+            f_handler = dispatch.handler(_join(repo, path)) if blob_id else None
+            if f_handler is None:
+                continue
+
+            line_counts = blob_counts.get((f_handler.tag, blob_id))
+            if line_counts is None:
+                # Skip binary blobs, and record the blobs which fail to count
+                data = reader.read(blob_id)
+                encodings = sniff(data[:config.SNIFF_SIZE])
+                if encodings is None:
+                    continue
+                try:
+                    text_context = _count_blob(_join(repo, path), f_handler, data, encodings)
+                except CountError as e:
+                    errors[path] = e.record
+                    continue
+
+                line_counts = blob_counts[(f_handler.tag, blob_id)] = text_context.items()
+            entries[path] = (blob_id, f_handler.tag, line_counts)
+
+    if config.LOG_MODE != config.LOG_MODE_PROGRESS:
+        logger.info('%s: %d files, %d changed', commit, len(entries), len(changes))
+    return Revision(repo, commit, entries, errors)
+
+
+def count_worktree(repo, workers=None, cache=None):
+    """Count the files of the working tree listed by git"""
+    return count_files(list_files(repo), workers, cache)
@@ -0,0 +1,127 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+"""Line count time series over the commits of a git repository
+
+Each commit is counted incrementally from the previous one in the sweep, and the line counts of blobs
+are memoized by the blob ID, so each version of a file is lexed once across the whole sweep.
+The rows of each commit are appended to a CSV or JSONL file as soon as it is counted,
+with the 'All' row last to mark the commit complete, so an interrupted sweep resumes from the output.
+"""
+
+import csv
+import io
+import json
+import os
+
+import config
+from git_count import count_revision, git
+from log import get_logger
+from progress import Progress
+
+logger = get_logger()
+
+FORMAT_CSV = 'csv'
+FORMAT_JSONL = 'jsonl'
+
+LEX_COLUMNS = [config.LEX_CODE, config.LEX_COMMENT, config.LEX_SPACE, config.LEX_TEXT, config.LEX_TOTAL]
+COLUMNS = ['commit', 'time', 'tag'] + LEX_COLUMNS
+
+
+def list_commits(repo, rev_range='HEAD', first_parent=False):
+    """List the commits of a range from the oldest as (commit ID, committer time)"""
+
+    args = ['log', '--reverse', '--format=%H %cI'] + (['--first-parent'] if first_parent else [])
+    output = git(repo, *(args + ['--end-of-options', rev_range]))
+    return [tuple(line.split(' ', 1)) for line in output.decode('ascii').splitlines()]
+
+
+def commit_rows(commit, time, totals):
+    """Get the rows of a commit from the line counters of each data tag, the 'All' row comes last"""
+
+    tags = sorted((tag for tag in totals if tag not in (config.TAG_ALL, config.TAG_ERROR))) + [config.TAG_ALL]
+    return [[commit, time, tag] + [totals[tag].get(lex_tag, 0) for lex_tag in LEX_COLUMNS] for tag in tags]
+
+
+def _format(rows, output_format):
+    if output_format == FORMAT_JSONL:
+        return ''.join((json.dumps(dict(zip(COLUMNS, row))) + '\n' for row in rows))
+
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator='\n').writerows(rows)
+    return buffer.getvalue()
+
+
+def _parse(line, output_format):
+    """Parse a row as (commit, tag), or None if it is not a row"""
+
+    try:
+        if output_format == FORMAT_JSONL:
+            row = json.loads(line)
+            return row['commit'], row['tag']
+        row = next(csv.reader([line]))
+        return (row[0], row[2]) if row != COLUMNS else None
+    except (ValueError, KeyError, IndexError, StopIteration):
+        return None
+
+
+def recover(output, output_format):
+    """Read the complete commits of an output
+    return the set of complete commits, and the size of the output up to the last complete commit
+    """
+
+    done = set()
+    size = 0
+    if not os.path.exists(output):
+        return done, size
+
+    offset = 0
+    with open(output, 'rb') as file_in:
+        for line in file_in:
+            offset += len(line)
+            if not line.endswith(b'\n'):
+                break
+            row = _parse(line.decode('utf-8'), output_format)
+            if row is None and offset == len(line):
+                size = offset
+            elif row and row[1] == config.TAG_ALL:
+                done.add(row[0])
+                size = offset
+    return done, size
+
+
+def sweep(repo, output, rev_range='HEAD', first_parent=False, output_format=None):
+    """Count each commit of a range, and append the rows to the output, skipping the complete commits in it
+    return the number of commits counted
+    """
+
+    output_format = output_format if output_format else (
+        FORMAT_JSONL if output.endswith('.' + FORMAT_JSONL) else FORMAT_CSV)
+    done, size = recover(output, output_format)
+    progress = Progress() if config.LOG_MODE == config.LOG_MODE_PROGRESS else None
+
+    previous = None
+    blob_counts = dict()
+    counted = 0
+    with open(output, 'a+b') as file_out:
+        # Drop the rows of an incomplete commit
+        file_out.truncate(size)
+        if not size and output_format == FORMAT_CSV:
+            file_out.write(_format([COLUMNS], output_format).encode('utf-8'))
+
+        for commit, time in list_commits(repo, rev_range, first_parent):
+            if commit in done:
+                continue
+
+            previous = count_revision(repo, commit, previous, blob_counts)
+            totals = previous.totals()
+            file_out.write(_format(commit_rows(commit, time, totals), output_format).encode('utf-8'))
+            file_out.flush()
+
+            counted += 1
+            if progress:
+                progress.update(commit, totals[config.TAG_ALL].get(config.LEX_TOTAL, 0))
+
+    if progress:
+        progress.finish()
+    return counted
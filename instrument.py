@@ -0,0 +1,114 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+import heapq
+from time import perf_counter
+
+from lexer import LexerTable, get_lexer_table
+
+PHASE_WALK = 'walk'
+PHASE_READ = 'read'
+PHASE_COUNT = 'count_text'
+
+
+class ProfiledTable(LexerTable):
+    """Lexer table which tries the rules one by one to record the attempts, hits and match time of each rule,
+    and never classifies lines without the rules
+    The match time is taken by perf_counter() unless another clock is given.
+    """
+
+    def __init__(self, table, rule_stats, clock=perf_counter):
+        self.__dict__.update(table.__dict__)
+        self.base_table = table
+        self.rule_stats = rule_stats
+        self.clock = clock
+        self.line_tags = None
+        self._profiled_binary_table = None
+
+    def match(self, text, pos):
+        for index, (rule, pattern) in enumerate(self.patterns):
+            start = self.clock()
+            lexer_match = pattern.match(text, pos)
+            stats = self.rule_stats[index]
+            stats[0] += 1
+            stats[2] += self.clock() - start
+            if lexer_match:
+                stats[1] += 1
+                return lexer_match, rule
+
+        return None, None
+
+    def binary_table(self):
+        if self._profiled_binary_table is None:
+            table = self.base_table.binary_table()
+            self._profiled_binary_table = ProfiledTable(table, self.rule_stats, self.clock) if table else False
+        return self._profiled_binary_table if self._profiled_binary_table else None
+
+
+class Profiler(object):
+    """Opt-in instrumentation of count()
+
+    Records the time of each phase, the attempts, hits and match time of each lexer rule per file tag,
+    and the slowest files. The rules are tried one by one while profiling, so the match time is
+    higher than the time of the merged lexer table.
+    """
+
+    def __init__(self, slowest=10):
+        self.slowest = slowest
+        self.phases = {PHASE_WALK: 0.0, PHASE_READ: 0.0, PHASE_COUNT: 0.0}
+        self.files = 0
+        self.file_seconds = 0.0
+        self._tables = dict()
+        self._slowest_files = list()
+
+    def table(self, file_tag, lexer_list):
+        """Get the profiled lexer table of a file tag"""
+
+        table = self._tables.get(file_tag)
+        if table is None:
+            base_table = get_lexer_table(lexer_list)
+            table = self._tables[file_tag] = ProfiledTable(base_table, [[0, 0, 0.0] for _ in base_table.rules])
+        return table
+
+    def add_phase(self, phase, seconds):
+        self.phases[phase] += seconds
+
+    def add_file(self, path, seconds):
+        self.files += 1
+        self.file_seconds += seconds
+        item = (seconds, path)
+        if len(self._slowest_files) < self.slowest:
+            heapq.heappush(self._slowest_files, item)
+        elif item > self._slowest_files[0]:
+            heapq.heapreplace(self._slowest_files, item)
+
+    def report(self):
+        """Get the report as a dict of phases, rules and the slowest files"""
+
+        rules = dict()
+        for file_tag, table in self._tables.items():
+            rules[file_tag] = [{'tag': rule.lexer.tag, 'rule': rule.lexer.rule,
+                                'attempts': stats[0], 'hits': stats[1], 'seconds': stats[2]}
+                               for rule, stats in zip(table.rules, table.rule_stats)]
+
+        return {
+            'phases': dict(self.phases),
+            'files': self.files,
+            'rules': rules,
+            'slowest': [(path, seconds) for seconds, path in sorted(self._slowest_files, reverse=True)],
+        }
+
+    def dump(self):
+        """Format the report as text"""
+
+        report = self.report()
+        lines = ['Phases:']
+        lines.extend(('\t%s: %.3fs' % (phase, seconds) for phase, seconds in report['phases'].items()))
+        lines.append('Rules:')
+        for file_tag, rule_list in report['rules'].items():
+            lines.append('\t%s:' % file_tag)
+            lines.extend(('\t\t[%s] attempts=%d, hits=%d, time=%.3fs: %s' % (
+                rule['tag'], rule['attempts'], rule['hits'], rule['seconds'], rule['rule']) for rule in rule_list))
+        lines.append('Slowest files:')
+        lines.extend(('\t%.3fs: %s' % (seconds, path) for path, seconds in report['slowest']))
+        return '\n'.join(lines)
@@ -0,0 +1,197 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+import hashlib
+import re
+
+import counter
+from counter import tag_id
+
+_GROUP_NAME = re.compile(r'\(\?P<(\w+)>')
+_GROUP_REF = re.compile(r'\(\?P=(\w+)\)')
+_UNMERGEABLE = re.compile(r'\\[1-9]|\(\?\(|\(\?[aiLmsux]+\)')
+
+_FLAG_LETTERS = ((re.I, 'i'), (re.M, 'm'), (re.S, 's'), (re.X, 'x'))
+_FLAG_MASK = re.I | re.M | re.S | re.X | re.U
+
+_ENDING = re.compile(r'\s*?\n', re.S)
+_SPACE_IN_COMMENT = re.compile(r'(?<=\n)\s*?\n')
+_ENDING_BYTES = re.compile(br'\s*?\n', re.S)
+_SPACE_IN_COMMENT_BYTES = re.compile(br'(?<=\n)\s*?\n')
+
+# Rules of a table which only classifies lines: the blank lines, and then any other lines
+_BLANK_LINE_RULES = {r'\s*(?=\n)'}
+_OTHER_LINE_RULES = {r'[^\S\n]*\S[^\n]*(?=\n)', r'\s*[^\s]+[^\n]*(?=\n)', r'\s*\S+[^\n]*(?=\n)'}
+_LINE_FLAG_MASK = re.I | re.M | re.S | re.U
+
+_tables = dict()
+
+
+class Rule(object):
+    """Lexer with its tags resolved to tag IDs"""
+
+    __slots__ = ('lexer', 'tag', 'condition', 'stack')
+
+    def __init__(self, lexer):
+        self.lexer = lexer
+        self.tag = tag_id(lexer.tag)
+        self.condition = (tag_id(lexer.condition[0]), tag_id(lexer.condition[1])) if lexer.condition else None
+        self.stack = (tag_id(lexer.stack[0]), lexer.stack[1]) if lexer.stack else None
+
+
+class LexerTable(object):
+    """Compiled lexer list
+
+    All rules are merged into one alternation of named groups when possible,
+    so that a token is matched by one regex call and dispatched by 'lastgroup'.
+    Otherwise the rules are tried one by one in the list order.
+
+    A binary table matches bytes with the ASCII semantics of the rules,
+    see 'binary_table()'.
+
+    The lexer state is neutral where none of the 'state_tags' is set in the context,
+    so that the tokens after it match as they do from the start of a text.
+
+    A table which only classifies lines as blank or not has the tag IDs of the two kinds in 'line_tags',
+    so that it can be counted line by line instead of token by token.
+    """
+
+    def __init__(self, lexer_list, binary=False):
+        self.lexer_list = lexer_list
+        self.lexers = list(lexer_list)
+        self.binary = binary
+        self.rules = [Rule(lexer) for lexer in self.lexers]
+        self.patterns = [(rule, self._compile(rule.lexer.rule, _flags(rule.lexer))) for rule in self.rules]
+        self.group_rules = dict()
+        self.pattern = self._merge()
+        self.line_tags = self._line_tags()
+        self._binary_table = None
+
+        # Tag IDs of the context which carry the state between tokens instead of line counts
+        self.state_tags = {counter.FLAG_CODE} | {rule.stack[0] for rule in self.rules if rule.stack} | \
+            {rule.condition[0] for rule in self.rules if rule.condition}
+
+        # Patterns to scan the text beside the rules
+        self.newline = b'\n' if binary else '\n'
+        self.ending = _ENDING_BYTES if binary else _ENDING
+        self.space_in_comment = _SPACE_IN_COMMENT_BYTES if binary else _SPACE_IN_COMMENT
+        self.count_newlines = _count_buffer_newlines if binary else _count_text_newlines
+
+    def _compile(self, rule, flags):
+        if self.binary:
+            return re.compile(rule.encode('ascii'), flags & ~re.U)
+        return re.compile(rule, flags)
+
+    def _merge(self):
+        """Merge the rules into one pattern, return None if they can't be merged"""
+
+        alternatives = list()
+        for index, rule in enumerate(self.rules):
+            lexer = rule.lexer
+            flags = _flags(lexer)
+            if flags & ~_FLAG_MASK or _UNMERGEABLE.search(lexer.rule):
+                return None
+
+            # Rename the inner groups to avoid conflicts among rules
+            prefix = '_%d' % index
+            pattern = _GROUP_NAME.sub(lambda m: '(?P<%s%s>' % (prefix, m.group(1)), lexer.rule)
+            pattern = _GROUP_REF.sub(lambda m: '(?P=%s%s)' % (prefix, m.group(1)), pattern)
+
+            letters = ''.join((letter for flag, letter in _FLAG_LETTERS if flags & flag))
+            group = 'L%d' % index
+            alternatives.append('(?P<%s>(?%s:%s))' % (group, letters, pattern) if letters else
+                                '(?P<%s>%s)' % (group, pattern))
+            self.group_rules[group] = rule
+
+        try:
+            return self._compile('|'.join(alternatives), 0)
+        except re.error:
+            self.group_rules.clear()
+            return None
+
+    def _line_tags(self):
+        """Get the tag IDs of the blank lines and the other lines if the table only classifies lines"""
+
+        if len(self.rules) != 2 or any((rule.condition or rule.stack or _flags(rule.lexer) & ~_LINE_FLAG_MASK
+                                        for rule in self.rules)):
+            return None
+
+        blank, other = self.rules
+        if blank.lexer.rule in _BLANK_LINE_RULES and other.lexer.rule in _OTHER_LINE_RULES and \
+                counter.COMMENT not in (blank.tag, other.tag):
+            return blank.tag, other.tag
+        return None
+
+    def binary_table(self):
+        """Get the twin table which matches bytes, or None if a rule is not ASCII"""
+
+        if self.binary:
+            return self
+        if self._binary_table is None:
+            try:
+                self._binary_table = LexerTable(self.lexer_list, binary=True)
+            except (UnicodeEncodeError, ValueError, re.error):
+                self._binary_table = False
+
+        return self._binary_table if self._binary_table else None
+
+    @property
+    def version(self):
+        """Digest of the rules, which changes whenever a rule changes"""
+        rules = [(lexer.tag, lexer.rule, _flags(lexer), lexer.condition, lexer.stack) for lexer in self.lexers]
+        return hashlib.md5(repr(rules).encode('utf-8')).hexdigest()
+
+    def __iter__(self):
+        return iter(self.lexers)
+
+    def match(self, text, pos):
+        """Match the first lexer at a position of the text
+        return the match object and the matched rule
+        """
+
+        if self.pattern:
+            lexer_match = self.pattern.match(text, pos)
+            return (lexer_match, self.group_rules[lexer_match.lastgroup]) if lexer_match else (None, None)
+
+        for rule, pattern in self.patterns:
+            lexer_match = pattern.match(text, pos)
+            if lexer_match:
+                return lexer_match, rule
+
+        return None, None
+
+
+def _flags(lexer):
+    return lexer.flags if lexer.flags else 0
+
+
+def _count_text_newlines(text, start, end):
+    return text.count('\n', start, end)
+
+
+def _count_buffer_newlines(buffer, start, end):
+    """Count newlines of a buffer slice by bounded blocks, e.g. in a memory-mapped file"""
+
+    count = 0
+    for block_start in range(start, end, 1 << 20):
+        count += buffer[block_start:min(block_start + (1 << 20), end)].count(b'\n')
+    return count
+
+
+def get_lexer_table(lexer_list):
+    """Get the compiled table of a lexer list, which is built once on the first use"""
+
+    if isinstance(lexer_list, LexerTable):
+        return lexer_list
+
+    table = _tables.get(id(lexer_list))
+    if table is None or table.lexer_list is not lexer_list or table.lexers != lexer_list:
+        table = LexerTable(lexer_list)
+        _tables[id(lexer_list)] = table
+
+    return table
+
+
+def clear_lexer_tables():
+    """Drop the compiled tables, e.g. after editing the rules of a lexer in place"""
+    _tables.clear()
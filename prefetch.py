@@ -0,0 +1,119 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+"""Pipeline which overlaps reading files with lexing them in one process
+
+    producer: a thread walks the files and stats them, and queues them in the walk order
+    readers: a pool of threads read the queued files ahead
+    consumer: the caller iterates over the files in the walk order, and lexes the bytes read ahead
+
+The bytes read ahead and not consumed yet are capped by config.PREFETCH_BYTES, plus the last file read,
+and the files queued by the producer by config.PREFETCH_FILES, so the stages before wait for the consumer.
+"""
+
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+
+# End of the items put by the producer
+_END = object()
+
+
+class _Stopped(Exception):
+    """The consumer stopped iterating, which stops the producer"""
+
+
+def _read(path):
+    """Read the bytes of a file, or None if it fails, which is left to the consumer to read and report"""
+
+    try:
+        with open(path, 'rb') as file_in:
+            return file_in.read()
+    except OSError:
+        return None
+
+
+class Prefetcher(object):
+    """Iterate over the items of a producer as (item, bytes read ahead or None), in the order they are put
+
+    'produce(put)' runs in the producer thread, and calls 'put(item, path, size)' for each item,
+    the file of the path is read ahead unless the path is None, or 'prepare(item)' returns False,
+    which is called in the consumer thread before reading, e.g. to look up a cache.
+    """
+
+    def __init__(self, produce, prepare=None, threads=None, max_bytes=None, max_files=None):
+        self.produce = produce
+        self.prepare = prepare
+        self.threads = threads if threads else config.PREFETCH_THREADS
+        self.max_bytes = max_bytes if max_bytes else config.PREFETCH_BYTES
+        self.max_files = max_files if max_files else config.PREFETCH_FILES
+        self.in_flight = 0
+
+        self._queue = queue.Queue(self.max_files)
+        self._stopped = threading.Event()
+
+    def _put(self, item, path=None, size=0):
+        if self._stopped.is_set():
+            raise _Stopped()
+        self._queue.put((item, path, size))
+
+    def _run(self):
+        try:
+            self.produce(self._put)
+            self._queue.put(_END)
+        except _Stopped:
+            pass
+        except BaseException as e:
+            self._queue.put(e)
+
+    def __iter__(self):
+        producer = threading.Thread(target=self._run, daemon=True)
+        producer.start()
+
+        # Items taken from the queue as (item, future of the bytes or None, size)
+        window = deque()
+        finished = False
+        executor = ThreadPoolExecutor(self.threads)
+        try:
+            while True:
+                # Take the next items while within the budget, waiting for one only if there is nothing to lex
+                while not finished and (not window or (self.in_flight < self.max_bytes and
+                                                       len(window) < self.max_files)):
+                    try:
+                        entry = self._queue.get(block=not window)
+                    except queue.Empty:
+                        break
+                    if entry is _END:
+                        finished = True
+                    elif isinstance(entry, BaseException):
+                        raise entry
+                    else:
+                        item, path, size = entry
+                        if path is None or (self.prepare and not self.prepare(item)):
+                            window.append((item, None, 0))
+                        else:
+                            self.in_flight += size
+                            window.append((item, executor.submit(_read, path), size))
+
+                if not window:
+                    break
+                item, future, size = window.popleft()
+                data = future.result() if future else None
+                self.in_flight -= size
+                yield item, data
+        finally:
+            self._stopped.set()
+            for _, future, _ in window:
+                if future:
+                    future.cancel()
+            executor.shutdown()
+
+            # Unblock the producer if it is waiting for a full queue
+            while producer.is_alive():
+                try:
+                    self._queue.get(timeout=0.1)
+                except queue.Empty:
+                    pass
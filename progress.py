@@ -0,0 +1,38 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+from time import perf_counter
+
+import config
+from log import get_logger
+
+logger = get_logger()
+
+
+class Progress(object):
+    """Throttled progress reporter, which logs the throughput at most once per interval"""
+
+    def __init__(self, interval=None):
+        self.interval = config.PROGRESS_INTERVAL if interval is None else interval
+        self.files = 0
+        self.lines = 0
+        self.start = perf_counter()
+        self._next_report = self.start + self.interval
+
+    def update(self, path, lines):
+        self.files += 1
+        self.lines += lines
+
+        now = perf_counter()
+        if now >= self._next_report:
+            self._next_report = now + self.interval
+            logger.info('%s, last: %s', self.summary(now), path)
+
+    def summary(self, now=None):
+        seconds = (now if now else perf_counter()) - self.start
+        return '%d files, %d lines in %.1fs (%.1f files/s, %.1f lines/s)' % (
+            self.files, self.lines, seconds, self.files / seconds if seconds else 0.0,
+            self.lines / seconds if seconds else 0.0)
+
+    def finish(self):
+        logger.info(self.summary())
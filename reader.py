@@ -0,0 +1,431 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+"""Reading of the files to count: the size and time limits, the sniffing and decoding of the bytes,
+and the counting of large files in bytes by memory mapping, which are optionally lexed by chunks across processes
+"""
+
+import codecs
+import locale
+import mmap
+import os
+import re
+import tempfile
+from contextlib import contextmanager
+from time import perf_counter
+
+import config
+from counter import LineCounter, tag_id
+from dedup import new_digest
+from instrument import PHASE_READ
+from lexer import get_lexer_table, LexerTable
+from scanner import add_lines, check_context, scan
+
+# Blank lines of bytes without _UNSAFE_BYTES, split by '\n' only, and the bytes of a block to count lines
+_BLANK_LINE_BYTES = re.compile(br'^[ \t\r\x0b\x0c]*$', re.M)
+_LINE_BLOCK_SIZE = 1 << 20
+
+# Split a file for lexing at the start of an unindented line after a blank line,
+#   looked for in a window after each chunk size,
+#   and the bytes between the positions where a chunk restarts its line counts, see _lex_chunk()
+_SPLIT_LINE = re.compile(br'\n[ \t\r\x0b\x0c]*\n(?=[^\s])')
+_SPLIT_WINDOW = 1 << 16
+_SEGMENT_SIZE = 1 << 12
+
+# BOMs and the encodings to decode by, the UTF-32 ones come first as they start with the UTF-16 ones
+_BOMS = ((codecs.BOM_UTF32_LE, 'utf-32'), (codecs.BOM_UTF32_BE, 'utf-32'), (codecs.BOM_UTF8, 'utf-8-sig'),
+         (codecs.BOM_UTF16_LE, 'utf-16'), (codecs.BOM_UTF16_BE, 'utf-16'))
+
+# Bytes which are matched differently by binary tables and text tables, if a file is encoded as UTF-8:
+#   the non-ASCII and the control whitespaces, and the line breaks translated by the text mode
+_UNSAFE_BYTES = re.compile(br'[\x1c-\x1f]|\r(?!\n)|\xc2[\x85\xa0]|\xe1\x9a\x80|\xe2\x80[\x80-\x8a\xa8\xa9\xaf]|'
+                           br'\xe2\x81\x9f|\xe3\x80\x80')
+
+# The whitespaces of _UNSAFE_BYTES, translated to a space in the text of a file transcoded to count it as bytes,
+#   as the rules only tell the whitespaces apart from the other characters, see _transcode()
+_SPACES = dict.fromkeys((code for code in range(0x1c, 0x3001) if chr(code).isspace() and code != 0x20), ' ')
+
+
+class CountError(Exception):
+    """Failure to count a file, which is recorded in the result instead of aborting the count"""
+
+    def __init__(self, path, kind, message):
+        Exception.__init__(self, '%s: %s' % (path, message))
+        self.record = {'path': path, 'kind': kind, 'message': message}
+
+
+def file_deadline():
+    """Get the deadline of perf_counter() to lex a file, or None if there is no time limit"""
+    return perf_counter() + config.FILE_TIMEOUT if config.FILE_TIMEOUT else None
+
+
+def timeout_error(path):
+    return CountError(path, config.ERROR_TIMEOUT, 'Timed out after %s seconds' % config.FILE_TIMEOUT)
+
+
+def check_size(path, size):
+    """Check the size of a file, raise CountError if it exceeds the limit"""
+
+    if config.FILE_SIZE_LIMIT and size > config.FILE_SIZE_LIMIT:
+        raise CountError(path, config.ERROR_SIZE, 'File of %d bytes exceeds the limit' % size)
+
+
+def default_encodings():
+    """Get the encodings to decode a file without a BOM"""
+    return [locale.getpreferredencoding(False) if encoding == config.ENCODING_LOCALE else encoding
+            for encoding in config.ENCODINGS]
+
+
+def sniff(head):
+    """Sniff the head bytes of a file
+    return the encodings to decode the file by, or None if it is a binary file
+    """
+
+    for bom, encoding in _BOMS:
+        if head.startswith(bom):
+            return [encoding]
+    return None if b'\0' in head else default_encodings()
+
+
+def decode(path, data, encodings):
+    """Decode the bytes of a file by the first encoding which succeeds,
+    and translate the line breaks as the text mode does
+    """
+
+    for encoding in encodings:
+        try:
+            text = data.decode(encoding)
+            break
+        except UnicodeDecodeError:
+            continue
+    else:
+        raise CountError(path, config.ERROR_DECODE, 'Failed to decode by: %s' % ', '.join(encodings))
+
+    if '\r' in text:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    return text
+
+
+def read_bytes(path, size=None, profiler=None):
+    start = perf_counter() if profiler else None
+
+    with open(path, 'rb') as file_in:
+        data = file_in.read(size) if size else file_in.read()
+
+    if profiler:
+        profiler.add_phase(PHASE_READ, perf_counter() - start)
+    return data
+
+
+def _is_plain_text(buffer):
+    """Check if a buffer is counted as bytes the same as its decoded text:
+    it decodes by the first encoding to try, UTF-8 or ASCII, and has none of _UNSAFE_BYTES
+    The bytes are decoded by bounded blocks, e.g. in a memory-mapped file.
+    """
+
+    encodings = sniff(buffer[:config.SNIFF_SIZE])
+    if not encodings or codecs.lookup(encodings[0]).name not in ('utf-8', 'ascii') or _UNSAFE_BYTES.search(buffer):
+        return False
+
+    decoder = codecs.getincrementaldecoder(encodings[0])()
+    try:
+        for block_start in range(0, len(buffer), _LINE_BLOCK_SIZE):
+            decoder.decode(buffer[block_start:min(block_start + _LINE_BLOCK_SIZE, len(buffer))])
+        decoder.decode(b'', final=True)
+    except UnicodeDecodeError:
+        return False
+    return True
+
+
+def _write_text(spill, text, digest=None):
+    if '\r' in text:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    if digest:
+        digest.update(text.encode('utf-8', 'surrogatepass'))
+    spill.write(text.translate(_SPACES).encode('utf-8', 'surrogatepass'))
+
+
+def _transcode(path, buffer, encodings, spill, hash_content=False):
+    """Decode a buffer by bounded blocks, by the first encoding which succeeds as decode() does,
+    and write the text to a spill file as plain text, see _is_plain_text():
+    encoded as UTF-8, with the line breaks translated, and the whitespaces of _SPACES translated to a space
+    return the digest of the text if hashed, as text_digest() of dedup.py
+    raise CountError if it fails to decode
+    """
+
+    for encoding in encodings:
+        spill.seek(0)
+        spill.truncate()
+        decoder = codecs.getincrementaldecoder(encoding)()
+        digest = new_digest() if hash_content else None
+        text = ''
+        try:
+            for block_start in range(0, len(buffer), _LINE_BLOCK_SIZE):
+                text += decoder.decode(buffer[block_start:min(block_start + _LINE_BLOCK_SIZE, len(buffer))])
+
+                # Keep a '\r' at the end, which may be followed by a '\n' in the next block
+                carry = text.endswith('\r')
+                _write_text(spill, text[:-1] if carry else text, digest)
+                text = '\r' if carry else ''
+            _write_text(spill, text + decoder.decode(b'', final=True), digest)
+        except UnicodeDecodeError:
+            continue
+        spill.flush()
+        return digest.hexdigest() if digest else None
+
+    raise CountError(path, config.ERROR_DECODE, 'Failed to decode by: %s' % ', '.join(encodings))
+
+
+@contextmanager
+def _open_text(path, hash_content=False):
+    """Map a file as plain text, see _is_plain_text(), which is the file itself,
+    or else its text transcoded to a temporary file, see _transcode(), so that the memory stays bounded
+    yield the mapped bytes, the path of the mapped file, and the digest of the text if it is transcoded and hashed
+    """
+
+    with open(path, 'rb') as file_in:
+        if not os.fstat(file_in.fileno()).st_size:
+            yield b'', path, None
+            return
+
+        with mmap.mmap(file_in.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            if _is_plain_text(buffer):
+                yield buffer, path, None
+                return
+
+            encodings = sniff(buffer[:config.SNIFF_SIZE]) or default_encodings()
+            with tempfile.NamedTemporaryFile() as spill:
+                digest = _transcode(path, buffer, encodings, spill, hash_content)
+                if not spill.tell():
+                    yield b'', spill.name, digest
+                    return
+                with mmap.mmap(spill.fileno(), 0, access=mmap.ACCESS_READ) as text:
+                    yield text, spill.name, digest
+
+
+def count_line_buffer(buffer, table, hash_content=False):
+    """Count a buffer line by line, by bounded blocks split at line breaks
+    return the text context and the digest of the bytes if hashed,
+    or None if the buffer can't be counted as the decoded text
+    """
+
+    if not _is_plain_text(buffer):
+        return None
+    return _count_plain_lines(buffer, table, hash_content)
+
+
+def _count_plain_lines(buffer, table, hash_content=False):
+    # The '\n' appended by count_text() ends the last line
+    lines = 1
+    blank_lines = 0
+    digest = new_digest() if hash_content else None
+    size = len(buffer)
+    pos = 0
+    while True:
+        # Split a block after a line break, or at the end
+        block_end = buffer.find(b'\n', pos + _LINE_BLOCK_SIZE) + 1 if pos + _LINE_BLOCK_SIZE < size else 0
+        block = buffer[pos:block_end if block_end else size]
+        lines += block.count(b'\n')
+        blank_lines += len(_BLANK_LINE_BYTES.findall(block, 0, len(block) - 1 if block_end else len(block)))
+        if digest:
+            digest.update(block)
+        if not block_end:
+            break
+        pos = block_end
+
+    context = LineCounter()
+    add_lines(context, table.line_tags, lines, blank_lines)
+    check_context(context, '', lines)
+    return context, digest.hexdigest() if digest else None
+
+
+def count_lines(path, table, hash_content=False):
+    """Count a file line by line in bytes, for a lexer table which only classifies lines, see LexerTable.line_tags.
+    The file is memory mapped if it is large enough, see _open_text().
+    return the text context and the digest of the text if hashed,
+    or None if the file is not mapped and can't be counted as the decoded text
+    raise CountError if the mapped file fails to decode
+    """
+
+    with open(path, 'rb') as file_in:
+        size = os.fstat(file_in.fileno()).st_size
+        if not config.STREAM_SIZE or size < config.STREAM_SIZE:
+            return count_line_buffer(file_in.read(), table, hash_content)
+
+    with _open_text(path, hash_content) as (buffer, _, digest):
+        context, buffer_digest = _count_plain_lines(buffer, table, hash_content and not digest)
+        return context, digest if digest else buffer_digest
+
+
+def _content_end(buffer):
+    """Find the end of the content before the trailing whitespaces"""
+
+    end = len(buffer)
+    while end > 0:
+        block = buffer[max(end - 4096, 0):end]
+        content = block.rstrip()
+        if content:
+            return end - len(block) + len(content)
+        end -= len(block)
+
+    return 0
+
+
+def _is_neutral(context, state_tags):
+    return context is None or not any((context[index] for index in state_tags if index < len(context)))
+
+
+def _split_points(buffer, stop):
+    """Split a buffer until the stop position into chunks of about config.SPLIT_CHUNK_SIZE at line starts,
+    preferring the start of an unindented line after a blank line, which is more likely between tokens
+    return the start positions of the chunks, followed by the stop position
+    """
+
+    points = [0]
+    while points[-1] + config.SPLIT_CHUNK_SIZE < stop:
+        mark = points[-1] + config.SPLIT_CHUNK_SIZE
+        line_match = _SPLIT_LINE.search(buffer, mark, min(mark + _SPLIT_WINDOW, stop))
+        point = line_match.end() if line_match else buffer.find(b'\n', mark, stop) + 1
+        if point <= 0 or point >= stop:
+            break
+        points.append(point)
+
+    points.append(stop)
+    return points
+
+
+def _lex_chunk(task):
+    """Lex a chunk of a memory mapped file in a worker process, as if the text started at the chunk,
+    with the tokens limited to the end of the chunk
+    return the segments of the chunk as (start position, line counts), the position after the last token,
+    and whether the scan is not stuck
+
+    A segment starts at the first position where the lexer state is neutral after _SEGMENT_SIZE bytes,
+    and counts the lines from there with the state reset, so the line counts of the segments after a position
+    which the lexing of the whole text also reaches with a neutral state, are the same as that lexing counts.
+    """
+
+    path, lexer_list, start, stop = task
+    table = LexerTable(lexer_list, binary=True)
+    deadline = file_deadline()
+    segments = list()
+    context = None
+    with open(path, 'rb') as file_in, mmap.mmap(file_in.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        pos, reached, segment_end = start, True, start
+        while reached and pos < stop:
+            if pos >= segment_end and _is_neutral(context, table.state_tags):
+                context = LineCounter()
+                segments.append((pos, context))
+                segment_end = pos + _SEGMENT_SIZE
+            if deadline and perf_counter() > deadline:
+                raise TimeoutError()
+
+            # Match to the segment end, or a token at a time until the state is neutral
+            end, reached = scan(buffer, table, context, pos, max(segment_end, pos + 1), stop, deadline)
+            if end == pos:
+                break
+            pos = end
+
+    return [(segment_start, line_counts.items()) for segment_start, line_counts in segments], pos, reached
+
+
+def _scan_split(buffer, path, table, context, stop, pool, deadline=None):
+    """Match tokens until the stop position as scan() does with the stop as the limit,
+    by lexing the chunks of the file in a process pool, see _lex_chunk()
+    return the position after the last token, and whether the scan is not stuck
+
+    The chunks are merged in order: the lexing of the whole text is continued in this process
+    from the end of the previous chunk, until it reaches the start of a segment of the chunk with a neutral state,
+    and the line counts of the chunk from that segment are added up.
+    The result is the same as lexing the whole text here, wherever the chunks are split.
+    """
+
+    points = _split_points(buffer, stop)
+    tasks = ((path, table.lexer_list, start, end) for start, end in zip(points, points[1:]))
+    pos = 0
+    for chunk_end, (segments, end, reached) in zip(points[1:], pool.imap(_lex_chunk, tasks)):
+        for segment_index, (segment_start, _) in enumerate(segments):
+            # Lex here up to the start of the segment, or beyond it if the state is not neutral there
+            if segment_start < pos or segment_start == pos and not _is_neutral(context, table.state_tags):
+                continue
+            if segment_start > pos:
+                pos, scan_reached = scan(buffer, table, context, pos, segment_start, stop, deadline)
+                if not scan_reached or pos < segment_start:
+                    return pos, scan_reached
+                if pos > segment_start or not _is_neutral(context, table.state_tags):
+                    continue
+
+            for _, line_counts in segments[segment_index:]:
+                for tag, line_count in line_counts:
+                    context.add(tag_id(tag), line_count)
+            pos = end
+            if not reached:
+                return pos, False
+            break
+
+        # Lex the rest of the chunk here if no segment is reached
+        if pos < chunk_end:
+            pos, reached = scan(buffer, table, context, pos, chunk_end, stop, deadline)
+            if not reached or pos < chunk_end:
+                return pos, reached
+
+    return pos, True
+
+
+def _scan_rest(buffer, start, table, context, deadline=None):
+    """Match the tokens from a position of a mapped file to its end, with the '\n' appended as count_text() does
+    return the text left unmatched, at most config.STREAM_TAIL_SIZE bytes of it
+
+    The rest is copied in memory if it is at most config.STREAM_TAIL_SIZE bytes,
+    or else copied by blocks to a temporary file which is mapped, so that the memory stays bounded.
+    """
+
+    if len(buffer) - start <= config.STREAM_TAIL_SIZE:
+        rest = buffer[start:] + b'\n'
+        pos, _ = scan(rest, table, context, 0, len(rest), deadline=deadline)
+        return rest[pos:]
+
+    with tempfile.TemporaryFile() as spill:
+        for block_start in range(start, len(buffer), _LINE_BLOCK_SIZE):
+            spill.write(buffer[block_start:min(block_start + _LINE_BLOCK_SIZE, len(buffer))])
+        spill.write(b'\n')
+        spill.flush()
+        with mmap.mmap(spill.fileno(), 0, access=mmap.ACCESS_READ) as rest:
+            pos, _ = scan(rest, table, context, 0, len(rest), deadline=deadline)
+            return rest[pos:pos + config.STREAM_TAIL_SIZE]
+
+
+def count_stream(path, lexer_list, deadline=None, problems=None, pool=None):
+    """Count a file by memory mapping it, or its transcoded text, see _open_text(),
+    with the bytes twin of the lexer table, so that the memory doesn't grow with the file size.
+    return the text context
+    raise CountError if the lexer table has no bytes twin, or the file fails to decode
+    The deadline and the problems are as count_text() takes.
+    The file is lexed by chunks across the processes of a pool if given, see _scan_split(),
+    where the deadline applies to the lexing in this process and to each chunk.
+
+    Tokens are matched in place in the mapped file, as long as they end before its last character of content,
+    then the rest from there is matched with the appended '\n' which count_text() would add, see _scan_rest().
+    A token depending on the end of the text, e.g. one running to the end of an unterminated string,
+    ends beyond that character or fails in the mapped file, and is matched in the rest instead.
+    """
+
+    table = get_lexer_table(lexer_list).binary_table()
+    if not table:
+        raise CountError(path, config.ERROR_SIZE, 'File of %d bytes to stream has rules of non-ASCII characters'
+                         % os.path.getsize(path))
+
+    with _open_text(path) as (buffer, text_path, _):
+        # Match the mapped file until the last character of content, and then the rest
+        limit = max(_content_end(buffer) - 1, 0)
+        context = LineCounter()
+        if pool is not None and limit > config.SPLIT_CHUNK_SIZE:
+            pos, _ = _scan_split(buffer, text_path, table, context, limit, pool, deadline)
+        else:
+            pos, _ = scan(buffer, table, context, 0, limit, limit, deadline)
+        remain = _scan_rest(buffer, pos, table, context, deadline)
+
+        text_line_count = table.count_newlines(buffer, 0, len(buffer)) + 1
+
+    check_context(context, remain.decode('utf-8', 'replace'), text_line_count, problems)
+    return context
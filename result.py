@@ -0,0 +1,180 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+"""Data of the results of count(), and the line counters of each data tag which add up to it
+
+Output structure:
+
+# path counter
+
+    # file counter
+
+        # python
+        # java
+        # markdown
+
+    # dir counter
+
+        # main
+        # test
+
+# content counter
+
+    # line counter
+
+        # code
+        # comment
+        # space line
+        # total
+
+"""
+
+import re
+
+import config
+from counter import LineCounter
+from dynamic_object import DynamicObject
+from log import get_logger
+
+logger = get_logger()
+
+
+def data_key(tag):
+    try:
+        return '_%s' % '_'.join((str(ord(c)) for c in tag))
+    except BaseException as e:
+        logger.exception(e)
+
+
+def data_tag(key):
+    try:
+        return ''.join((chr(int(k)) for k in key[1:].split('_')))
+    except BaseException as e:
+        logger.exception(e)
+
+
+def add_data(data, tag, increment, remove_zero=False):
+    key = data_key(tag)
+    data[key] = increment if data[key] is None else data[key] + increment
+    if remove_zero and data[key] == 0:
+        data[key] = None
+
+
+def remove_data(data, tag):
+    key = data_key(tag)
+    data[key] = None
+
+
+def get_data(data, tag, default_value=None):
+    value = data[data_key(tag)]
+    return value if value else default_value
+
+
+def update_data(data, tag, default_value=None):
+    key = data_key(tag)
+    if key in data:
+        return data[key]
+    else:
+        data[key] = default_value
+        return default_value
+
+
+def to_data(line_counter):
+    """Convert a line counter to a DynamicObject"""
+
+    data = DynamicObject()
+    for tag, line_count in line_counter.items():
+        data[data_key(tag)] = line_count
+    return data
+
+
+def dump_data(data, indent=''):
+    return '\n%s' % ('\n'.join(
+        ('%s%s: %s' % (indent, data_tag(k), dump_data(v, indent + '\t') if isinstance(v, DynamicObject) else v)
+         for k, v in data.to_dict().items())))
+
+
+def data_tags(path, file_tag, duplicate=False):
+    """Get the tags of data to add up a file: the file tag, all, and optionally the test and the duplicate"""
+
+    tag_list = [file_tag, config.TAG_ALL]
+    if re.match(r'.*?/test/', path):
+        tag_list.append(config.TAG_TEST)
+    if duplicate:
+        tag_list.append(config.TAG_DUPLICATE)
+    return tag_list
+
+
+def add_file_data(data, path, file_tag, line_counts):
+    """ Add up text data to file data, all data,
+        and optionally the test data.
+    """
+
+    data_list = [update_data(data, tag, DynamicObject()) for tag in data_tags(path, file_tag)]
+    for lex_tag, line_count in line_counts:
+        [add_data(_data, lex_tag, line_count) for _data in data_list]
+
+
+def add_totals(totals, path, file_tag, line_counts, duplicate=False):
+    """Add up text data to the line counters of each data tag"""
+
+    for tag in data_tags(path, file_tag, duplicate):
+        line_counter = totals.get(tag)
+        if line_counter is None:
+            line_counter = totals[tag] = LineCounter()
+        line_counter.add_all(line_counts)
+
+
+def to_result(totals):
+    """Convert the line counters of each data tag to the DynamicObject returned by count(),
+    the error records of files under TAG_ERROR are kept as a list
+    """
+
+    data = DynamicObject()
+    for tag, line_counter in totals.items():
+        data[data_key(tag)] = line_counter if tag == config.TAG_ERROR else to_data(line_counter)
+    return data
+
+
+def new_totals():
+    return {config.TAG_ALL: LineCounter([(config.LEX_TOTAL, 0)])}
+
+
+def merge_totals(totals, other):
+    """Add up the line counters and the error records of other totals"""
+
+    for tag, value in other.items():
+        if tag == config.TAG_ERROR:
+            totals.setdefault(tag, list()).extend(value)
+        else:
+            totals.setdefault(tag, LineCounter()).add_all(value.items())
+
+
+def add_file(totals, path, entry, duplicate=False):
+    if entry.error:
+        totals.setdefault(config.TAG_ERROR, list()).append(entry.error)
+    elif entry.file_tag:
+        add_totals(totals, path, entry.file_tag, entry.line_counts, duplicate)
+
+
+def add_entry(totals, path, entry, digests=None, dir_tree=None):
+    """Add up the entry of a file to the line counters of each data tag, or its error record to TAG_ERROR,
+    and to the directory on top of a DirTree
+    """
+
+    duplicate = bool(entry.file_tag) and is_duplicate(digests, entry.file_tag, entry.digest)
+    add_file(totals, path, entry, duplicate)
+    if dir_tree:
+        dir_tree.add(path, entry, duplicate)
+
+
+def is_duplicate(digests, file_tag, digest):
+    """Check if a text was seen before in the walk order, and record it"""
+
+    if digests is None or digest is None:
+        return False
+    key = (file_tag, digest)
+    if key in digests:
+        return True
+    digests.add(key)
+    return False
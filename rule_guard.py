@@ -0,0 +1,301 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+"""Guard of the lexer rules against catastrophic backtracking
+
+    python rule_guard.py [--size 2000]
+
+A static check finds the pattern shapes prone to backtracking in the parsed rules:
+    nested: a repeat inside a repeat, which can split the same text in many ways
+    overlap: a repeat of alternatives which can start with the same character
+    unbounded: a repeat of almost any character, which can run across lines until a terminator,
+        with no way to end at the end of the text,
+        so each token missing its terminator scans the rest of the text before failing
+A timing harness counts adversarial texts built from the literals of the rules at two sizes,
+and finds the rules whose match time grows faster than linearly.
+The exit code is 1 if any rule of config.FILE_HANDLER_LIST is found.
+"""
+
+import argparse
+import math
+import re
+import sys
+from time import thread_time
+
+try:
+    from re import _constants as sre_constants, _parser as sre_parse
+except ImportError:
+    import sre_constants
+    import sre_parse
+
+import config
+from code_count import count_text
+from instrument import ProfiledTable
+from lexer import get_lexer_table
+
+KIND_NESTED = 'nested'
+KIND_OVERLAP = 'overlap'
+KIND_UNBOUNDED = 'unbounded'
+KIND_SLOW = 'slow'
+
+_REPEATS = {sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT, getattr(sre_constants, 'POSSESSIVE_REPEAT', None)}
+
+# ASCII approximations of the character categories
+_SPACE = frozenset(' \t\n\r\f\v')
+_DIGIT = frozenset('0123456789')
+_WORD = frozenset('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_')
+_CATEGORIES = {
+    sre_constants.CATEGORY_SPACE: (False, _SPACE),
+    sre_constants.CATEGORY_NOT_SPACE: (True, _SPACE),
+    sre_constants.CATEGORY_DIGIT: (False, _DIGIT),
+    sre_constants.CATEGORY_NOT_DIGIT: (True, _DIGIT),
+    sre_constants.CATEGORY_WORD: (False, _WORD),
+    sre_constants.CATEGORY_NOT_WORD: (True, _WORD),
+}
+
+# Character sets as (negated, characters), the set of any character, and the empty set
+_ANY = (True, frozenset())
+_NONE = (False, frozenset())
+
+# Fillers of the adversarial texts beside the literals of the rules
+_FILLERS = ['a', ' ', '\\', 'a\n']
+
+# Runs of counting a text, whose least time of each rule is taken, as the noise only adds time
+_TIMING_RUNS = 3
+
+
+def _union(a, b):
+    if a[0] and b[0]:
+        return True, a[1] & b[1]
+    if a[0] or b[0]:
+        negated, positive = (a, b) if a[0] else (b, a)
+        return True, negated[1] - positive[1]
+    return False, a[1] | b[1]
+
+
+def _intersects(a, b):
+    if a[0] and b[0]:
+        return True
+    if a[0] or b[0]:
+        negated, positive = (a, b) if a[0] else (b, a)
+        return bool(positive[1] - negated[1])
+    return bool(a[1] & b[1])
+
+
+def _contains(char_set, char):
+    return (char in char_set[1]) != char_set[0]
+
+
+def _in_set(items):
+    """Get the character set of a parsed class"""
+
+    char_set = _NONE
+    negate = False
+    for op, av in items:
+        if op == sre_constants.NEGATE:
+            negate = True
+        elif op == sre_constants.LITERAL:
+            char_set = _union(char_set, (False, frozenset(chr(av))))
+        elif op == sre_constants.RANGE and av[1] - av[0] < 256:
+            char_set = _union(char_set, (False, frozenset(map(chr, range(av[0], av[1] + 1)))))
+        else:
+            char_set = _union(char_set, _CATEGORIES.get(av, _ANY) if op == sre_constants.CATEGORY else _ANY)
+    return (not char_set[0], char_set[1]) if negate else char_set
+
+
+def _first(items, flags):
+    """Get the first characters of a parsed sequence, and whether it can match the end of the text"""
+
+    first = _NONE
+    for op, av in items:
+        if op == sre_constants.LITERAL:
+            return _union(first, (False, frozenset(chr(av)))), False
+        if op == sre_constants.NOT_LITERAL:
+            return _union(first, (True, frozenset(chr(av)))), False
+        if op == sre_constants.IN:
+            return _union(first, _in_set(av)), False
+        if op == sre_constants.ANY:
+            return _union(first, _ANY if flags & re.S else (True, frozenset('\n'))), False
+        if op == sre_constants.GROUPREF:
+            # A back reference is taken as a delimiter of unknown characters
+            return first, False
+
+        if op == sre_constants.SUBPATTERN:
+            item_first, at_end = _first(av[3], (flags | av[1]) & ~av[2])
+        elif op == sre_constants.BRANCH:
+            item_first, at_end = _NONE, False
+            for branch in av[1]:
+                branch_first, branch_at_end = _first(branch, flags)
+                item_first, at_end = _union(item_first, branch_first), at_end or branch_at_end
+        elif op in _REPEATS:
+            item_first, at_end = _first(av[2], flags)
+            at_end = at_end or not av[0]
+        elif op == sre_constants.ASSERT and av[0] > 0:
+            # The text after a lookahead starts with the characters of the lookahead
+            item_first, at_end = _first(av[1], flags)
+            return _union(first, item_first), at_end
+        elif op == getattr(sre_constants, 'ATOMIC_GROUP', None):
+            item_first, at_end = _first(av, flags)
+        else:
+            # Other assertions match no character
+            continue
+
+        first = _union(first, item_first)
+        if not at_end:
+            return first, False
+
+    return first, True
+
+
+def _check_items(items, flags, rest, outer, findings):
+    """Check a parsed sequence followed by 'rest', inside the repeat bodies of the 'outer' first characters"""
+
+    items = list(items)
+    for index, (op, av) in enumerate(items):
+        following = items[index + 1:] + rest
+        if op == sre_constants.SUBPATTERN:
+            _check_items(av[3], (flags | av[1]) & ~av[2], following, outer, findings)
+        elif op == sre_constants.BRANCH:
+            for branch in av[1]:
+                _check_items(branch, flags, following, outer, findings)
+        elif op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            _check_items(av[1], flags, [], outer, findings)
+        elif op == getattr(sre_constants, 'ATOMIC_GROUP', None):
+            _check_items(av, flags, following, outer, findings)
+        elif op in _REPEATS:
+            _check_repeat(av, flags, following, outer, findings)
+
+
+def _check_repeat(repeat, flags, following, outer, findings):
+    minimum, maximum, body = repeat
+    if maximum <= 1:
+        _check_items(body, flags, following, outer, findings)
+        return
+
+    body_first, _ = _first(body, flags)
+    unbounded = maximum == sre_constants.MAXREPEAT
+    if unbounded and any((_intersects(body_first, outer_first) for outer_first in outer)):
+        findings.append((KIND_NESTED, 'a repeat inside a repeat can start with the same characters'))
+
+    # Alternatives of a repeat starting with the same characters
+    branches = [branch for op, av in body if op == sre_constants.BRANCH for branch in av[1]]
+    for op, av in body:
+        if op == sre_constants.SUBPATTERN and len(av[3]) == 1 and av[3][0][0] == sre_constants.BRANCH:
+            branches.extend(av[3][0][1][1])
+    branch_firsts = [_first(branch, flags)[0] for branch in branches]
+    if any((_intersects(a, b) for index, a in enumerate(branch_firsts) for b in branch_firsts[index + 1:])):
+        findings.append((KIND_OVERLAP, 'alternatives of a repeat can start with the same characters'))
+
+    # A repeat of almost any character, which can run across lines,
+    #   needs a terminator that can be found at a line break or the end of the text
+    following_first, at_end = _first(following, flags)
+    if unbounded and body_first[0] and _contains(body_first, '\n') and not at_end and \
+            not _contains(following_first, '\n'):
+        findings.append((KIND_UNBOUNDED, 'a repeat across lines has no terminator at the end of the text'))
+
+    _check_items(body, flags, following, outer + ([body_first] if unbounded else []), findings)
+
+
+def check_rule(rule, flags=0):
+    """Check a rule for the pattern shapes prone to backtracking, return the findings as (kind, detail)"""
+
+    findings = list()
+    _check_items(sre_parse.parse(rule, flags), flags, [], [], findings)
+    return sorted(set(findings), key=findings.index)
+
+
+def check_table(lexer_list):
+    """Check the rules of a lexer list, return the findings as (rule index, kind, detail)"""
+    return [(index, kind, detail) for index, lexer in enumerate(lexer_list)
+            for kind, detail in check_rule(lexer.rule, lexer.flags if lexer.flags else 0)]
+
+
+def _opener(items):
+    """Get the leading literal of a parsed sequence, after the leading optional items"""
+
+    chars = list()
+    for op, av in items:
+        if op == sre_constants.LITERAL:
+            chars.append(chr(av))
+            continue
+        if chars:
+            break
+        if op == sre_constants.SUBPATTERN:
+            return _opener(av[3])
+        if op == sre_constants.IN and av[0][0] == sre_constants.LITERAL:
+            return chr(av[0][1])
+        if op in _REPEATS and av[0]:
+            return _opener(av[2]) * av[0]
+        if not (op in _REPEATS and not av[0]):
+            break
+    return ''.join(chars)
+
+
+def adversarial_texts(lexer_list, size):
+    """Build texts of about the size from the leading literals of the rules, repeated without terminators"""
+
+    pieces = set()
+    for lexer in lexer_list:
+        opener = _opener(list(sre_parse.parse(lexer.rule, lexer.flags if lexer.flags else 0)))
+        if opener:
+            pieces.update((opener, opener + 'a\n'))
+    pieces.update(_FILLERS)
+    return [piece * max(size // len(piece), 1) for piece in sorted(pieces)]
+
+
+def time_rules(lexer_list, size=None):
+    """Count the adversarial texts at a size and 4 times of it, by a table timing each rule in the CPU time
+    of this thread, not to count the time preempted by other processes, taking the least time of _TIMING_RUNS runs
+    return the rules whose match time grows faster than linearly, as (rule index, kind, detail)
+    """
+
+    size = size if size else config.GUARD_SIZE
+    table = get_lexer_table(lexer_list)
+    findings = list()
+    for text in adversarial_texts(lexer_list, size):
+        seconds = list()
+        for factor in (1, 4):
+            least = None
+            for _ in range(_TIMING_RUNS):
+                rule_stats = [[0, 0, 0.0] for _ in table.rules]
+                count_text(text * factor, ProfiledTable(table, rule_stats, thread_time), config.ENGINE_SCAN)
+                run = [stats[2] for stats in rule_stats]
+                least = run if least is None else [min(a, b) for a, b in zip(least, run)]
+            seconds.append(least)
+
+        for index, (small, large) in enumerate(zip(*seconds)):
+            if large < config.GUARD_MIN_SECONDS:
+                continue
+            exponent = math.log(large / max(small, 1e-9), 4)
+            if exponent > config.GUARD_EXPONENT:
+                findings.append((index, KIND_SLOW, 'time grows as size^%.1f on %r' % (exponent, text[:16])))
+    return findings
+
+
+def guard(lexer_list, size=None):
+    """Check a lexer list statically and by timing, return the findings as (rule index, kind, detail)"""
+    return check_table(lexer_list) + time_rules(lexer_list, size)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Check the lexer rules against catastrophic backtracking')
+    parser.add_argument('--size', type=int, help='characters of an adversarial text, default config.GUARD_SIZE')
+    args = parser.parse_args(argv)
+
+    found = False
+    checked = set()
+    for f_handler in config.FILE_HANDLER_LIST:
+        if id(f_handler.lexer_list) in checked:
+            continue
+        checked.add(id(f_handler.lexer_list))
+        for index, kind, detail in guard(f_handler.lexer_list, args.size):
+            lexer = f_handler.lexer_list[index]
+            sys.stderr.write('[%s] %s rule %d (%s) %s: %s\n' % (kind, f_handler.tag, index, lexer.tag, lexer.rule,
+                                                                detail))
+            found = True
+
+    return 1 if found else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,271 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+"""Engines matching the tokens of a text by a lexer list, and counting its lines by the tags of the tokens"""
+
+import logging
+import re
+from functools import reduce
+from time import perf_counter
+
+import config
+import counter
+from counter import LineCounter, TAG_LIST, tag_id
+from lexer import get_lexer_table
+from log import get_logger
+
+logger = get_logger()
+
+# Tokens matched between the checks of the deadline
+_DEADLINE_TOKENS = 256
+
+# Blank lines of a text, split by '\n' only
+_BLANK_LINE = re.compile(r'^[^\S\n]*$', re.M)
+
+
+def match(text, lexer_list, context):
+    """Cut out first matched string by multiple lexers
+    return the match result and the remain text
+    """
+
+    for lexer in lexer_list:
+        flags = lexer.flags if lexer.flags else 0
+        lexer_match = re.match(lexer.rule, text, flags)
+        if lexer_match:
+            # Get the counter tag
+            tag = lexer.tag
+            if lexer.condition:
+                condition_flag, condition_tag = lexer.condition
+                if context.get(condition_flag):
+                    tag = condition_tag
+
+            # Get the match result
+            match_result = lexer_match.group()
+            match_count = match_result.count('\n')
+
+            # Recognize space lines among a multi-line comment
+            if tag == config.LEX_COMMENT:
+                space_all = re.findall(r'(?<=\n)\s*?\n', match_result)
+                space_count = len(space_all) if space_all else 0
+                context.add(counter.SPACE, space_count)
+                match_count -= space_count
+
+            # Check line ending
+            ending_match = re.match(r'\s*?\n', text[len(match_result):], re.S)
+            if ending_match:
+                ending_str = ending_match.group()
+                match_result += ending_str
+                match_count += ending_str.count('\n')
+
+                # Recognize a code line ending with a comment as a code line,
+                #   and clear the unfinished code line flag
+                if context[counter.FLAG_CODE]:
+                    context.add(counter.CODE, 1)
+                    context[counter.FLAG_CODE] = None
+                    match_count -= 1
+
+            # Mark the unfinished code line
+            elif tag == config.LEX_CODE:
+                context.add(counter.FLAG_CODE, 1)
+
+            # Update the counter value
+            context.add(tag_id(tag), match_count)
+            logger.debug('[%s]: %s', tag, match_result)
+
+            # Update the stack status
+            if lexer.stack:
+                update_flag, update_count = lexer.stack
+                context.add(tag_id(update_flag), update_count, True)
+
+            return match_result
+
+    return None
+
+
+def match_at(text, pos, table, context, limit=None):
+    """Match the first token at a position of the text by a compiled lexer table
+    return the end position of the token, including its line ending,
+    or -1 without counting the token if it ends beyond the limit
+    """
+
+    lexer_match, rule = table.match(text, pos)
+    if lexer_match:
+        if limit is not None and lexer_match.end() > limit:
+            return -1
+
+        # Get the counter tag
+        tag = rule.tag
+        if rule.condition:
+            condition_flag, condition_tag = rule.condition
+            if context[condition_flag]:
+                tag = condition_tag
+
+        # Get the match result
+        end = lexer_match.end()
+        match_count = table.count_newlines(text, pos, end)
+
+        # Recognize space lines among a multi-line comment
+        if tag == counter.COMMENT:
+            space_count = len(table.space_in_comment.findall(text, pos + 1, end))
+            context.add(counter.SPACE, space_count)
+            match_count -= space_count
+
+        # Check line ending
+        ending_match = table.ending.match(text, end)
+        if ending_match:
+            ending_end = ending_match.end()
+            match_count += table.count_newlines(text, end, ending_end)
+            end = ending_end
+
+            # Recognize a code line ending with a comment as a code line,
+            #   and clear the unfinished code line flag
+            if context[counter.FLAG_CODE]:
+                context.add(counter.CODE, 1)
+                context[counter.FLAG_CODE] = None
+                match_count -= 1
+
+        # Mark the unfinished code line
+        elif tag == counter.CODE:
+            context.add(counter.FLAG_CODE, 1)
+
+        # Update the counter value
+        context.add(tag, match_count)
+
+        # Update the stack status
+        if rule.stack:
+            update_flag, update_count = rule.stack
+            context.add(update_flag, update_count, True)
+
+        return end
+
+    return None
+
+
+def _count_text_slice(text, lexer_list, context, deadline=None):
+    """Reference engine: cut the remain text after each matched token
+    return the remain text
+    """
+
+    remain = text
+    match_result = True
+    tokens = 0
+    while match_result and remain:
+        tokens += 1
+        if deadline and not tokens % _DEADLINE_TOKENS and perf_counter() > deadline:
+            raise TimeoutError()
+        match_result = match(remain, lexer_list, context)
+        if match_result:
+            remain = remain[len(match_result):]
+
+    return remain
+
+
+def _trace(text, pos, table, context):
+    """Log the token to match at a position"""
+
+    lexer_match, rule = table.match(text, pos)
+    if lexer_match:
+        tag = rule.tag
+        if rule.condition and context[rule.condition[0]]:
+            tag = rule.condition[1]
+        logger.debug('[%s]: %s', TAG_LIST[tag], text[pos:lexer_match.end()])
+
+
+def scan(text, table, context, pos, stop, limit=None, deadline=None):
+    """Match tokens from a position until reaching the stop position, or a token ending beyond the limit
+    return the position after the last token, and whether the scan is not stuck
+    raise TimeoutError once the deadline of perf_counter() passes, which is checked between tokens
+    """
+
+    # Check the log level once
+    trace = config.LOG_MODE == config.LOG_MODE_TRACE and logger.isEnabledFor(logging.DEBUG)
+
+    tokens = 0
+    while pos < stop:
+        tokens += 1
+        if deadline and not tokens % _DEADLINE_TOKENS and perf_counter() > deadline:
+            raise TimeoutError()
+        if trace:
+            _trace(text, pos, table, context)
+        end = match_at(text, pos, table, context, limit)
+        if end == -1:
+            break
+        if end is None or end == pos:
+            return pos, False
+        pos = end
+
+    return pos, True
+
+
+def _count_text_scan(text, lexer_list, context, deadline=None):
+    """Scanner engine: walk the immutable text by position
+    return the remain text
+    """
+
+    pos, _ = scan(text, get_lexer_table(lexer_list), context, 0, len(text), deadline=deadline)
+    return text[pos:]
+
+
+_ENGINES = {
+    config.ENGINE_SLICE: _count_text_slice,
+    config.ENGINE_SCAN: _count_text_scan,
+}
+
+
+def check_context(context, remain, text_line_count, problems=None):
+    """Check the counted context and set the total line count,
+    the problems found are appended to a 'problems' list as (error kind, message)
+    """
+
+    # Check remain text
+    if remain:
+        logger.debug('Remain: <<<%s>>>', remain)
+        if problems is not None:
+            problems.append((config.ERROR_REMAIN, 'Text left unmatched: %r' % remain[:64]))
+
+    # Check text line count
+    local_line_count = reduce(lambda a, b: a + b, (v for v in context if v is not None), 0)
+    if local_line_count != text_line_count:
+        logger.debug('Text Line Count: %d, Matched Line Count: %d', text_line_count, local_line_count)
+        if problems is not None:
+            problems.append((config.ERROR_LINES, 'Matched %d lines of %d' % (local_line_count, text_line_count)))
+
+    if not context[counter.TOTAL]:
+        context.add(counter.TOTAL, text_line_count)
+
+
+def count_text(text, lexer_list, engine=None, deadline=None, problems=None):
+    """Count a string of text
+    The inconsistencies found are appended to a 'problems' list as (error kind, message),
+    and TimeoutError is raised once the deadline of perf_counter() passes.
+    """
+
+    # Choose the engine
+    engine = engine if engine else config.ENGINE
+    if engine not in _ENGINES:
+        raise ValueError('Unknown engine: %s' % engine)
+
+    # Append a '\n' at the end
+    text += '\n'
+
+    # Match lexer list, after the tags of the lexers are registered
+    table = get_lexer_table(lexer_list)
+    context = LineCounter()
+    if engine == config.ENGINE_SCAN and table.line_tags:
+        add_lines(context, table.line_tags, text.count('\n'), len(_BLANK_LINE.findall(text, 0, len(text) - 1)))
+        remain = ''
+    else:
+        remain = _ENGINES[engine](text, lexer_list, context, deadline)
+
+    check_context(context, remain, text.count('\n'), problems)
+    return context
+
+
+def add_lines(context, line_tags, lines, blank_lines):
+    """Add up the lines classified by a table of 'line_tags'"""
+
+    blank_tag, other_tag = line_tags
+    if blank_lines:
+        context.add(blank_tag, blank_lines)
+    if lines - blank_lines:
+        context.add(other_tag, lines - blank_lines)
@@ -1,7 +1,18 @@
+import multiprocessing
+import os
 import re
 
-from code_count import count, get_data, dump_data
+import pytest
+
+import config
+from code_count import _size_batches, count, count_batch, count_entry, count_text
+from dir_tree import DirTree
+from dispatch import get_dispatch
+from dynamic_object import DynamicObject
+from lexer import get_lexer_table
 from log import get_logger
+from reader import count_lines, count_stream, CountError, read_bytes
+from result import dump_data, get_data
 from walk import walk, WalkHandler
 
 logger = get_logger()
@@ -327,6 +338,272 @@ def test_lua():
     # count_file('lua')
 
 
+def test_engine():
+    # Compare the scanner engine with the reference engine
+    root = os.path.dirname(os.path.abspath(__file__))
+    for f_handler in config.FILE_HANDLER_LIST:
+        for dir_path, _, file_names in os.walk(os.path.dirname(os.path.dirname(root))):
+            for file_name in file_names:
+                path = os.path.join(dir_path, file_name).replace('\\', '/')
+                if not re.match(f_handler.path, path.lower()):
+                    continue
+
+                text = test_read_file(path)
+                expected = count_text(text, f_handler.lexer_list, config.ENGINE_SLICE)
+                actual = count_text(text, f_handler.lexer_list, config.ENGINE_SCAN)
+                assert expected == actual, path
+
+
+def test_stream(monkeypatch):
+    # Compare the memory mapping mode with the whole file mode
+    monkeypatch.setattr(config, 'STREAM_TAIL_SIZE', 16)
+    root = os.path.dirname(os.path.abspath(__file__))
+    for f_handler in config.FILE_HANDLER_LIST:
+        for dir_path, _, file_names in os.walk(os.path.dirname(os.path.dirname(root))):
+            for file_name in file_names:
+                path = os.path.join(dir_path, file_name).replace('\\', '/')
+                if not re.match(f_handler.path, path.lower()):
+                    continue
+
+                actual = count_stream(path, f_handler.lexer_list)
+                expected = count_text(test_read_file(path), f_handler.lexer_list)
+                assert expected == actual, path
+
+
+def test_stream_rest(tmp_path, monkeypatch):
+    # The rest after the last character of content is copied in memory up to the tail size,
+    #   or else to a temporary file, and never read as a whole
+    texts = [
+        'a = [' + '1, ' * 2000 + ']',
+        'x = 1\n/* open\n' + 'comment\n\n' * 500,
+        'x = "open\\\n' + 'string\\\n' * 500,
+        'x = 1\n' + ' \n\t\n' * 1000,
+        '\n' * 2000,
+        'x = 1',
+    ]
+    for tail_size in (16, 1 << 16):
+        monkeypatch.setattr(config, 'STREAM_TAIL_SIZE', tail_size)
+        for text in texts:
+            path = tmp_path / 'a.c'
+            path.write_text(text)
+            assert count_stream(str(path), config.C_LIKE_LEXER_LIST) == \
+                count_text(text, config.C_LIKE_LEXER_LIST), (tail_size, text[:16])
+
+
+def test_stream_decode(tmp_path, monkeypatch):
+    # The files which are not plain UTF-8 are streamed by their transcoded text, and never read as a whole
+    monkeypatch.setattr(config, 'ENCODINGS', ['utf-8', 'cp1252'])
+    monkeypatch.setattr(config, 'STREAM_SIZE', 1)
+    monkeypatch.setattr(config, 'STREAM_TAIL_SIZE', 16)
+    monkeypatch.setattr(config, 'SPLIT_CHUNK_SIZE', 97)
+    monkeypatch.setattr('reader._LINE_BLOCK_SIZE', 7)
+
+    def _read_bytes(path, size=None, profiler=None):
+        assert size, 'Unexpected read of the whole file: %s' % path
+        return read_bytes(path, size, profiler)
+
+    monkeypatch.setattr('code_count.read_bytes', _read_bytes)
+    root = os.path.dirname(os.path.abspath(__file__))
+    text = ''.join((test_read_file(os.path.join(root, 'python', name))
+                    for name in sorted(os.listdir(os.path.join(root, 'python')))))
+    spaces = 'x = 1\u00a0\r\n\u00a0\r\n\x1c# \u3000 c\ry = "\u2028"\r'
+    cases = [('utf-8', text + spaces), ('utf-16', text + spaces), ('utf-8-sig', text + spaces),
+             ('cp1252', text + 'a = "\u00e9\u00a0"\r\n# caf\u00e9\r')]
+    with multiprocessing.Pool(2) as pool:
+        for encoding, case_text in cases:
+            for name, lexer_list in (('a.py', config.PYTHON_LEXER_LIST), ('a.md', config.TEXT_LEXER_LIST)):
+                path = str(tmp_path / name)
+                with open(path, 'wb') as file_out:
+                    file_out.write(case_text.encode(encoding))
+                expected = count_text(case_text.replace('\r\n', '\n').replace('\r', '\n'), lexer_list)
+                assert count_entry(path).line_counts == expected.items(), (encoding, name)
+            assert count_stream(path[:-2] + 'py', config.PYTHON_LEXER_LIST, pool=pool) == \
+                count_text(case_text.replace('\r\n', '\n').replace('\r', '\n'), config.PYTHON_LEXER_LIST), encoding
+
+    # A file which fails to decode, or to stream by rules of non-ASCII characters, is recorded as an error
+    monkeypatch.setattr(config, 'ENCODINGS', ['utf-8'])
+    assert count_entry(str(tmp_path / 'a.py')).error['kind'] == config.ERROR_DECODE
+    lexer_list = [DynamicObject(tag=config.LEX_CODE, rule='\u00e9?[^\n]*', flags=re.S)]
+    with pytest.raises(CountError):
+        count_stream(str(tmp_path / 'a.md'), lexer_list)
+
+
+def test_lines(tmp_path, monkeypatch):
+    # Compare the line classifier with the reference engine
+    table = get_lexer_table(config.TEXT_LEXER_LIST)
+    assert table.line_tags
+    monkeypatch.setattr(config, 'STREAM_SIZE', 16)
+    for text in ('', '\n', 'a', ' a \n\n \t\n', '\n\n# Title\n\ttext\n  \n', 'a\r\n\r\n b\x0c\n'):
+        expected = count_text(text, config.TEXT_LEXER_LIST, config.ENGINE_SLICE)
+        assert count_text(text, config.TEXT_LEXER_LIST) == expected, repr(text)
+
+        path = tmp_path / 'a.md'
+        path.write_bytes(text.encode('utf-8'))
+        actual, _ = count_lines(str(path), table)
+        assert actual == count_text(test_read_file(str(path)), config.TEXT_LEXER_LIST, config.ENGINE_SLICE), repr(text)
+
+    # Fall back to the text mode for the whitespaces out of ASCII
+    path.write_bytes(' \u3000\n'.encode('utf-8'))
+    assert count_lines(str(path), table) is None
+
+
+def test_decode(tmp_path, monkeypatch):
+    # Binary files are skipped, files without a BOM are decoded by the fallback chain,
+    #   and the files failing to decode are recorded as errors without stopping the count
+    monkeypatch.setattr(config, 'ENCODINGS', ['utf-8', 'cp1252'])
+    (tmp_path / 'binary.py').write_bytes(b'a = 1\n\0\n')
+    (tmp_path / 'latin.py').write_bytes('a = "\u00e9"\r\nb = 2\r\n'.encode('cp1252'))
+    (tmp_path / 'wide.py').write_bytes('# \u00e9\na = 1\n'.encode('utf-16'))
+    (tmp_path / 'wide.md').write_bytes('text\n\ntext\n'.encode('utf-8-sig'))
+    data = count(str(tmp_path))
+    python, markdown = get_data(data, 'Python'), get_data(data, 'Markdown')
+    assert get_data(python, config.LEX_CODE) == 3 and get_data(python, config.LEX_COMMENT) == 1
+    assert get_data(markdown, config.LEX_TEXT) == 2 and get_data(markdown, config.LEX_SPACE) == 2
+    assert get_data(data, config.TAG_ERROR) is None
+
+    monkeypatch.setattr(config, 'ENCODINGS', ['utf-8'])
+    data = count(str(tmp_path))
+    assert get_data(get_data(data, 'Python'), config.LEX_CODE) == 1
+    errors = get_data(data, config.TAG_ERROR)
+    assert [error['kind'] for error in errors] == [config.ERROR_DECODE] and errors[0]['path'].endswith('/latin.py')
+
+    # The bytes which are not UTF-8 are counted as the text decoded by the fallback, not as raw bytes
+    monkeypatch.setattr(config, 'ENCODINGS', ['utf-8', 'cp1252'])
+    for streamed in (False, True):
+        monkeypatch.setattr(config, 'STREAM_SIZE', 1 if streamed else 0)
+        for name, lexer_list in (('fallback.md', config.TEXT_LEXER_LIST), ('fallback.py', config.PYTHON_LEXER_LIST)):
+            data = b'hello\n \xa0 \ncaf\xe9\n'
+            (tmp_path / name).write_bytes(data)
+            expected = count_text(data.decode('cp1252'), lexer_list).items()
+            assert count_entry(str(tmp_path / name)).line_counts == expected, (name, streamed)
+
+
+def test_errors(tmp_path, monkeypatch):
+    # The inconsistencies of the lexers are found as problems
+    problems = list()
+    count_text('a\nb', [DynamicObject(tag=config.LEX_CODE, rule=r'a\n')], problems=problems)
+    assert problems[0] == (config.ERROR_REMAIN, "Text left unmatched: 'b\\n'")
+
+    # Files failing to count are recorded, and the other files are still counted, in both serial and parallel modes
+    (tmp_path / 'brackets.py').write_text('x = (\n')
+    (tmp_path / 'long.py').write_text('x = 1\n' * 1000)
+    (tmp_path / 'ok.md').write_text('text\n')
+    monkeypatch.setattr(config, 'FILE_TIMEOUT', 1e-9)
+    for workers in (1, 2):
+        data = count(str(tmp_path), workers=workers)
+        errors = get_data(data, config.TAG_ERROR)
+        assert [(error['path'].rsplit('/', 1)[-1], error['kind']) for error in errors] == \
+            [('brackets.py', config.ERROR_TAG), ('long.py', config.ERROR_TIMEOUT)]
+        assert get_data(get_data(data, 'Markdown'), config.LEX_TEXT) == 1 and get_data(data, 'Python') is None
+
+    monkeypatch.setattr(config, 'FILE_SIZE_LIMIT', 8)
+    errors = get_data(count(str(tmp_path)), config.TAG_ERROR)
+    assert [error['kind'] for error in errors] == [config.ERROR_TAG, config.ERROR_SIZE]
+
+    # The exit error mode exits on the lexer tags left, with the error record, in both serial and parallel modes
+    monkeypatch.setattr(config, 'ERROR_MODE', config.ERROR_MODE_EXIT)
+    with pytest.raises(SystemExit):
+        count(str(tmp_path / 'brackets.py'))
+    for workers in (1, 2):
+        with pytest.raises(SystemExit) as exit_info:
+            count(str(tmp_path), workers=workers)
+        assert exit_info.value.code is None
+        assert exit_info.value.record['path'].endswith('/brackets.py'), workers
+        assert exit_info.value.record['kind'] == config.ERROR_TAG
+
+
+def test_parallel():
+    # Compare the parallel mode with the serial mode
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    assert dump_data(count(root, workers=2)) == dump_data(count(root))
+
+
+def test_batch(monkeypatch):
+    root = os.path.dirname(os.path.abspath(__file__))
+    roots = [root + '/python', root + '/java', root + '/lua']
+    for workers in (1, 2):
+        results, total = count_batch(roots, workers=workers)
+        assert [dump_data(data) for data in results] == [dump_data(count(path)) for path in roots]
+        assert get_data(get_data(total, 'All'), 'Total') == \
+               sum((get_data(get_data(data, 'All'), 'Total') for data in results))
+
+    # The same path counted twice is a duplicate in the data of all paths only
+    monkeypatch.setattr(config, 'DEDUP_REPORT', True)
+    for workers in (1, 2):
+        results, total = count_batch(roots[:1] * 2, workers=workers)
+        assert get_data(results[0], config.TAG_DUPLICATE) is None and get_data(results[1], config.TAG_DUPLICATE) is None
+        assert get_data(get_data(total, config.TAG_DUPLICATE), 'Total') == \
+               get_data(get_data(results[0], 'All'), 'Total')
+
+    # The largest files come first, and a file larger than the bytes of a batch is a batch alone
+    monkeypatch.setattr(config, 'PARALLEL_BATCH_SIZE', 2)
+    monkeypatch.setattr(config, 'PARALLEL_BATCH_BYTES', 100)
+    assert _size_batches(range(6), [10, 500, 30, 20, 40, 60]) == [[1], [5, 4], [2, 3], [0]]
+
+
+def test_parallel_settings(monkeypatch):
+    # The overridden settings are reapplied in the workers, also in spawned ones which import config afresh
+    monkeypatch.setattr(multiprocessing, 'Pool', multiprocessing.get_context('spawn').Pool)
+    monkeypatch.setattr(config, 'FILE_SIZE_LIMIT', 1000)
+    root = os.path.dirname(os.path.abspath(__file__))
+    data = count(root, workers=2)
+    assert get_data(data, config.TAG_ERROR)
+    assert dump_data(data) == dump_data(count(root))
+
+
+def test_split(tmp_path, monkeypatch):
+    # Lex large files by chunks across the workers, with the chunks split inside comments, strings and brackets
+    monkeypatch.setattr(config, 'STREAM_SIZE', 1)
+    monkeypatch.setattr(config, 'STREAM_TAIL_SIZE', 16)
+    monkeypatch.setattr(config, 'SPLIT_SIZE', 4096)
+    monkeypatch.setattr(config, 'SPLIT_CHUNK_SIZE', 97)
+    monkeypatch.setattr('reader._SEGMENT_SIZE', 13)
+    root = os.path.dirname(os.path.abspath(__file__))
+    texts = {
+        ('python', 'py'): '"""a\n\nb"""\nx = (1,\n\n     2)\n\n\n',
+        ('java', 'java'): '/* a\n\nb */\nx = "s\\\n\nt"; // c\n\nf(a,\n\n  b);\n\n',
+        ('lua', 'lua'): '--[[ a\n\nb ]]\nx = [[s\n\nt]]\n\n',
+    }
+    for (name, extension), text in texts.items():
+        for file_name in sorted(os.listdir(os.path.join(root, name))):
+            text += test_read_file(os.path.join(root, name, file_name))
+        (tmp_path / ('big.' + extension)).write_text(text * 20)
+
+    with multiprocessing.Pool(2) as pool:
+        for path in sorted(tmp_path.iterdir()):
+            lexer_list = get_dispatch().handler(str(path)).lexer_list
+            expected = count_text(test_read_file(str(path)), lexer_list)
+            assert count_stream(str(path), lexer_list, pool=pool) == expected, path
+
+    assert dump_data(count(str(tmp_path), workers=2)) == dump_data(count(str(tmp_path)))
+
+
+def test_dir_tree():
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    dir_tree = DirTree()
+    assert dump_data(count(root, dir_tree=dir_tree)) == dump_data(count(root))
+
+    # Each directory has the data of counting it alone
+    for sub_path in ('test', 'test/code_count', 'test/code_count/lua'):
+        assert dump_data(dir_tree.data(sub_path)) == dump_data(count(root + '/' + sub_path))
+    assert dump_data(dir_tree.data(root + '/test/')) == dump_data(dir_tree.data('test'))
+    assert dir_tree.data('test/code_count/missing') is None
+    dir_paths = [path for path, _ in dir_tree.iter_dirs()]
+    assert dir_paths[0] == '' and dir_paths.index('test') < dir_paths.index('test/code_count/lua')
+
+    # Same in the parallel mode
+    parallel_tree = DirTree()
+    count(root, workers=2, dir_tree=parallel_tree)
+    assert [(path, dump_data(parallel_tree.data(path))) for path, _ in parallel_tree.iter_dirs()] == \
+           [(path, dump_data(dir_tree.data(path))) for path, _ in dir_tree.iter_dirs()]
+
+    # The directories deeper than the max depth are added up to their ancestor
+    capped_tree = DirTree(max_depth=1)
+    count(root, dir_tree=capped_tree)
+    assert dump_data(capped_tree.data('test')) == dump_data(dir_tree.data('test'))
+    assert capped_tree.data('test/code_count') is None
+
+
 def test_root():
     count('../..')
 
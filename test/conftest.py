@@ -0,0 +1,8 @@
+import pytest
+
+from test.git_helpers import init_repo
+
+
+@pytest.fixture
+def repo(tmp_path):
+    return init_repo(tmp_path / 'repo')
@@ -0,0 +1,30 @@
+import subprocess
+
+from git_count import git
+
+
+def write_file(path, text):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(str(path), 'w') as file_out:
+        file_out.write(text)
+
+
+def git_commit(repo, message):
+    git(repo, 'add', '-A')
+    git(repo, '-c', 'user.name=test', '-c', 'user.email=test@example.com', 'commit', '-q', '-m', message)
+    return git(repo, 'rev-parse', 'HEAD').decode('ascii').strip()
+
+
+def init_repo(root):
+    """Create a repository of a few files, with an ignored folder, and commit them"""
+
+    root.mkdir()
+    subprocess.run(['git', 'init', '-q', str(root)], check=True)
+    write_file(root / '.gitignore', 'build/\n')
+    write_file(root / 'a.py', '# a\n\nx = 1\n')
+    write_file(root / 'test' / 'b.py', 'y = [\n    1,\n]\n')
+    write_file(root / 'c.lua', '-- c\nz = 3\n')
+    write_file(root / 'd.java', '/* d */\nint d = 4;\n')
+    write_file(root / 'build' / 'e.py', 'ignored = 5\n')
+    git_commit(str(root), 'first')
+    return root
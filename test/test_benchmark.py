@@ -0,0 +1,23 @@
+from benchmark import SYNTAX_LIST, compare, generate_corpus, generate_text, run_benchmarks
+
+
+def test_generate_text():
+    for syntax in SYNTAX_LIST:
+        text = generate_text(syntax, 'long', 100)
+        assert text == generate_text(syntax, 'long', 100)
+        assert text.count('\n') >= 100
+
+
+def test_run_benchmarks(tmp_path):
+    files = generate_corpus(str(tmp_path), scale=0.01)
+    current = run_benchmarks(str(tmp_path), repeat=1)
+
+    results = current['results']
+    assert results['walk/tree']['files'] == files
+    assert results['count/tree']['lines'] > 0
+    assert all((record['seconds'] >= 0 for record in results.values()))
+
+    # Fail on a regression beyond the tolerance
+    assert compare(current, current) == []
+    baseline = {'results': {'walk/tree': {'files_per_sec': results['walk/tree']['files_per_sec'] * 2}}}
+    assert [name for name, _, _, _ in compare(baseline, current)] == ['walk/tree']
@@ -0,0 +1,71 @@
+import os
+
+import code_count
+import config
+from cache import ResultCache, rules_version
+from code_count import count
+from result import dump_data
+
+
+def _write(path, text):
+    with open(str(path), 'w') as file_out:
+        file_out.write(text)
+
+
+def test_cache(tmp_path, monkeypatch):
+    root = tmp_path / 'src'
+    root.mkdir()
+    _write(root / 'a.py', '# a\n\nx = 1\n')
+    _write(root / 'b.lua', '-- b\ny = 2\n')
+    expected = dump_data(count(str(root)))
+
+    with ResultCache(str(tmp_path / 'cache.sqlite3')) as cache:
+        assert dump_data(count(str(root), cache=cache)) == expected
+
+    # Count again without lexing
+    def _count_text(*_):
+        raise AssertionError('Unexpected lexing')
+
+    with monkeypatch.context() as patch:
+        patch.setattr(code_count, 'count_text', _count_text)
+        with ResultCache(str(tmp_path / 'cache.sqlite3')) as cache:
+            assert dump_data(count(str(root), cache=cache)) == expected
+            assert dump_data(count(str(root), workers=2, cache=cache)) == expected
+
+    # Count the changed file only, and evict the deleted file
+    _write(root / 'a.py', '# a\n\nx = 1\ny = 2\n')
+    os.remove(str(root / 'b.lua'))
+    stat = os.stat(str(root / 'a.py'))
+    os.utime(str(root / 'a.py'), ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+    with ResultCache(str(tmp_path / 'cache.sqlite3')) as cache:
+        assert dump_data(count(str(root), cache=cache)) == dump_data(count(str(root)))
+        assert cache.connection.execute('SELECT COUNT(*) FROM file').fetchone()[0] == 1
+
+
+def test_cache_hash(tmp_path):
+    path = tmp_path / 'a.py'
+    _write(path, '# a\n')
+
+    with ResultCache(str(tmp_path / 'cache.sqlite3'), use_hash=True) as cache:
+        entry, stamp = cache.get(str(path))
+        assert entry is None
+        cache.put(str(path), stamp, 'Python', [('Comment', 1), ('Total', 1)])
+
+        # Touch the file without changing the content
+        os.utime(str(path), ns=(stamp[1], stamp[1] + 1000000000))
+        entry, _ = cache.get(str(path))
+        assert entry == ('Python', [('Comment', 1), ('Total', 1)])
+
+
+def test_rules_version(monkeypatch):
+    version = rules_version()
+
+    # The ignore rules don't change the counts of the files looked up
+    monkeypatch.setattr(config, 'IGNORED_FILES', set(config.IGNORED_FILES) | {r'.*\.lua'})
+    assert rules_version() == version
+
+    monkeypatch.setattr(config, 'ENCODINGS', ['cp1252'])
+    assert rules_version() != version
+    version = rules_version()
+    monkeypatch.setattr(config, 'SNIFF_SIZE', 16)
+    assert rules_version() != version
@@ -0,0 +1,42 @@
+import json
+import os
+import subprocess
+import sys
+
+import config
+from cli import main
+from code_count import count
+from result import dump_data
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'code_count')
+
+
+def test_main(tmp_path, monkeypatch, capsys):
+    for name in ('ENGINE', 'IGNORED_FILES', 'IGNORED_FOLDERS', 'LOG_MODE', 'LOG_LEVEL', 'PREFETCH_THREADS'):
+        monkeypatch.setattr(config, name, getattr(config, name))
+
+    assert main([ROOT + '/python', '--quiet']) == 0
+    assert capsys.readouterr().out == dump_data(count(ROOT + '/python')).lstrip('\n') + '\n'
+
+    # Only the Lua files except 1.lua, with the records of files and the directory tree
+    files, tree = str(tmp_path / 'files.jsonl'), str(tmp_path / 'tree.json')
+    assert main([ROOT, '--format', 'json', '--include', '*.lua', '--exclude', '*/1.lua', '--engine', 'slice',
+                 '--prefetch', '2', '--files', files, '--tree', tree, '--depth', '1']) == 0
+    data = json.loads(capsys.readouterr().out)
+    assert set(data) == {config.TAG_ALL, config.TAG_TEST, 'Lua'}
+    with open(files, 'r') as file_in:
+        records = [json.loads(line) for line in file_in]
+    assert sorted((os.path.basename(record['path']) for record in records)) == ['2.lua', '3.lua', '4.lua', '5.lua']
+    assert sum((record['Total'] for record in records)) == data['Lua']['Total']
+    with open(tree, 'r') as file_in:
+        assert json.load(file_in)['data']['Lua'] == data['Lua']
+    assert config.ENGINE == config.ENGINE_SLICE and config.PREFETCH_THREADS == 2
+
+
+def test_lazy_imports():
+    # The counting modules are not imported to parse the arguments
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    code = 'import sys, cli; cli.build_parser().parse_args([]); print(sorted(set(sys.modules) & {%s}))' % \
+           ', '.join((repr(name) for name in ('code_count', 'lexer', 'multiprocessing', 'export')))
+    output = subprocess.run([sys.executable, '-c', code], cwd=root, stdout=subprocess.PIPE, check=True).stdout
+    assert output.decode('ascii').strip() == '[]'
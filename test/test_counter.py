@@ -0,0 +1,31 @@
+import copy
+import pickle
+
+import pytest
+
+import config
+from counter import LineCounter, TAG_LIST, tag_id
+
+
+def test_line_counter():
+    before = LineCounter([(config.LEX_CODE, 1)])
+    tag_id('Test Counter Tag')
+    after = LineCounter([(config.LEX_CODE, 1)])
+
+    # Counters of the same counts are equal, whichever tags were registered when they were created
+    assert len(before) < len(after)
+    assert before == after and not before != after
+    assert before != LineCounter([(config.LEX_CODE, 2)])
+    assert before != [(config.LEX_CODE, 1)]
+
+    # Looking up an unknown tag doesn't register it
+    assert before.get('Unknown Counter Tag', 0) == 0
+    assert 'Unknown Counter Tag' not in TAG_LIST
+    assert after.get(config.LEX_CODE) == 1
+
+    assert pickle.loads(pickle.dumps(after)) == after and copy.copy(after) == after
+
+    with pytest.raises(TypeError):
+        before + after
+    with pytest.raises(TypeError):
+        before.append(1)
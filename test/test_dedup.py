@@ -0,0 +1,47 @@
+import config
+from code_count import count
+from dedup import ResultMemo
+from result import get_data
+
+
+def _write(path, text):
+    with open(str(path), 'w') as file_out:
+        file_out.write(text)
+
+
+def test_memo():
+    memo = ResultMemo(size=2)
+
+    # The first text of a size is not hashed
+    assert memo.key('Python', 'a = 1\n') is None
+    key = memo.key('Python', 'b = 2\n')
+    assert key == memo.key('Python', 'b = 2\n') != memo.key('Lua', 'b = 2\n')
+
+    memo.put(key, 'b')
+    assert memo.get(key) == 'b' and memo.hits == 1
+
+    # The least recently used result is dropped
+    memo.put(('Python', 1, 'c'), 'c')
+    memo.get(key)
+    memo.put(('Python', 1, 'd'), 'd')
+    assert memo.get(key) == 'b' and memo.get(('Python', 1, 'c')) is None
+
+
+def test_dedup(tmp_path, monkeypatch):
+    text = '# vendored\nx = 1\n\ny = 2\n'
+    for index in range(4):
+        (tmp_path / str(index)).mkdir()
+        _write(tmp_path / str(index) / 'a.py', text)
+    _write(tmp_path / 'b.py', 'z = 3\n')
+
+    lines = get_data(get_data(count(str(tmp_path / '0')), config.TAG_ALL), config.LEX_TOTAL)
+    data = count(str(tmp_path))
+    assert get_data(get_data(data, config.TAG_ALL), config.LEX_TOTAL) == 4 * lines + 2
+    assert get_data(data, config.TAG_DUPLICATE) is None
+
+    monkeypatch.setattr(config, 'DEDUP_REPORT', True)
+    for workers in (1, 2):
+        data = count(str(tmp_path), workers)
+        assert get_data(get_data(data, config.TAG_ALL), config.LEX_TOTAL) == 4 * lines + 2
+        assert get_data(get_data(data, config.TAG_DUPLICATE), config.LEX_TOTAL) == 3 * lines
+        assert get_data(get_data(data, config.TAG_DUPLICATE), config.LEX_CODE) == 3 * 2
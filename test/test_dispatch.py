@@ -0,0 +1,43 @@
+import re
+
+import config
+from code_count import count_path
+from dispatch import FileDispatch, get_dispatch
+from dynamic_object import DynamicObject
+
+
+def _match_handler(path):
+    """Match the handlers one by one as the reference"""
+
+    if any((re.match(i_rule, path) for i_rule in config.IGNORED_FILES)):
+        return None
+    return next((f_handler for f_handler in config.FILE_HANDLER_LIST if re.match(f_handler.path, path.lower())), None)
+
+
+def test_dispatch():
+    dispatch = get_dispatch()
+    assert dispatch is get_dispatch()
+    assert not dispatch.fallback
+
+    for path in ('a.py', 'dir/A.PY', 'dir/a.py/b', 'a.h', 'a.c', 'a.cc', 'a.cpp', 'dir.java/a', '.md', 'a',
+                 'dir/.DS_Store', 'a.tar.gz', 'dir/a.cs', 'a.lua.bak'):
+        assert dispatch.handler(path) is _match_handler(path), path
+
+    # Unsupported files are skipped without any I/O
+    assert count_path('/not/found/image.png') is None
+
+
+def test_fallback():
+    handler_list = [
+        DynamicObject(tag='Build', path=r'.*/build\.py$'),
+        DynamicObject(tag='Python', path=r'.*\.py$'),
+        DynamicObject(tag='Makefile', path=r'.*/makefile$'),
+    ]
+    dispatch = FileDispatch(handler_list, {r'.*\.min\.py'})
+    assert len(dispatch.fallback) == 2
+
+    assert dispatch.handler('dir/build.py').tag == 'Build'
+    assert dispatch.handler('dir/main.py').tag == 'Python'
+    assert dispatch.handler('dir/Makefile').tag == 'Makefile'
+    assert dispatch.handler('dir/main.min.py') is None
+    assert dispatch.handler('dir/main.js') is None
@@ -0,0 +1,119 @@
+import csv
+import io
+import json
+import multiprocessing
+import os
+
+import config
+from code_count import count, count_entry, FileEntry
+from dir_tree import DirTree
+from export import COLUMNS, ColumnarExporter, CsvExporter, iter_columnar, JsonlExporter, open_exporter, write_tree
+from result import dump_data, get_data
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'code_count')
+
+
+def _expected():
+    records = list()
+    for name in sorted(os.listdir(ROOT + '/python')):
+        entry = count_entry(ROOT + '/python/' + name)
+        line_counts = dict(entry.line_counts)
+        records.append(dict(zip(COLUMNS, [ROOT + '/python/' + name, 'Python'] +
+                                [line_counts.get(tag, 0) for tag in COLUMNS[2:-1]] + [None])))
+    return records
+
+
+def test_exporters(tmp_path):
+    expected = _expected()
+    error = FileEntry(None, [], None, {'path': 'x.py', 'kind': 'decode', 'message': 'Failed'})
+
+    buffer = io.StringIO()
+    with JsonlExporter(buffer) as exporter:
+        for record in expected:
+            exporter.add(record['path'], count_entry(record['path']))
+        exporter.add('x.py', error)
+        exporter.add('y.bin', FileEntry(None, [], None, None))
+    records = [json.loads(line) for line in buffer.getvalue().splitlines()]
+    assert records[:-1] == expected
+    assert records[-1] == dict(zip(COLUMNS, ['x.py'] + [None] * 6 + ['decode']))
+
+    buffer = io.StringIO()
+    with CsvExporter(buffer) as exporter:
+        exporter.add(expected[0]['path'], count_entry(expected[0]['path']))
+    rows = list(csv.reader(io.StringIO(buffer.getvalue())))
+    assert rows == [COLUMNS, [str(value) if value is not None else '' for value in expected[0].values()]]
+
+    # Blocks of 2 records, with a path sharing no prefix and a failed file
+    buffer = io.BytesIO()
+    with ColumnarExporter(buffer, block_rows=2) as exporter:
+        for record in expected:
+            exporter.add(record['path'], count_entry(record['path']))
+        exporter.add('x.py', error)
+    buffer.seek(0)
+    assert list(iter_columnar(buffer)) == expected + [records[-1]]
+
+
+def test_count_export(tmp_path):
+    total = get_data(get_data(count(ROOT), 'All'), 'Total')
+    for name in ('files.csv', 'files.jsonl', 'files.col'):
+        results = list()
+        for workers in (1, 2):
+            with open_exporter(str(tmp_path / name)) as exporter:
+                count(ROOT, workers=workers, exporter=exporter)
+            if name.endswith('.col'):
+                with open(str(tmp_path / name), 'rb') as file_in:
+                    records = list(iter_columnar(file_in))
+            elif name.endswith('.jsonl'):
+                with open(str(tmp_path / name), 'r') as file_in:
+                    records = [json.loads(line) for line in file_in]
+            else:
+                with open(str(tmp_path / name), 'r') as file_in:
+                    records = list(csv.DictReader(file_in))
+            assert sum((int(record['Total']) for record in records)) == total
+            assert sorted((record for record in records if record['path'].startswith(ROOT + '/python/')),
+                          key=lambda record: record['path']) == \
+                   (_expected() if not name.endswith('.csv') else
+                    [dict(((key, str(value)) if value is not None else (key, '') for key, value in record.items()))
+                     for record in _expected()])
+            results.append(records)
+
+        # The records of the parallel mode are in the walk order too
+        assert results[0] == results[1]
+
+
+def test_parallel_export(monkeypatch):
+    # The parallel mode merges and exports the entries while the workers are counting, instead of holding them all
+    monkeypatch.setattr(config, 'PARALLEL_BATCH_SIZE', 1)
+    exported, merged = list(), list()
+
+    class _Exporter(object):
+        def add(self, *_):
+            exported.append(len(multiprocessing.active_children()))
+
+    class _DirTree(DirTree):
+        def add(self, *args):
+            merged.append(len(multiprocessing.active_children()))
+            DirTree.add(self, *args)
+
+    dir_tree = _DirTree()
+    count(ROOT, workers=2, dir_tree=dir_tree, exporter=_Exporter())
+    assert len(merged) == len(exported) > 2 and merged[0] == exported[0] == 2
+    assert dump_data(dir_tree.data()) == dump_data(count(ROOT))
+
+
+def test_write_tree():
+    root = os.path.dirname(ROOT)
+    dir_tree = DirTree()
+    count(root, dir_tree=dir_tree)
+    buffer = io.StringIO()
+    write_tree(dir_tree, buffer)
+
+    tree = json.loads(buffer.getvalue())
+    assert tree['path'] == '' and tree['name'] == root
+    assert tree['data']['All']['Total'] == get_data(get_data(count(root), 'All'), 'Total')
+
+    # Nested by the directories
+    code_count = next((child for child in tree['children'] if child['name'] == 'code_count'))
+    python = next((child for child in code_count['children'] if child['name'] == 'python'))
+    assert python['path'] == 'code_count/python' and python['children'] == []
+    assert python['data']['Python'] == dict(dir_tree.totals('code_count/python')['Python'].items())
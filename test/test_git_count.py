@@ -0,0 +1,69 @@
+import config
+from code_count import count
+from git_count import BlobReader, Revision, count_revision, count_worktree, list_files
+from result import data_tag, get_data
+from test.git_helpers import git_commit, write_file
+
+
+def _normalize(data):
+    return dict(((data_tag(key), value.to_dict()) for key, value in data.to_dict().items()))
+
+
+def test_worktree(repo):
+    assert [path.rsplit('/', 1)[-1] for path in list_files(str(repo))] == ['.gitignore', 'a.py', 'c.lua', 'd.java',
+                                                                           'b.py']
+    data = count_worktree(str(repo))
+    assert get_data(get_data(data, 'Python'), config.LEX_TOTAL) == 8
+    assert _normalize(count_worktree(str(repo), workers=2)) == _normalize(data)
+
+
+def test_revision(repo, tmp_path):
+    first = count_revision(str(repo))
+    assert sorted(first.entries) == ['a.py', 'c.lua', 'd.java', 'test/b.py']
+
+    # The same data as counting a checkout of the revision, without the ignored files
+    (repo / 'build' / 'e.py').unlink()
+    assert _normalize(first.data()) == _normalize(count(str(repo)))
+
+    # Count the changed blobs only
+    write_file(repo / 'a.py', '# a\n\nx = 1\ny = 2\n')
+    write_file(repo / 'f.py', '# a\n\nx = 1\n')
+    (repo / 'c.lua').unlink()
+    git_commit(str(repo), 'second')
+
+    blob_ids = list()
+    read = BlobReader.read
+    BlobReader.read = lambda self, blob_id: blob_ids.append(blob_id) or read(self, blob_id)
+    try:
+        second = count_revision(str(repo), 'HEAD', first)
+    finally:
+        BlobReader.read = read
+    assert len(blob_ids) == 1
+    assert second.entries['f.py'] == first.entries['a.py']
+    assert _normalize(second.data()) == _normalize(count_revision(str(repo)).data())
+    assert _normalize(second.data()) == _normalize(count(str(repo)))
+
+    # Dump and load a revision
+    second.dump(str(tmp_path / 'second.json'))
+    loaded = Revision.load(str(repo), str(tmp_path / 'second.json'))
+    assert loaded.commit == second.commit and loaded.entries == second.entries
+
+
+def test_revision_errors(repo, monkeypatch, tmp_path):
+    # Binary blobs are skipped, and the blobs failing to decode are recorded until they change
+    monkeypatch.setattr(config, 'ENCODINGS', ['utf-8'])
+    (repo / 'g.py').write_bytes(b'x = 1\n\0')
+    (repo / 'h.py').write_bytes(b'x = "\xe9"\n')
+    first = count_revision(str(repo), git_commit(str(repo), 'errors'))
+    assert 'g.py' not in first.entries and 'h.py' not in first.entries
+    assert [error['kind'] for error in get_data(first.data(), config.TAG_ERROR)] == [config.ERROR_DECODE]
+
+    first.dump(str(tmp_path / 'first.json'))
+    write_file(repo / 'a.py', 'x = 2\n')
+    previous = Revision.load(str(repo), str(tmp_path / 'first.json'))
+    second = count_revision(str(repo), git_commit(str(repo), 'second'), previous)
+    assert list(second.errors) == ['h.py']
+
+    (repo / 'h.py').write_bytes(b'x = 1\n')
+    third = count_revision(str(repo), git_commit(str(repo), 'third'), second)
+    assert not third.errors and 'h.py' in third.entries
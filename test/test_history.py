@@ -0,0 +1,56 @@
+import csv
+import json
+
+import config
+import git_count
+from git_count import count_revision
+from history import commit_rows, list_commits, sweep
+from test.git_helpers import git_commit, write_file
+
+
+def _rows(path):
+    with open(str(path), 'r') as file_in:
+        return list(csv.reader(file_in))
+
+
+def test_sweep(repo, tmp_path, monkeypatch):
+    write_file(repo / 'a.py', '# a\n\nx = 1\ny = 2\n')
+    git_commit(str(repo), 'second')
+    write_file(repo / 'a.py', '# a\n\nx = 1\n')
+    (repo / 'c.lua').unlink()
+    git_commit(str(repo), 'third')
+    commits = list_commits(str(repo))
+    assert len(commits) == 3
+
+    # Each version of a file is lexed once
+    lexed = list()
+    count_text = git_count.count_text
+    monkeypatch.setattr(git_count, 'count_text',
+                        lambda text, lexer_list, **kwargs: lexed.append(text) or count_text(text, lexer_list, **kwargs))
+    output = tmp_path / 'history.csv'
+    assert sweep(str(repo), str(output)) == 3
+    assert len(lexed) == 5
+
+    rows = _rows(output)
+    expected = [[str(value) for value in row] for commit, time in commits
+                for row in commit_rows(commit, time, count_revision(str(repo), commit).totals())]
+    assert rows[0][:3] == ['commit', 'time', 'tag']
+    assert rows[1:] == expected
+    assert [row[2] for row in rows[1:8]] == ['Java', 'Lua', 'Python', 'Test', config.TAG_ALL, 'Java', 'Lua']
+
+    # Resume after the last complete commit
+    with open(str(output), 'r') as file_in:
+        lines = file_in.readlines()
+    with open(str(output), 'w') as file_out:
+        file_out.writelines(lines[:8])
+        file_out.write(lines[8][:5])
+    assert sweep(str(repo), str(output)) == 2
+    assert _rows(output) == rows
+    assert sweep(str(repo), str(output)) == 0
+
+    # JSONL rows
+    output = tmp_path / 'history.jsonl'
+    assert sweep(str(repo), str(output), 'HEAD~1') == 2
+    with open(str(output), 'r') as file_in:
+        row = json.loads(file_in.readline())
+    assert row['commit'] == commits[0][0] and row['tag'] == 'Java' and row[config.LEX_CODE] == 1
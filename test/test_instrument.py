@@ -0,0 +1,28 @@
+import os
+
+import config
+from code_count import count
+from instrument import PHASE_COUNT, PHASE_READ, PHASE_WALK, Profiler
+from result import dump_data
+
+
+def test_profiler():
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'code_count')
+    profiler = Profiler(slowest=3)
+
+    # Count the same data as without profiling
+    assert dump_data(count(root, profiler=profiler)) == dump_data(count(root))
+
+    report = profiler.report()
+    assert set(report['phases']) == {PHASE_WALK, PHASE_READ, PHASE_COUNT}
+    assert all((seconds >= 0 for seconds in report['phases'].values()))
+    assert len(report['slowest']) == 3
+    assert report['slowest'][0][1] >= report['slowest'][-1][1]
+
+    # Every token is a hit of a rule
+    python_rules = report['rules']['Python']
+    assert len(python_rules) == len(config.PYTHON_LEXER_LIST)
+    assert sum((rule['hits'] for rule in python_rules)) > 0
+    assert all((rule['attempts'] >= rule['hits'] for rule in python_rules))
+
+    assert 'Slowest files:' in profiler.dump()
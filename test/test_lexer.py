@@ -0,0 +1,48 @@
+import re
+
+import config
+from dynamic_object import DynamicObject
+from lexer import LexerTable, get_lexer_table
+
+
+def test_merged_table():
+    for f_handler in config.FILE_HANDLER_LIST:
+        table = get_lexer_table(f_handler.lexer_list)
+        assert table.pattern is not None, f_handler.tag
+        assert table is get_lexer_table(f_handler.lexer_list)
+
+
+def test_match_order():
+    lexer_list = [
+        DynamicObject(tag='A', rule=r'(?P<_1>a)b(?P=_1)'),
+        DynamicObject(tag='B', rule=r'(?P<_1>a)b', flags=re.S),
+        DynamicObject(tag='C', rule=r'.*?(?=\n)', flags=re.S),
+    ]
+    table = LexerTable(lexer_list)
+    assert table.pattern is not None
+
+    for text, tag, end in (('aba\n', 'A', 3), ('abc\n', 'B', 2), ('xyz\n', 'C', 3)):
+        lexer_match, rule = table.match(text, 0)
+        assert rule.lexer.tag == tag and lexer_match.end() == end
+
+
+def test_unmergeable_table():
+    table = LexerTable([DynamicObject(tag='A', rule=r'(a)\1'), DynamicObject(tag='B', rule=r'a')])
+    assert table.pattern is None
+
+    lexer_match, rule = table.match('xaa', 1)
+    assert rule.lexer.tag == 'A' and lexer_match.end() == 3
+
+
+def test_table_refresh():
+    lexer_list = [DynamicObject(tag='A', rule=r'a')]
+    table = get_lexer_table(lexer_list)
+
+    lexer_list.append(DynamicObject(tag='B', rule=r'b'))
+    assert get_lexer_table(lexer_list) is not table
+
+
+def test_line_tags():
+    assert get_lexer_table(config.TEXT_LEXER_LIST).line_tags
+    assert not get_lexer_table(config.PYTHON_LEXER_LIST).line_tags
+    assert not LexerTable(list(reversed(config.TEXT_LEXER_LIST))).line_tags
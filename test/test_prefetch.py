@@ -0,0 +1,53 @@
+import os
+
+import pytest
+
+import config
+from code_count import count
+from dir_tree import DirTree
+from prefetch import Prefetcher
+from result import dump_data
+
+
+def test_prefetcher(tmp_path):
+    paths = list()
+    for index in range(50):
+        path = tmp_path / ('%d.txt' % index)
+        path.write_bytes(b'x' * 10 * (index % 5))
+        paths.append(str(path))
+
+    def produce(put):
+        for index, path in enumerate(paths):
+            put(index, path if index % 7 else None, os.path.getsize(path))
+
+    # The items come in order, and the bytes read ahead are capped
+    prefetcher = Prefetcher(produce, lambda index: index % 3, threads=4, max_bytes=60, max_files=8)
+    items = list()
+    for index, data in prefetcher:
+        assert prefetcher.in_flight < 60 + 40
+        items.append((index, data))
+        assert data == (None if not index % 7 or not index % 3 else b'x' * 10 * (index % 5))
+    assert [index for index, _ in items] == list(range(50))
+
+    # The producer stops when the consumer stops, and its errors are raised to the consumer
+    for index, _ in Prefetcher(produce, threads=2, max_files=2):
+        if index == 3:
+            break
+
+    def fail(put):
+        put(0)
+        raise ValueError('walk')
+    with pytest.raises(ValueError):
+        list(Prefetcher(fail, threads=2))
+
+
+def test_pipelined(monkeypatch):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    dir_tree = DirTree()
+    expected = dump_data(count(root, dir_tree=dir_tree))
+
+    monkeypatch.setattr(config, 'PREFETCH_THREADS', 4)
+    monkeypatch.setattr(config, 'PREFETCH_BYTES', 1 << 12)
+    pipelined_tree = DirTree()
+    assert dump_data(count(root, dir_tree=pipelined_tree)) == expected
+    assert [path for path, _ in pipelined_tree.iter_dirs()] == [path for path, _ in dir_tree.iter_dirs()]
@@ -0,0 +1,30 @@
+import logging
+
+import config
+from code_count import count_text
+from progress import Progress
+
+
+def test_progress(caplog):
+    caplog.set_level(logging.INFO)
+    progress = Progress(interval=0)
+    progress.update('a.py', 10)
+    progress.update('b.py', 5)
+    assert (progress.files, progress.lines) == (2, 15)
+    assert 'last: b.py' in caplog.text
+
+    # Throttled by the interval
+    caplog.clear()
+    progress = Progress(interval=3600)
+    progress.update('a.py', 10)
+    assert not caplog.text
+    progress.finish()
+    assert '1 files, 10 lines' in caplog.text
+
+
+def test_trace(caplog, monkeypatch):
+    text = 'a = 1  # one\n\n# two\n'
+    monkeypatch.setattr(config, 'LOG_MODE', config.LOG_MODE_TRACE)
+    caplog.set_level(logging.DEBUG)
+    assert count_text(text, config.PYTHON_LEXER_LIST) == count_text(text, config.PYTHON_LEXER_LIST, config.ENGINE_SLICE)
+    assert '[Comment]: # two' in caplog.text
@@ -0,0 +1,28 @@
+import re
+
+import config
+from dynamic_object import DynamicObject
+from rule_guard import KIND_NESTED, KIND_SLOW, KIND_UNBOUNDED, check_rule, check_table, time_rules
+
+
+def test_check_rule():
+    for lexer_list in (config.PYTHON_LEXER_LIST, config.C_LIKE_LEXER_LIST, config.LUA_LEXER_LIST,
+                       config.TEXT_LEXER_LIST):
+        assert check_table(lexer_list) == []
+
+    assert [kind for kind, _ in check_rule(r'(a+)+b')] == [KIND_NESTED]
+    assert [kind for kind, _ in check_rule(r'\s*\[\[.*?\]\]', re.S)] == [KIND_UNBOUNDED]
+    assert check_rule(r'\s*\[\[.*?(?:\]\]|(?=\n?\Z))', re.S) == []
+
+
+def test_time_rules(monkeypatch):
+    monkeypatch.setattr(config, 'GUARD_MIN_SECONDS', 0.001)
+    assert time_rules(config.LUA_LEXER_LIST, 2000) == []
+
+    # A long string missing its terminator scans the rest of the text
+    lexer_list = [
+        DynamicObject(tag=config.LEX_SPACE, rule=r'\s*\n', flags=re.S),
+        DynamicObject(tag=config.LEX_CODE, rule=r'\s*\[\[.*?\]\]', flags=re.S),
+        DynamicObject(tag=config.LEX_CODE, rule=r'[^\n]', flags=re.S),
+    ]
+    assert (1, KIND_SLOW) in [(index, kind) for index, kind, _ in time_rules(lexer_list, 2000)]
@@ -1,5 +1,8 @@
+import os
+import sys
+
 from dynamic_object import DynamicObject
-from walk import walk, WalkHandler
+from walk import iter_walk, walk, WalkHandler
 
 
 def test_context():
@@ -11,5 +14,51 @@ def test_context():
     walk('..', _Handler(), DynamicObject())
 
 
+def test_deep_tree(tmp_path):
+    class _Handler(WalkHandler):
+        def handle_dir_post(self, path, context):
+            context.dirs = context.dirs + 1 if context.dirs else 1
+
+    # Build a tree deeper than the recursion limit
+    depth = sys.getrecursionlimit() + 100
+    path = str(tmp_path)
+    for _ in range(depth):
+        path = os.path.join(path, 'd')
+        os.mkdir(path)
+    with open(os.path.join(path, 'a.txt'), 'w') as file_out:
+        file_out.write('a')
+
+    context = DynamicObject()
+    file_list = list(iter_walk(str(tmp_path), _Handler(), context))
+    assert context.dirs == depth + 1
+    assert len(file_list) == 1
+    assert file_list[0][0].endswith('/d/a.txt') and file_list[0][1].name == 'a.txt'
+
+    # Remove the tree iteratively up to tmp_path, which is too deep for shutil.rmtree
+    os.remove(os.path.join(path, 'a.txt'))
+    while path != str(tmp_path):
+        os.rmdir(path)
+        path = os.path.dirname(path)
+
+
+def test_short_circuit(tmp_path):
+    class _Handler(WalkHandler):
+        def handle_dir_pre(self, path, context):
+            context.short_circuit = os.path.basename(path) == 'ignored'
+
+        def check_short_circuit(self, path, context):
+            short_circuit = context.short_circuit
+            context.short_circuit = False
+            return short_circuit
+
+    for name in ('ignored', 'kept'):
+        os.mkdir(str(tmp_path / name))
+        with open(str(tmp_path / name / 'a.txt'), 'w') as file_out:
+            file_out.write('a')
+
+    file_list = [path for path, _ in iter_walk(str(tmp_path), _Handler(), DynamicObject())]
+    assert file_list == [str(tmp_path / 'kept' / 'a.txt').replace('\\', '/')]
+
+
 if __name__ == '__main__':
     test_context()
@@ -0,0 +1,116 @@
+import os
+import shutil
+import time
+
+import pytest
+
+import config
+from code_count import count
+from result import data_tag
+from watch import _load_libc, InotifyMonitor, LiveCount, PollingMonitor, WatchDaemon, query
+
+
+def _write(path, text):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(str(path), 'w') as file_out:
+        file_out.write(text)
+
+
+def _normalize(data):
+    # The error records are sorted by path, which count() lists in the walk order
+    return dict(((data_tag(key), sorted(value, key=lambda record: record['path']) if isinstance(value, list) else
+                  dict(((data_tag(k), v) for k, v in value.to_dict().items())))
+                 for key, value in data.to_dict().items()))
+
+
+def _tree(root):
+    _write(root / 'a.py', '# a\n\nx = 1\n')
+    _write(root / 'test' / 'b.py', 'y = [\n    1,\n]\n')
+    _write(root / 'out' / 'c.py', 'ignored = 3\n')
+
+
+def _change(root):
+    _write(root / 'a.py', '# a\n\nx = 1\ny = 2\n')
+    _write(root / 'src' / 'd.lua', '-- d\nz = 4\n')
+    os.remove(str(root / 'test' / 'b.py'))
+
+
+def test_live_count(tmp_path):
+    _tree(tmp_path)
+    live = LiveCount(str(tmp_path))
+    assert live.query() == {'All': {'Total': 0}}
+
+    live.rescan()
+    assert live.query() == _normalize(count(str(tmp_path)))
+    assert _normalize(live.data()) == live.query()
+
+    _change(tmp_path)
+    changed = live.refresh([str(tmp_path / 'a.py').replace('\\', '/'), str(tmp_path / 'src' / 'd.lua')],
+                           [str(tmp_path / 'test').replace('\\', '/')])
+    assert len(changed) == 3
+    assert live.query() == _normalize(count(str(tmp_path)))
+    assert 'Test' not in live.query()
+    assert not live.rescan()
+
+
+def test_live_errors(tmp_path, monkeypatch):
+    # The files failing to count are published under TAG_ERROR, until they count again or are deleted
+    monkeypatch.setattr(config, 'ENCODINGS', ['utf-8'])
+    _tree(tmp_path)
+    (tmp_path / 'latin.py').write_bytes('x = "\u00e9"\n'.encode('cp1252'))
+    (tmp_path / 'sub').mkdir()
+    (tmp_path / 'sub' / 'latin.py').write_bytes('y = "\u00e9"\n'.encode('cp1252'))
+    live = LiveCount(str(tmp_path))
+    live.rescan()
+    assert [record['kind'] for record in live.query()[config.TAG_ERROR]] == [config.ERROR_DECODE] * 2
+    assert live.query() == _normalize(count(str(tmp_path)))
+    assert _normalize(live.data()) == live.query()
+
+    _write(tmp_path / 'latin.py', 'x = 1\n')
+    assert live.refresh([str(tmp_path / 'latin.py').replace('\\', '/')])
+    assert [record['path'].rsplit('/', 2)[-2] for record in live.query()[config.TAG_ERROR]] == ['sub']
+
+    shutil.rmtree(str(tmp_path / 'sub'))
+    assert live.refresh(dirs=[str(tmp_path / 'sub').replace('\\', '/')])
+    assert config.TAG_ERROR not in live.query()
+    assert live.query() == _normalize(count(str(tmp_path)))
+
+
+@pytest.mark.parametrize('monitor_type', ['polling', 'inotify'])
+def test_monitor(tmp_path, monitor_type):
+    _tree(tmp_path)
+    if monitor_type == 'inotify':
+        libc = _load_libc()
+        if not libc:
+            pytest.skip('inotify is not available')
+        monitor = InotifyMonitor(str(tmp_path), libc)
+    else:
+        monitor = PollingMonitor(str(tmp_path))
+
+    live = LiveCount(str(tmp_path))
+    live.rescan()
+    try:
+        time.sleep(0.01)
+        _change(tmp_path)
+        _write(tmp_path / 'out' / 'c.py', 'ignored = 4\n')
+        live.refresh(*monitor.changes(0.1))
+    finally:
+        monitor.close()
+    assert live.query() == _normalize(count(str(tmp_path)))
+
+
+def test_daemon(tmp_path):
+    root = tmp_path / 'root'
+    _tree(root)
+    address = str(tmp_path / 'watch.sock')
+    with WatchDaemon(str(root), address, interval=0.05) as daemon:
+        assert query(address) == _normalize(count(str(root)))
+
+        version = daemon.live.version
+        _change(root)
+        for _ in range(100):
+            if daemon.live.version > version and query(address) == _normalize(count(str(root))):
+                break
+            time.sleep(0.05)
+        assert query(address) == _normalize(count(str(root)))
+    assert not os.path.exists(address)
@@ -24,10 +24,18 @@ class WalkHandler(object):
         pass
 
 
-def walk(path, handler, context=None):
-    """Walk a path recursively to call your handler"""
+def join_path(dir_path, name):
+    path = os.path.join(dir_path, name)
+    return path if os.sep == '/' else path.replace('\\', '/')
+
+
+def iter_walk(path, handler=None, context=None):
+    """Walk a path iteratively to call your handler, and yield each file path with its os.DirEntry.
+    The entry is None if the path itself is a file.
+    """
 
-    # Check the context
+    # Check the handler and the context
+    handler = handler if handler else WalkHandler()
     context = context if context else handler.gen_default_context()
 
     # Ensure the path format
@@ -40,6 +48,7 @@ def walk(path, handler, context=None):
     # Handle the file
     if os.path.isfile(path):
         handler.handle_file(path, context)
+        yield path, None
 
         # Finish the file handle
         return
@@ -47,16 +56,40 @@ def walk(path, handler, context=None):
     # Do handle before traverse
     handler.handle_dir_pre(path, context)
 
-    # Walk path recursively
-    for sub_name in os.listdir(path):
+    # Walk path by a stack of directory iterators
+    stack = [(path, os.scandir(path))]
+    try:
+        while stack:
+            dir_path, entries = stack[-1]
+
+            # Check short circuit before each sub-directory or file
+            entry = next(entries, None)
+            if entry is None or handler.check_short_circuit(dir_path, context):
+                entries.close()
+                stack.pop()
+
+                # Do handle after traverse
+                handler.handle_dir_post(dir_path, context)
+                continue
+
+            sub_path = join_path(dir_path, entry.name)
+            if handler.check_short_circuit(sub_path, context):
+                continue
+
+            # Handle the file, or enter the sub-directory
+            if entry.is_file():
+                handler.handle_file(sub_path, context)
+                yield sub_path, entry
+            elif entry.is_dir():
+                handler.handle_dir_pre(sub_path, context)
+                stack.append((sub_path, os.scandir(sub_path)))
+    finally:
+        for _, entries in stack:
+            entries.close()
 
-        # Check short circuit
-        if handler.check_short_circuit(path, context):
-            break
 
-        # Walk each sub-directory or file
-        sub_path = os.path.join(path, sub_name)
-        walk(path=sub_path, handler=handler, context=context)
+def walk(path, handler, context=None):
+    """Walk a path to call your handler"""
 
-    # Do handle after traverse
-    handler.handle_dir_post(path, context)
+    for _ in iter_walk(path, handler, context):
+        pass
@@ -0,0 +1,376 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+"""Watch mode: keep the counts of a directory up to date in memory
+
+The tree is counted once, and then each created, modified or deleted file is counted again by its delta,
+as reported by inotify on Linux, or by polling the sizes and mtimes of the files otherwise.
+The aggregated counts are published as a snapshot after each change, which is served in O(1)
+by LiveCount.query() in process, and by WatchDaemon over a local socket.
+"""
+
+import ctypes
+import ctypes.util
+import json
+import os
+import select
+import socket
+import socketserver
+import struct
+import threading
+import time
+
+import config
+from code_count import IgnoredFolderHandler, count_entry
+from dispatch import get_dispatch
+from dynamic_object import DynamicObject
+from log import get_logger
+from result import data_key, data_tags
+from walk import iter_walk, join_path
+
+logger = get_logger()
+
+# inotify flags, see <sys/inotify.h>
+IN_MODIFY = 0x2
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+_EVENT = struct.Struct('iIII')
+
+
+def _normalize(path):
+    return path.replace('\\', '/').rstrip('/')
+
+
+def _ignored(root, path):
+    """Check if a path is in an ignored folder under the root"""
+
+    relative_path = path[len(root) + 1:] if path.startswith(root + '/') else path
+    return any((name in config.IGNORED_FOLDERS for name in relative_path.split('/')[:-1]))
+
+
+def list_files(root):
+    """List the files under a root, skipping the ignored folders, as {path: os.DirEntry}"""
+
+    context = DynamicObject(short_circuit=False)
+    return dict(iter_walk(root, IgnoredFolderHandler(), context))
+
+
+class LiveCount(object):
+    """Line counts of each file under a root, and the aggregated counts updated by the deltas of files,
+    the error records of the files which failed to count are published under TAG_ERROR as count() does
+    """
+
+    def __init__(self, root):
+        self.root = _normalize(root)
+        self.entries = dict()
+        self.errors = dict()
+        self.version = 0
+        self.snapshot = None
+        self._data = None
+
+        # {data tag: {lex tag: [line count, file count]}}, a lex tag is dropped when no file counts it
+        self._totals = {config.TAG_ALL: dict()}
+        self._publish()
+
+    def _add(self, path, file_tag, line_counts, sign):
+        for tag in data_tags(path, file_tag):
+            counts = self._totals.setdefault(tag, dict())
+            for lex_tag, line_count in line_counts:
+                value = counts.setdefault(lex_tag, [0, 0])
+                value[0] += sign * line_count
+                value[1] += sign
+                if not value[1]:
+                    del counts[lex_tag]
+            if not counts and tag != config.TAG_ALL:
+                del self._totals[tag]
+
+    def update(self, path):
+        """Count a file again, or remove it if it is deleted, return whether the counts changed"""
+
+        old_entry = self.entries.pop(path, None)
+        if old_entry:
+            self._add(path, *old_entry, -1)
+        old_error = self.errors.pop(path, None)
+
+        if os.path.isfile(path) and not _ignored(self.root, path) and get_dispatch().handler(path):
+            entry = count_entry(path)
+            if entry.file_tag:
+                self.entries[path] = (entry.file_tag, entry.line_counts)
+                self._add(path, entry.file_tag, entry.line_counts, 1)
+            elif entry.error:
+                self.errors[path] = entry.error
+
+        return old_entry != self.entries.get(path) or old_error != self.errors.get(path)
+
+    def refresh(self, paths=(), dirs=()):
+        """Update the changed files, and the files under the changed directories"""
+
+        paths = set(paths)
+        for dir_path in dirs:
+            prefix = dir_path + '/'
+            paths.update((path for path in set(self.entries) | set(self.errors) if path.startswith(prefix)))
+
+        changed = [path for path in sorted(paths) if self.update(path)]
+        if changed:
+            self._publish()
+        return changed
+
+    def rescan(self):
+        """Walk the root again, and update all the files"""
+        return self.refresh(set(list_files(self.root)) | set(self.entries) | set(self.errors))
+
+    def _publish(self):
+        snapshot = dict()
+        for tag, counts in self._totals.items():
+            snapshot[tag] = dict(((lex_tag, value[0]) for lex_tag, value in counts.items()))
+        snapshot[config.TAG_ALL].setdefault(config.LEX_TOTAL, 0)
+
+        data = DynamicObject()
+        for tag, counts in snapshot.items():
+            data[data_key(tag)] = DynamicObject(**dict(((data_key(lex_tag), value)
+                                                        for lex_tag, value in counts.items())))
+        if self.errors:
+            snapshot[config.TAG_ERROR] = [self.errors[path] for path in sorted(self.errors)]
+            data[data_key(config.TAG_ERROR)] = list(snapshot[config.TAG_ERROR])
+
+        # Swap the references, which is atomic for the readers in other threads
+        self.version += 1
+        self.snapshot, self._data = snapshot, data
+
+    def query(self):
+        """Get the current counts as {data tag: {lex tag: line count}}, which should not be modified"""
+        return self.snapshot
+
+    def data(self):
+        """Get the current counts as the data returned by count(), which should not be modified"""
+        return self._data
+
+
+class PollingMonitor(object):
+    """Find the changed files by comparing the sizes and mtimes of all files with the last check"""
+
+    def __init__(self, root):
+        self.root = _normalize(root)
+        self.stamps = self._stamps()
+
+    def _stamps(self):
+        stamps = dict()
+        for path, entry in list_files(self.root).items():
+            try:
+                stat = entry.stat() if entry else os.stat(path)
+            except OSError:
+                continue
+            stamps[path] = (stat.st_size, stat.st_mtime_ns)
+        return stamps
+
+    def changes(self, timeout):
+        """Wait for the changes, return the changed files and directories, or None to rescan all"""
+
+        time.sleep(timeout)
+        stamps = self._stamps()
+        paths = set(stamps.items()) ^ set(self.stamps.items())
+        self.stamps = stamps
+        return set((path for path, _ in paths)), set()
+
+    def close(self):
+        pass
+
+
+def _load_libc():
+    """Load the libc with inotify, or None if it is not available"""
+
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        libc.inotify_init1, libc.inotify_add_watch
+    except (OSError, AttributeError, TypeError):
+        return None
+    return libc
+
+
+class _WatchHandler(IgnoredFolderHandler):
+    def handle_dir_pre(self, dir_path, context):
+        IgnoredFolderHandler.handle_dir_pre(self, dir_path, context)
+        if not context.short_circuit:
+            context.monitor.add_watch(dir_path)
+
+
+class InotifyMonitor(object):
+    """Find the changed files by the inotify events of each directory"""
+
+    def __init__(self, root, libc):
+        self.root = _normalize(root)
+        self.libc = libc
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1')
+        self.watches = dict()
+        self._add_tree(self.root)
+
+    def add_watch(self, dir_path):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(dir_path), _WATCH_MASK)
+        if wd >= 0:
+            self.watches[wd] = dir_path
+
+    def _add_tree(self, path):
+        """Watch a directory and its sub-directories, return the files in them"""
+
+        context = DynamicObject(short_circuit=False, monitor=self)
+        return set((file_path for file_path, _ in iter_walk(path, _WatchHandler(), context)))
+
+    def changes(self, timeout):
+        """Wait for the changes, return the changed files and directories, or None to rescan all"""
+
+        paths, dirs = set(), set()
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        while ready:
+            try:
+                buffer = os.read(self.fd, 1 << 16)
+            except BlockingIOError:
+                break
+
+            offset = 0
+            while offset < len(buffer):
+                wd, mask, _, length = _EVENT.unpack_from(buffer, offset)
+                name = buffer[offset + _EVENT.size:offset + _EVENT.size + length].rstrip(b'\0')
+                offset += _EVENT.size + length
+
+                if mask & IN_Q_OVERFLOW:
+                    return None
+                dir_path = self.watches.get(wd)
+                if mask & IN_IGNORED:
+                    self.watches.pop(wd, None)
+                if dir_path is None or not name:
+                    continue
+
+                path = join_path(dir_path, os.fsdecode(name))
+                if not mask & IN_ISDIR:
+                    paths.add(path)
+                elif mask & (IN_CREATE | IN_MOVED_TO):
+                    if os.path.basename(path) not in config.IGNORED_FOLDERS:
+                        paths.update(self._add_tree(path))
+                elif mask & (IN_DELETE | IN_MOVED_FROM):
+                    dirs.add(path)
+
+        return paths, dirs
+
+    def close(self):
+        os.close(self.fd)
+
+
+def get_monitor(root):
+    """Get an inotify monitor if available, or a polling monitor"""
+
+    libc = _load_libc()
+    if libc:
+        try:
+            return InotifyMonitor(root, libc)
+        except OSError as e:
+            logger.warning('Failed to use inotify, fall back to polling: %s', e)
+    return PollingMonitor(root)
+
+
+class _QueryHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        self.request.sendall(json.dumps(self.server.live.query()).encode('utf-8'))
+
+
+def _create_server(address):
+    """Create a server on a local socket, which is a Unix socket path, or a (host, port) of TCP"""
+
+    if isinstance(address, str):
+        if os.path.exists(address):
+            os.remove(address)
+        server = socketserver.ThreadingUnixStreamServer(address, _QueryHandler)
+    else:
+        server = socketserver.ThreadingTCPServer(address, _QueryHandler)
+    server.daemon_threads = True
+    return server
+
+
+def query(address=None):
+    """Query the counts of a watch daemon by its local socket"""
+
+    address = address if address else config.WATCH_SOCKET
+    family = socket.AF_UNIX if isinstance(address, str) else socket.AF_INET
+    with socket.socket(family, socket.SOCK_STREAM) as client:
+        client.connect(address)
+        chunks = list()
+        for chunk in iter(lambda: client.recv(1 << 16), b''):
+            chunks.append(chunk)
+    return json.loads(b''.join(chunks).decode('utf-8'))
+
+
+class WatchDaemon(object):
+    """Count a root, keep the counts updated, and serve them on a local socket
+
+    The address is a Unix socket path, config.WATCH_SOCKET by default,
+    or a (host, port) of TCP where Unix sockets are not available.
+    """
+
+    def __init__(self, root, address=None, interval=None, monitor=None):
+        self.live = LiveCount(root)
+        self.address = address if address else config.WATCH_SOCKET
+        self.interval = config.WATCH_INTERVAL if interval is None else interval
+        self.monitor = monitor
+        self.server = None
+        self._stopped = threading.Event()
+        self._threads = list()
+
+    def start(self):
+        """Count the root, and start the server and the watch in threads"""
+
+        if isinstance(self.address, str) and not os.path.isdir(os.path.dirname(os.path.abspath(self.address))):
+            os.makedirs(os.path.dirname(os.path.abspath(self.address)))
+
+        # Monitor before counting, not to miss the changes in between
+        self.monitor = self.monitor if self.monitor else get_monitor(self.live.root)
+        self.live.rescan()
+
+        self.server = _create_server(self.address)
+        self.server.live = self.live
+        self._threads = [threading.Thread(target=self.server.serve_forever, daemon=True),
+                         threading.Thread(target=self._watch, daemon=True)]
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def _watch(self):
+        while not self._stopped.is_set():
+            changes = self.monitor.changes(self.interval)
+            changed = self.live.rescan() if changes is None else self.live.refresh(*changes)
+            if changed and config.LOG_MODE != config.LOG_MODE_PROGRESS:
+                logger.info('%d files changed', len(changed))
+
+    def stop(self):
+        self._stopped.set()
+        self.server.shutdown()
+        self.server.server_close()
+        for thread in self._threads:
+            thread.join()
+        self.monitor.close()
+        if isinstance(self.address, str) and os.path.exists(self.address):
+            os.remove(self.address)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *_):
+        self.stop()
+
+    def run_forever(self):
+        self.start()
+        try:
+            self._stopped.wait()
+        finally:
+            self.stop()